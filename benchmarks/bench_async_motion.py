@@ -0,0 +1,82 @@
+"""
+  Benchmark of the Snatch3r's *_async motions, run on the simulated robot (libs/robot_simulator.py).
+
+  First a 12 inch drive is started with drive_inches_async and the program keeps reading the color sensor (as a
+  line follower would) until the handle says the drive is done, which drive_inches would not allow.  Then
+  MOTIONS drives and turns of random lengths are run one after another to measure how late the shared monitor
+  notices that a motion has finished (its check interval is the main cost), and last a drive is cancelled part
+  way and another is replaced by a turn.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_async_motion.py
+  (robot_controller imports ev3dev, pip install python-ev3dev, but no EV3 is used)
+"""
+
+import math
+import random
+import threading
+import time
+
+import robot_controller as robo
+import robot_simulator
+
+MOTIONS = 20
+SPEED = 600
+
+
+def steer_while_driving(robot):
+    handle = robot.drive_inches_async(12, SPEED)
+    reads = 0
+    while not handle.poll():
+        robot.color_sensor.reflected_light_intensity
+        reads += 1
+        time.sleep(0.005)
+    return handle, reads
+
+
+def detection_lateness(robot):
+    lateness = []
+    for index in range(MOTIONS):
+        if index % 2 == 0:
+            inches = random.uniform(1, 4)
+            handle = robot.drive_inches_async(inches, SPEED)
+            degrees = inches * 90
+        else:
+            degrees = random.uniform(90, 360)
+            handle = robot.turn_degrees_async(degrees, SPEED)
+        handle.wait()
+        lateness.append(handle.elapsed - degrees / SPEED)
+    return lateness
+
+
+def main():
+    devices = robot_simulator.SimulatedDevices()
+    robot = robo.Snatch3r(devices)
+    print()
+    handle, reads = steer_while_driving(robot)
+    print("12 inch drive at {} deg/s: done in {:.3f} s ({:.3f} s expected), {} color sensor reads meanwhile".format(
+        SPEED, handle.elapsed, 12 * 90 / SPEED, reads))
+
+    checks = robot.motion_monitor.checks
+    lateness = sorted(detection_lateness(robot))
+    print("{} drives and turns: the monitor noticed the end {:.1f} ms late on average, {:.1f} ms at most".format(
+        MOTIONS, sum(lateness) / len(lateness) * 1000, lateness[-1] * 1000))
+    print("  ({} monitor checks, one thread: {} threads running in all)".format(
+        robot.motion_monitor.checks - checks, threading.active_count()))
+
+    start = devices.pose()
+    handle = robot.drive_inches_async(24, SPEED)
+    time.sleep(0.5)
+    handle.cancel()
+    print()
+    print("24 inch drive cancelled after 0.5 s: {}, {:.2f} inches driven ({:.2f} expected)".format(
+        handle.outcome, math.hypot(devices.pose()[0] - start[0], devices.pose()[1] - start[1]), 0.5 * SPEED / robot_simulator.DEGREES_PER_INCH))
+
+    first = robot.drive_inches_async(24, SPEED)
+    time.sleep(0.2)
+    second = robot.turn_degrees_async(450, SPEED)
+    second.wait()
+    print("Drive replaced by a turn: the drive finished as {}, the turn as {}".format(first.outcome, second.outcome))
+
+
+if __name__ == "__main__":
+    main()
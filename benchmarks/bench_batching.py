@@ -0,0 +1,74 @@
+"""
+  Benchmark for MqttClient batching.
+
+  A PC side MqttClient sends a burst of drive messages (like a held down key in m5_pc_remote_drive.py) to an
+  EV3 side MqttClient over the loopback broker.  The benchmark reports how many method calls per second reach
+  the EV3 delegate and how many MQTT publishes were needed, first without batching then with a few batch
+  settings.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_batching.py
+"""
+
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+MESSAGE_COUNT = 20000
+
+
+class CountingDelegate(object):
+    """Stands in for the Snatch3r, it only counts the calls."""
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.count = 0
+        self.done = threading.Event()
+
+    def drive(self, left_speed, right_speed):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+def run(batch_window=None, batch_size=None):
+    broker = LoopbackBroker()
+    delegate = CountingDelegate(MESSAGE_COUNT)
+    ev3_client = com.MqttClient(delegate)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(batching=com.BatchOptions(batch_window, batch_size))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)  # Let both connect callbacks finish.
+
+    start = time.perf_counter()
+    for k in range(MESSAGE_COUNT):
+        pc_client.send_message("drive", [k % 900, -(k % 900)])
+    pc_client.flush()
+    delegate.done.wait(60)
+    elapsed = time.perf_counter() - start
+
+    pc_client.close()
+    ev3_client.close()
+    return delegate.count / elapsed, broker.publish_count, broker.byte_count
+
+
+def main():
+    print()
+    print("{} drive calls from the PC to the EV3 over the loopback broker".format(MESSAGE_COUNT))
+    print("{:<28}{:>14}{:>12}{:>12}".format("Setting", "calls/sec", "publishes", "bytes"))
+    settings = [("no batching", None, None),
+                ("size=10", None, 10),
+                ("size=50", None, 50),
+                ("window=20ms, size=100", 0.02, 100)]
+    for name, batch_window, batch_size in settings:
+        rate, publishes, byte_count = run(batch_window, batch_size)
+        print("{:<28}{:>14.0f}{:>12}{:>12}".format(name, rate, publishes, byte_count))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,173 @@
+"""
+  Benchmarks of the MqttClient over real sockets, using the broker in libs/mqtt_broker.py on this computer.
+
+  Three measurements:
+    - Publish throughput: one PC client sends as fast as it can to one EV3 client, messages per second received.
+    - Round trip latency: percentiles of MqttClient.call to a method that does nothing.
+    - Fan out: a controller sends a command to every one of 1 to 100 simulated robots (topics lego01 .. legoNN,
+      each robot its own MqttClient) and waits until they all have it.  Reported per round and per robot.
+
+  The broker runs in this same process on a background thread, so the CPU numbers include the broker's work.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_broker.py
+"""
+
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import mqtt_broker
+import mqtt_remote_method_calls as com
+
+THROUGHPUT_MESSAGES = 20000
+ROUND_TRIPS = 2000
+FAN_OUT_ROBOTS = [1, 10, 25, 50, 100]
+FAN_OUT_ROUNDS = 50
+
+
+class CountingRobot(object):
+    """Counts the commands it gets and lets a waiting thread know when a target count is reached."""
+
+    def __init__(self):
+        self.count = 0
+        self.target = None
+        self.reached = threading.Event()
+
+    def drive(self, left_speed, right_speed):
+        self.count += 1
+        if self.count == self.target:
+            self.reached.set()
+
+    def ping(self):
+        pass
+
+    def expect(self, count):
+        self.reached.clear()
+        self.target = count
+        if self.count >= count:
+            self.reached.set()
+
+
+def connect_robot(port, lego_robot_number):
+    robot = CountingRobot()
+    ev3_client = com.MqttClient(robot)
+    ev3_client.connect_to_pc("localhost", lego_robot_number, port)
+    return robot, ev3_client
+
+
+def wait_until_online(clients):
+    while not all(client.online for client in clients):
+        time.sleep(0.01)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def bench_throughput(port):
+    robot, ev3_client = connect_robot(port, 1)
+    pc_client = com.MqttClient()
+    pc_client.connect_to_ev3("localhost", 1, port)
+    wait_until_online([ev3_client, pc_client])
+    time.sleep(0.1)
+
+    robot.expect(THROUGHPUT_MESSAGES)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(THROUGHPUT_MESSAGES):
+        pc_client.send_message("drive", [600, 600])
+    received_all = robot.reached.wait(30)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    pc_client.close()
+    ev3_client.close()
+    return robot.count / elapsed, cpu / max(robot.count, 1), received_all
+
+
+def bench_round_trip(port):
+    robot, ev3_client = connect_robot(port, 2)
+    pc_client = com.MqttClient()
+    pc_client.connect_to_ev3("localhost", 2, port)
+    wait_until_online([ev3_client, pc_client])
+    time.sleep(0.1)
+
+    latencies = []
+    for _ in range(ROUND_TRIPS):
+        start = time.perf_counter()
+        pc_client.call("ping", timeout=5).result()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    pc_client.close()
+    ev3_client.close()
+    return latencies
+
+
+def bench_fan_out(port, robot_count):
+    robots = []
+    ev3_clients = []
+    for number in range(1, robot_count + 1):
+        robot, ev3_client = connect_robot(port, number)
+        robots.append(robot)
+        ev3_clients.append(ev3_client)
+    wait_until_online(ev3_clients)
+
+    # The controller is a plain paho client, so the numbers show the cost on the robots' side and the broker's.
+    controller = mqtt.Client()
+    controller.connect("localhost", port, 60)
+    controller.loop_start()
+    frame = com.mqtt_codecs.JsonCodec().encode({"type": "drive", "payload": [600, 600]})
+    topics = ["lego{:02d}/msg4ev3".format(number) for number in range(1, robot_count + 1)]
+    time.sleep(0.2)
+
+    round_times = []
+    cpu_start = time.process_time()
+    for round_number in range(1, FAN_OUT_ROUNDS + 1):
+        for robot in robots:
+            robot.expect(round_number)
+        start = time.perf_counter()
+        for topic in topics:
+            controller.publish(topic, frame)
+        for robot in robots:
+            robot.reached.wait(10)
+        round_times.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+
+    controller.loop_stop()
+    controller.disconnect()
+    for ev3_client in ev3_clients:
+        ev3_client.close()
+    round_times.sort()
+    return round_times, cpu / (FAN_OUT_ROUNDS * robot_count)
+
+
+def main():
+    broker = mqtt_broker.MqttBroker(port=0)
+    broker.start()
+    print()
+    print("Broker listening on port {}".format(broker.port))
+
+    rate, cpu_per_message, received_all = bench_throughput(broker.port)
+    round_trip = bench_round_trip(broker.port)
+    fan_out = [(robot_count, bench_fan_out(broker.port, robot_count)) for robot_count in FAN_OUT_ROBOTS]
+
+    print()
+    print("Publish throughput: {:.0f} messages/sec, {:.0f} us of CPU per message{}".format(
+        rate, cpu_per_message * 1e6, "" if received_all else " (some messages were lost!)"))
+    print("Round trip of {} calls: p50 {:.0f} us, p90 {:.0f} us, p99 {:.0f} us, max {:.0f} us".format(
+        ROUND_TRIPS, percentile(round_trip, 0.5), percentile(round_trip, 0.9), percentile(round_trip, 0.99),
+        round_trip[-1]))
+    print()
+    print("Fan out, one command to every robot, {} rounds".format(FAN_OUT_ROUNDS))
+    print("{:>8}{:>14}{:>14}{:>18}{:>20}".format("robots", "p50 round", "p99 round", "per robot", "CPU per delivery"))
+    for robot_count, (round_times, cpu_per_delivery) in fan_out:
+        print("{:>8}{:>11.2f} ms{:>11.2f} ms{:>15.0f} us{:>17.0f} us".format(
+            robot_count, percentile(round_times, 0.5) * 1000, percentile(round_times, 0.99) * 1000,
+            percentile(round_times, 0.5) / robot_count * 1e6, cpu_per_delivery * 1e6))
+    print()
+    print("Broker totals: {} messages in, {} messages out".format(broker.messages_in, broker.messages_out))
+    broker.stop()
+
+
+if __name__ == "__main__":
+    main()
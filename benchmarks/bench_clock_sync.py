@@ -0,0 +1,93 @@
+"""
+  Benchmark of clock synchronization and execute_at.
+
+  The EV3 client is given a clock that runs SKEW seconds ahead of the PC's (two clients on one computer share a
+  clock, so the skew is pretend), and the loopback broker delays every delivery by 2 - 30 ms like a busy wifi
+  network.  The PC measures the offset with sync_clock and the error against the real skew
+  and the jitter are printed.  Then the PC sends COMMAND_COUNT commands, one at a time, first to run on arrival
+  and then with execute_at set LEAD seconds ahead, and the EV3 notes (on its clock) when each one ran.  How far
+  each ran from the moment it was meant for shows how closely robots could move together.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_clock_sync.py
+"""
+
+import random
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+import mqtt_stats
+from loopback_broker import LoopbackBroker
+
+SKEW = 2.5
+COMMAND_COUNT = 50
+LEAD = 0.2
+NETWORK_DELAY = (0.002, 0.030)
+
+
+def skewed_clock():
+    return time.time() + SKEW
+
+
+class PretendRobot(object):
+    def __init__(self):
+        self.ran_at = []
+        self.ran = threading.Event()
+
+    def arm_up(self, index):
+        self.ran_at.append((index, skewed_clock()))
+        self.ran.set()
+
+
+def main():
+    broker = LoopbackBroker(delay=lambda: random.uniform(*NETWORK_DELAY))
+    robot = PretendRobot()
+    ev3_client = com.MqttClient(robot, clock=skewed_clock)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient()
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    pc_client.sync_clock(samples=16)
+    sync_time = time.perf_counter() - started
+    sync = pc_client.clock_stats()["sync"]
+    print()
+    print("Clock sync with the EV3 clock {} s ahead, {} samples in {:.1f} ms".format(
+        SKEW, sync["samples"], sync_time * 1000))
+    print("  offset {:.6f} s (error {:+.2f} ms), best round trip {:.1f} ms, jitter {:.1f} ms".format(
+        sync["offset"], (sync["offset"] - SKEW) * 1000, sync["delay"] * 1000, sync["jitter"] * 1000))
+
+    print()
+    print("{} commands, how far from the intended moment they ran (ms)".format(COMMAND_COUNT))
+    print("{:<24}{:>10}{:>10}{:>10}{:>10}".format("", "mean", "p50", "p99", "max"))
+    for label, lead in [("on arrival", None), ("execute_at +{:.0f} ms".format(LEAD * 1000), LEAD)]:
+        robot.ran_at = []
+        intended = {}
+        for index in range(COMMAND_COUNT):
+            robot.ran.clear()
+            now = time.time()
+            if lead is None:
+                intended[index] = now + SKEW
+                pc_client.send_message("arm_up", [index])
+            else:
+                intended[index] = now + lead + SKEW
+                pc_client.send_message("arm_up", [index], execute_at=now + lead)
+            robot.ran.wait(5)
+        histogram = mqtt_stats.Histogram()
+        for index, ran_at in robot.ran_at:
+            histogram.add(abs(ran_at - intended[index]))
+        summary = histogram.summary()
+        print("{:<24}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+            label, summary["mean"] * 1000, summary["p50"] * 1000, summary["p99"] * 1000, summary["max"] * 1000))
+    scheduled = ev3_client.clock_stats()["scheduled"]
+    print("EV3: {} scheduled, {} arrived too late".format(scheduled["scheduled"], scheduled["late"]))
+
+    pc_client.close()
+    ev3_client.close()
+
+
+if __name__ == "__main__":
+    main()
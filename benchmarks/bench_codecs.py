@@ -0,0 +1,59 @@
+"""
+  Benchmark for the message codecs in mqtt_codecs.py.
+
+  Encodes and decodes the real messages sent by the sandbox programs with each codec and reports the size on the
+  wire and the time per encode / decode.  No MQTT broker is needed (not even the loopback one).
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_codecs.py
+"""
+
+import timeit
+
+import mqtt_codecs
+
+# The messages below are copied from the sandbox programs (pixy, motors, mqtt units).
+SAMPLE_MESSAGES = [
+    ("on_rectangle_update", {"type": "on_rectangle_update", "payload": [143, 87, 32, 27]}),
+    ("drive_inches", {"type": "drive_inches", "payload": [24, 500]}),
+    ("turn_degrees", {"type": "turn_degrees", "payload": [90, 300]}),
+    ("set_led", {"type": "set_led", "payload": ["left", "green"]}),
+    ("arm_up", {"type": "arm_up"}),
+    ("on_circle_draw", {"type": "on_circle_draw", "payload": ["blue", 50, 50]}),
+    ("guess_response", {"type": "guess_response",
+                        "payload": ["Your guess of 6 was Too high. The correct answer for [1, 3, 6, 2, 4] is 2"]}),
+    ("batch of 20 drives", [{"type": "drive", "payload": [600, -600]}] * 20),
+]
+
+# The method names the EV3 / PC delegates would have sent in their hello messages.
+REMOTE_METHODS = ["arm_down", "arm_up", "drive", "drive_inches", "guess_response", "on_circle_draw",
+                  "on_rectangle_update", "set_led", "shutdown", "turn_degrees"]
+
+
+def main():
+    json_codec = mqtt_codecs.JsonCodec()
+    binary_codec = mqtt_codecs.BinaryCodec()
+    binary_codec.set_remote_methods(REMOTE_METHODS)
+    binary_codec.set_local_methods(REMOTE_METHODS)
+    repeat = 20000
+
+    print()
+    print("{:<22}{:>12}{:>10}{:>14}{:>14}{:>14}{:>14}".format(
+        "Message", "json bytes", "binary", "json enc us", "binary enc us", "json dec us", "binary dec us"))
+    for name, message in SAMPLE_MESSAGES:
+        row = [name]
+        json_frame = json_codec.encode(message)
+        binary_frame = binary_codec.encode(message)
+        assert json_codec.decode(json_frame) == binary_codec.decode(binary_frame) == message
+        row.append(len(json_frame))
+        row.append(len(binary_frame))
+        for codec in (json_codec, binary_codec):
+            row.append(timeit.timeit(lambda: codec.encode(message), number=repeat) / repeat * 1e6)
+        for codec, frame in ((json_codec, json_frame), (binary_codec, binary_frame)):
+            row.append(timeit.timeit(lambda: codec.decode(frame), number=repeat) / repeat * 1e6)
+        print("{:<22}{:>12}{:>10}{:>14.2f}{:>14.2f}{:>14.2f}{:>14.2f}".format(*row))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
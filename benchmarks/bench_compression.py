@@ -0,0 +1,128 @@
+"""
+  Benchmark of compressing big messages (the CompressionOptions of the MqttClient).
+
+  For a few big messages (a list of waypoints, a recorded telemetry buffer and an EV3 LCD image) and one small
+  one, it reports the wire size with each codec and zlib level, the time to compress and decompress, and an
+  estimate of the total time to get the message across a slow wifi link (compress + send + decompress).  These
+  times are for this computer, the EV3's processor is many times slower, so level 1 is the usual choice there.
+
+  Then it sends the messages from a PC client to an EV3 client over the loopback broker with compression on and
+  prints the compression_stats of both ends.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_compression.py
+"""
+
+import math
+import random
+import time
+
+import mqtt_codecs
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+WIFI_BYTES_PER_SECOND = 1000000 / 8  # A slow 1 Mbit/s link, like a busy classroom with the EV3 wifi dongle.
+REPEATS = 200
+LEVELS = [None, 1, 6, 9]
+
+
+def sample_messages():
+    random.seed(120)
+    waypoints = [[round(24 * math.cos(angle / 20), 2), round(24 * math.sin(angle / 20), 2)] for angle in range(200)]
+    telemetry = [[index * 20, index * 9 + random.randint(-2, 2), index * 9 + random.randint(-2, 2),
+                  random.choice([1, 1, 1, 6]), random.randint(40, 45)] for index in range(500)]
+    # The EV3 LCD is 178 x 128 pixels at one bit each, mostly blank with a filled circle in the middle.
+    lcd = []
+    for row in range(128):
+        for column_byte in range(23):
+            byte = 0
+            for bit in range(8):
+                x = column_byte * 8 + bit
+                if (x - 89) ** 2 + (row - 64) ** 2 < 40 ** 2:
+                    byte |= 1 << bit
+            lcd.append(byte)
+    return [("waypoints", {"type": "follow_path", "payload": [waypoints]}),
+            ("telemetry", {"type": "on_telemetry_buffer", "payload": [telemetry]}),
+            ("lcd image", {"type": "show_image", "payload": [lcd]}),
+            ("drive", {"type": "drive", "payload": [600, 600]})]
+
+
+def time_per_call(function, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function(*args)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def bench_sizes():
+    codecs = mqtt_codecs.create_codecs()
+    print()
+    print("{:<12}{:<8}{:<7}{:>9}{:>8}{:>13}{:>15}{:>17}".format(
+        "Message", "Codec", "Level", "bytes", "ratio", "compress", "decompress", "total on wifi"))
+    for name, message in sample_messages():
+        for codec_name in ("json", "binary"):
+            frame = codecs[codec_name].encode(message)
+            for level in LEVELS:
+                if level is None:
+                    wire, compress_time, decompress_time = frame, 0.0, 0.0
+                else:
+                    wire = mqtt_codecs.compress_frame(frame, level)
+                    compress_time = time_per_call(mqtt_codecs.compress_frame, frame, level)
+                    decompress_time = time_per_call(mqtt_codecs.decompress_frame, wire)
+                total = compress_time + len(wire) / WIFI_BYTES_PER_SECOND + decompress_time
+                print("{:<12}{:<8}{:<7}{:>9}{:>8.1f}{:>10.0f} us{:>12.0f} us{:>14.1f} ms".format(
+                    name, codec_name, "none" if level is None else level, len(wire), len(frame) / len(wire),
+                    compress_time * 1e6, decompress_time * 1e6, total * 1000))
+            name = ""
+
+
+class Receiver(object):
+    def __init__(self):
+        self.received = 0
+
+    def follow_path(self, waypoints):
+        self.received += 1
+
+    def on_telemetry_buffer(self, samples):
+        self.received += 1
+
+    def show_image(self, pixels):
+        self.received += 1
+
+    def drive(self, left_speed, right_speed):
+        self.received += 1
+
+
+def bench_end_to_end():
+    broker = LoopbackBroker()
+    receiver = Receiver()
+    ev3_client = com.MqttClient(receiver)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(compression=com.CompressionOptions(threshold=512))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+    for _ in range(20):
+        for _, message in sample_messages():
+            pc_client.send_message(message["type"], message["payload"])
+    time.sleep(0.5)
+    print()
+    print("Through the loopback broker with a compression threshold of 512: {} messages received, {} bytes sent".format(
+        receiver.received, broker.byte_count))
+    for end, stats in (("PC", pc_client.compression_stats()), ("EV3", ev3_client.compression_stats())):
+        for message_type in sorted(stats):
+            for direction, summary in sorted(stats[message_type].items()):
+                print("  {:<4}{:<22}{:<14}{:>4} x {:>6} -> {:>5} bytes (ratio {:.1f}), {:.0f} us each".format(
+                    end, message_type, direction, summary["count"], summary["raw_bytes"] // summary["count"],
+                    summary["wire_bytes"] // summary["count"], summary["ratio"], summary["mean_time"] * 1e6))
+    pc_client.close()
+    ev3_client.close()
+
+
+def main():
+    bench_sizes()
+    bench_end_to_end()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+  Benchmark of the Snatch3r's DeviceRegistry: how many sysfs files are opened (and folders listed) per command.
+
+  Runs against a pretend sysfs tree (see fake_sysfs.py) with the real ev3dev library, counting the opens with an
+  audit hook.  Each command does the device work of a Snatch3r method without the waiting and beeping (which need
+  a real robot): drive is drive_inches (both drive motors, run_to_rel_pos, read the state) and arm is arm_up (arm
+  motor and touch sensor, run_forever, read the touch sensor, stop).  "new objects" makes the ev3dev objects on
+  every call, as the Snatch3r methods used to, "registry" uses the kept ones.  Last, a motor is unplugged and
+  plugged into another port to show rescan_devices finding it again.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_device_registry.py
+  (needs python-ev3dev installed on the PC, pip install python-ev3dev)
+"""
+
+import sys
+import time
+
+import ev3dev.ev3 as ev3
+import robot_controller as robo
+from fake_sysfs import FakeSysfs, MOTOR_ATTRIBUTES
+
+CALLS = 1000
+
+counts = {"open": 0, "os.listdir": 0}
+counting = [False]
+
+
+def count_sysfs_access(event, args):
+    if counting[0] and event in counts:
+        counts[event] += 1
+
+
+def drive_new_objects(robot):
+    left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
+    right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
+    assert left_motor.connected
+    assert right_motor.connected
+    left_motor.run_to_rel_pos(position_sp=24 * 90, speed_sp=600)
+    right_motor.run_to_rel_pos(position_sp=24 * 90, speed_sp=600)
+    return left_motor.state, right_motor.state
+
+
+def drive_registry(robot):
+    left_motor = robot.left_motor
+    right_motor = robot.right_motor
+    assert left_motor.connected
+    assert right_motor.connected
+    left_motor.run_to_rel_pos(position_sp=24 * 90, speed_sp=600)
+    right_motor.run_to_rel_pos(position_sp=24 * 90, speed_sp=600)
+    return left_motor.state, right_motor.state
+
+
+def arm_new_objects(robot):
+    arm_motor = ev3.MediumMotor(ev3.OUTPUT_A)
+    assert arm_motor.connected
+    touch_sensor = ev3.TouchSensor()
+    arm_motor.run_forever(speed_sp=900)
+    pressed = touch_sensor.is_pressed
+    arm_motor.stop()
+    return pressed
+
+
+def arm_registry(robot):
+    arm_motor = robot.arm_motor
+    assert arm_motor.connected
+    touch_sensor = robot.touch_sensor
+    arm_motor.run_forever(speed_sp=900)
+    pressed = touch_sensor.is_pressed
+    arm_motor.stop()
+    return pressed
+
+
+def measure(command, robot):
+    command(robot)  # The registry finds the devices on the first call, count the calls after that.
+    for event in counts:
+        counts[event] = 0
+    counting[0] = True
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        command(robot)
+    elapsed = time.perf_counter() - start
+    counting[0] = False
+    return counts["open"] / CALLS, counts["os.listdir"] / CALLS, elapsed / CALLS
+
+
+def main():
+    sys.addaudithook(count_sysfs_access)
+    with FakeSysfs() as sysfs:
+        robot = robo.Snatch3r()
+        print()
+        print("Per command, against a pretend sysfs tree ({} calls each)".format(CALLS))
+        print("{:<8}{:<14}{:>12}{:>16}{:>12}".format("", "", "files opened", "folders listed", "time (us)"))
+        for name, new_objects, registry in [("drive", drive_new_objects, drive_registry),
+                                            ("arm", arm_new_objects, arm_registry)]:
+            for label, command in [("new objects", new_objects), ("registry", registry)]:
+                opened, listed, seconds = measure(command, robot)
+                print("{:<8}{:<14}{:>12.1f}{:>16.1f}{:>12.1f}".format(name, label, opened, listed, seconds * 1e6))
+                name = ""
+        print("{} devices found by the registry in all".format(robot.devices.scans))
+
+        sysfs.remove_device("tacho-motor", "motor1")
+        sysfs.add_device("tacho-motor", "motor3", "outD", "lego-ev3-l-motor", MOTOR_ATTRIBUTES)
+        sysfs.add_device("tacho-motor", "motor4", "outB", "lego-ev3-l-motor", MOTOR_ATTRIBUTES)
+        print()
+        print("Left motor unplugged and plugged back in (now motor4)")
+        print("  before rescan_devices the kept handle is {}".format(robot.left_motor._path.rsplit("/", 1)[1]))
+        robot.rescan_devices(ev3.OUTPUT_B)
+        print("  after rescan_devices it is {}, connected: {}".format(robot.left_motor._path.rsplit("/", 1)[1],
+                                                                     robot.left_motor.connected))
+
+
+if __name__ == "__main__":
+    main()
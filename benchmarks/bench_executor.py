@@ -0,0 +1,87 @@
+"""
+  Benchmark for the MqttClient executors.
+
+  The PC sends 20 slow drive_inches calls (each takes 50 ms, standing in for the motors running) followed by a
+  shutdown.  The benchmark reports how long after it was sent the shutdown ran and how long the whole
+  batch of work took for each executor setting, then prints the executor metrics (queue depth and time in queue).
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_executor.py
+"""
+
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+DRIVE_COUNT = 20
+DRIVE_SECONDS = 0.05
+
+
+class SlowRobot(object):
+    """Stands in for the Snatch3r, drive_inches blocks like the real one does."""
+
+    def __init__(self):
+        self.drives_done = 0
+        self.all_drives_done = threading.Event()
+        self.shutdown_at = None
+
+    def drive_inches(self, inches_to_drive, drive_speed_sp):
+        time.sleep(DRIVE_SECONDS)
+        self.drives_done += 1
+        if self.drives_done == DRIVE_COUNT:
+            self.all_drives_done.set()
+
+    def shutdown(self):
+        self.shutdown_at = time.perf_counter()
+
+
+def run(name, **options):
+    broker = LoopbackBroker()
+    robot = SlowRobot()
+    ev3_client = com.MqttClient(robot, **options)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient()
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    for _ in range(DRIVE_COUNT):
+        pc_client.send_message("drive_inches", [24, 500])
+    shutdown_sent_at = time.perf_counter()
+    pc_client.send_message("shutdown")
+    robot.all_drives_done.wait(30)
+    total = time.perf_counter() - start
+    time.sleep(0.1)
+
+    shutdown_delay = robot.shutdown_at - shutdown_sent_at if robot.shutdown_at else float("nan")
+    print("{:<34}{:>18.1f}{:>14.1f}".format(name, shutdown_delay * 1000, total * 1000))
+    stats = ev3_client.executor_stats()
+    pc_client.close()
+    ev3_client.close()
+    return stats
+
+
+def main():
+    print()
+    print("{} drive_inches calls of {} ms each, then a shutdown".format(DRIVE_COUNT, int(DRIVE_SECONDS * 1000)))
+    print("{:<34}{:>18}{:>14}".format("Executor", "shutdown ran (ms)", "total (ms)"))
+    run("inline (original)")
+    run("serial", executor="serial")
+    run("serial, shutdown inline", executor="serial", method_lanes={"shutdown": "inline"})
+    stats = run("pool of 4, shutdown inline", executor="pool", workers=4, method_lanes={"shutdown": "inline"})
+
+    print()
+    print("Executor metrics for the last run")
+    for lane_name, lane_stats in sorted(stats.items()):
+        print("  {:<10} depth now {queue_depth}, max depth {max_queue_depth}, completed {completed}, "
+              "rejected {rejected}, mean wait {mean_wait:.3f} s, max wait {max_wait:.3f} s".format(
+                  lane_name, **lane_stats))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
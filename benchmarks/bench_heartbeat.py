@@ -0,0 +1,117 @@
+"""
+  Benchmark of heartbeats and the watchdog.
+
+  First the PC sends drive calls to the EV3 over the loopback broker without heartbeats and with heartbeats every
+  0.5 s and every 0.05 s, to show what they cost in calls per second.  Then the PC (sending heartbeats every
+  HEARTBEAT_INTERVAL seconds) is cut off from the broker while the EV3 is driving, like a laptop losing its wifi,
+  and the time until the EV3's watchdog calls stop is measured.  The round trip times of the heartbeats over a
+  network that delays each delivery by 2 - 30 ms are printed last.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_heartbeat.py
+"""
+
+import random
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+MESSAGE_COUNT = 20000
+HEARTBEAT_INTERVAL = 0.25
+WATCHDOG_TIMEOUT = 1.0
+CUT_OFF_RUNS = 5
+
+
+class PretendRobot(object):
+    def __init__(self, expected=None):
+        self.count = 0
+        self.expected = expected
+        self.done = threading.Event()
+        self.stopped = threading.Event()
+        self.stopped_at = None
+
+    def drive(self, left_speed, right_speed):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+    def stop(self):
+        self.stopped_at = time.perf_counter()
+        self.stopped.set()
+
+
+def connect(broker, robot, heartbeat_interval):
+    ev3_client = com.MqttClient(robot, heartbeat=com.HeartbeatOptions(watchdog_timeout=WATCHDOG_TIMEOUT,
+                                                                      watchdog_method="stop"))
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(heartbeat=com.HeartbeatOptions(interval=heartbeat_interval))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+    return ev3_client, pc_client
+
+
+def bench_throughput(heartbeat_interval):
+    robot = PretendRobot(MESSAGE_COUNT)
+    ev3_client, pc_client = connect(LoopbackBroker(), robot, heartbeat_interval)
+    start = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        pc_client.send_message("drive", [600, 600])
+    robot.done.wait(60)
+    elapsed = time.perf_counter() - start
+    pc_client.close()
+    ev3_client.close()
+    return MESSAGE_COUNT / elapsed
+
+
+def bench_cut_off():
+    broker = LoopbackBroker()
+    robot = PretendRobot()
+    ev3_client, pc_client = connect(broker, robot, HEARTBEAT_INTERVAL)
+    pc_client.send_message("drive", [600, 600])
+    time.sleep(random.uniform(0.5, 1.0))
+    cut_at = time.perf_counter()
+    broker.stop([pc_client.client])
+    robot.stopped.wait(WATCHDOG_TIMEOUT * 5)
+    pc_client.close()
+    ev3_client.close()
+    return robot.stopped_at - cut_at if robot.stopped_at else None
+
+
+def bench_round_trip():
+    broker = LoopbackBroker(delay=lambda: random.uniform(0.002, 0.030))
+    ev3_client, pc_client = connect(broker, PretendRobot(), 0.05)
+    time.sleep(3)
+    stats = pc_client.heartbeat_stats()
+    pc_client.close()
+    ev3_client.close()
+    return stats
+
+
+def main():
+    rates = [("no heartbeats", bench_throughput(None)), ("every 0.5 s", bench_throughput(0.5)),
+             ("every 0.05 s", bench_throughput(0.05))]
+    print()
+    print("{} drive calls from the PC to the EV3 over the loopback broker".format(MESSAGE_COUNT))
+    for label, rate in rates:
+        print("  {:<16}{:>8.0f} calls/sec ({:+.1f}%)".format(label, rate, (rate / rates[0][1] - 1) * 100))
+
+    delays = [bench_cut_off() for _ in range(CUT_OFF_RUNS)]
+    print()
+    print("PC cut off while driving (heartbeat every {} s, watchdog_timeout {} s), time until stop ran:".format(
+        HEARTBEAT_INTERVAL, WATCHDOG_TIMEOUT))
+    print("  " + ", ".join("never" if delay is None else "{:.0f} ms".format(delay * 1000) for delay in delays))
+
+    stats = bench_round_trip()
+    round_trip = stats["round_trip"]
+    print()
+    print("Heartbeat round trips over a network delaying each delivery 2 - 30 ms ({} sent, {} echoed):".format(
+        stats["sent"], stats["echoed"]))
+    print("  mean {:.1f} ms, p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+        round_trip["mean"] * 1000, round_trip["p50"] * 1000, round_trip["p99"] * 1000, round_trip["max"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
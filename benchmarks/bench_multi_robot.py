@@ -0,0 +1,190 @@
+"""
+  Benchmark of watching a lab of robots from one PC: 50 MqttClients (a connection and a thread each) compared
+  with one MultiRobotClient (one connection for every robot).
+
+  The broker (libs/mqtt_broker.py), the pretend robots and each PC program all run as separate processes, so
+  the numbers below are only the PC program's.  The pretend robots are a single paho client that sends
+  telemetry to lego01/msg4pc .. legoNN/msg4pc in turn.  For each PC program the benchmark reports the Python
+  memory it allocated for the robots (tracemalloc), the threads it runs, the CPU time it used while idle for a
+  few seconds, and the CPU time it needed to handle all the telemetry.  On Linux it also reports the growth of
+  the resident memory (which includes the thread stacks) and the open files (sockets) of the PC program.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_multi_robot.py
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+ROBOT_COUNT = 50
+MESSAGES_PER_ROBOT = 200
+IDLE_SECONDS = 3.0
+LIBS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "libs")
+
+
+class TelemetryCounter(object):
+    """The delegate for one robot, counts the telemetry messages."""
+
+    def __init__(self, total):
+        self.total = total
+
+    def on_telemetry(self, left_position, right_position, color):
+        self.total.add()
+
+
+class Total(object):
+    def __init__(self, expected):
+        self.count = 0
+        self.expected = expected
+        self.lock = threading.Lock()
+        self.first = threading.Event()
+        self.done = threading.Event()
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+            if self.count == 1:
+                self.first.set()
+            if self.count == self.expected:
+                self.done.set()
+
+
+def linux_process_counts():
+    """Returns (resident memory in KB, open file count), or (None, None) where /proc is not available."""
+    try:
+        with open("/proc/self/status") as status:
+            rss = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+        return rss, len(os.listdir("/proc/self/fd"))
+    except (OSError, StopIteration):
+        return None, None
+
+
+def run_pc(kind, port):
+    """The PC program, kind is "single" (one MqttClient per robot) or "multi" (one MultiRobotClient)."""
+    import mqtt_remote_method_calls as com
+
+    total = Total(ROBOT_COUNT * MESSAGES_PER_ROBOT)
+    rss_before, files_before = linux_process_counts()
+    tracemalloc.start()
+    threads_before = threading.active_count()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    if kind == "single":
+        clients = []
+        for number in range(1, ROBOT_COUNT + 1):
+            client = com.MqttClient(TelemetryCounter(total))
+            client.connect_to_ev3("localhost", number, port)
+            clients.append(client)
+    else:
+        client = com.MultiRobotClient(lambda robot: TelemetryCounter(total))
+        client.connect_to_ev3("localhost", list(range(1, ROBOT_COUNT + 1)), port)
+        clients = [client]
+    while not all(client.online for client in clients):
+        time.sleep(0.01)
+    time.sleep(0.5)  # Let the subscriptions finish.
+    memory = tracemalloc.get_traced_memory()[0] - memory_before
+    tracemalloc.stop()
+    threads = threading.active_count() - threads_before
+    rss, files = linux_process_counts()
+    if rss is not None:
+        rss -= rss_before
+        files -= files_before
+
+    cpu_start = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = time.process_time() - cpu_start
+
+    print("READY", flush=True)
+    total.first.wait()
+    cpu_start = time.process_time()
+    total.done.wait(120)
+    busy_cpu = time.process_time() - cpu_start
+    print(json.dumps({"memory": memory, "rss": rss, "files": files, "threads": threads, "idle_cpu": idle_cpu, "busy_cpu": busy_cpu,
+                      "received": total.count}), flush=True)
+    for client in clients:
+        client.close()
+
+
+def run_robots(port):
+    """The pretend robots: one plain paho client sending telemetry for every robot in turn."""
+    import paho.mqtt.client as mqtt
+    import mqtt_codecs
+
+    client = mqtt.Client()
+    client.connect("localhost", port, 60)
+    client.loop_start()
+    codec = mqtt_codecs.JsonCodec()
+    topics = ["lego{:02d}/msg4pc".format(number) for number in range(1, ROBOT_COUNT + 1)]
+    for index in range(MESSAGES_PER_ROBOT):
+        for topic in topics:
+            client.publish(topic, codec.encode({"type": "on_telemetry", "payload": [index, -index, 5]}))
+        time.sleep(0.001)
+    time.sleep(0.5)
+    client.loop_stop()
+    client.disconnect()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_variant(kind, port):
+    command = [sys.executable, __file__]
+    pc = subprocess.Popen(command + ["pc", kind, str(port)], stdout=subprocess.PIPE, universal_newlines=True)
+    for line in pc.stdout:
+        if line.startswith("READY"):
+            break
+    subprocess.check_call(command + ["robots", str(port)], stdout=subprocess.DEVNULL)
+    result = None
+    for line in pc.stdout:
+        if line.startswith("{"):
+            result = json.loads(line)
+    pc.wait()
+    return result
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "pc":
+        run_pc(sys.argv[2], int(sys.argv[3]))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "robots":
+        run_robots(int(sys.argv[2]))
+        return
+
+    port = free_port()
+    broker = subprocess.Popen([sys.executable, os.path.join(LIBS_FOLDER, "mqtt_broker.py"), str(port)],
+                              stdout=subprocess.DEVNULL)
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except ConnectionError:
+            time.sleep(0.05)
+    try:
+        results = [("{} MqttClients".format(ROBOT_COUNT), run_variant("single", port)),
+                   ("1 MultiRobotClient", run_variant("multi", port))]
+    finally:
+        broker.terminate()
+        broker.wait()
+
+    print()
+    print("{} robots sending {} telemetry messages each to one PC program".format(ROBOT_COUNT, MESSAGES_PER_ROBOT))
+    print("{:<22}{:>12}{:>12}{:>8}{:>10}{:>16}{:>16}{:>10}".format(
+        "PC program", "memory", "resident", "files", "threads", "idle CPU", "busy CPU", "received"))
+    for name, result in results:
+        resident = "-" if result["rss"] is None else "{} KB".format(result["rss"])
+        files = "-" if result["files"] is None else result["files"]
+        print("{:<22}{:>9.0f} KB{:>12}{:>8}{:>10}{:>11.1f} ms/s{:>10.1f} us/msg{:>10}".format(
+            name, result["memory"] / 1024, resident, files, result["threads"],
+            result["idle_cpu"] / IDLE_SECONDS * 1000, result["busy_cpu"] / max(result["received"], 1) * 1e6,
+            result["received"]))
+
+
+if __name__ == "__main__":
+    main()
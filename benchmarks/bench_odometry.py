@@ -0,0 +1,114 @@
+"""
+  Benchmark of the Snatch3r's Odometry: how close it stays to the simulated robot's true pose, and what it costs.
+
+  On the simulated robot (libs/robot_simulator.py), a random mix of drives, turns and arcs is driven with
+  odometry sampling at a few rates, and the odometry pose is compared with the simulator's true pose whenever the
+  robot stops, and now and then while it moves (when the odometry pose can be up to one sample old).  Last the
+  whole path is driven again as one run_path, and the end poses compared.  Then the
+  cost of one sample is timed with the real ev3dev library reading the pretend sysfs tree in fake_sysfs.py, and the
+  CPU the odometry thread uses at 50 samples a second.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_odometry.py
+  (needs the ev3dev library, pip install python-ev3dev, but no EV3)
+"""
+
+import math
+import random
+import threading
+import time
+
+import robot_controller as robo
+import robot_simulator
+from fake_sysfs import FakeSysfs
+
+MOTIONS = 12
+SPEED = 900
+RATES = (10, 50, 200)
+
+
+def random_path():
+    random.seed(25)
+    path = []
+    for _ in range(MOTIONS):
+        kind = random.choice(["straight", "turn", "arc"])
+        if kind == "straight":
+            path.append(robo.straight(random.uniform(-6, 12)))
+        elif kind == "turn":
+            path.append(robo.turn(random.uniform(-180, 180)))
+        else:
+            path.append(robo.arc(random.uniform(2, 12), random.uniform(-120, 120)))
+    return path
+
+
+def distance_off(odometry_pose, true_pose):
+    return math.hypot(odometry_pose.x - true_pose[0], odometry_pose.y - true_pose[1])
+
+
+def heading_off(odometry_pose, true_pose):
+    difference = odometry_pose.heading - true_pose[2]
+    return abs(math.degrees(math.atan2(math.sin(difference), math.cos(difference))))
+
+
+def follow(rate):
+    devices = robot_simulator.SimulatedDevices()
+    robot = robo.Snatch3r(devices)
+    odometry = robot.start_odometry(rate)
+    moving_off = []
+    stopped_off = []
+    stopped_heading_off = []
+    for segment in random_path():
+        queue = robot.run_path([segment], SPEED)
+        while not queue.wait(0.05):
+            moving_off.append(distance_off(odometry.pose(), devices.pose()))
+        time.sleep(2 / rate)  # Let odometry take a sample after the robot stopped.
+        stopped_off.append(distance_off(odometry.pose(), devices.pose()))
+        stopped_heading_off.append(heading_off(odometry.pose(), devices.pose()))
+
+    # The same path again without stopping, so samples fall across the changes from one segment to the next.
+    queue = robot.run_path(random_path(), SPEED)
+    queue.wait()
+    time.sleep(2 / rate)
+    path_off = distance_off(odometry.pose(), devices.pose())
+    odometry.stop()
+    return max(stopped_off), max(stopped_heading_off), max(moving_off), path_off, odometry
+
+
+def sample_cost():
+    with FakeSysfs():
+        robot = robo.Snatch3r()
+        odometry = robo.Odometry(robot)
+        odometry.sample()
+        count = 2000
+        started = time.perf_counter()
+        for _ in range(count):
+            odometry.sample()
+        per_sample = (time.perf_counter() - started) / count
+
+        odometry = robot.start_odometry(50)
+        cpu_started, started = time.process_time(), time.perf_counter()
+        time.sleep(2)
+        cpu = (time.process_time() - cpu_started) / (time.perf_counter() - started)
+        odometry.stop()
+    return per_sample, cpu
+
+
+def main():
+    print()
+    print("{} random drives, turns and arcs at {} deg/s on the simulated robot:".format(MOTIONS, SPEED))
+    print("{:>8} {:>17} {:>17} {:>16} {:>18} {:>6}".format(
+        "rate Hz", "stopped, off in", "stopped, off deg", "moving, off in", "no stops, off in", "late"))
+    for rate in RATES:
+        stopped, heading, moving, path_off, odometry = follow(rate)
+        print("{:>8} {:>17.3f} {:>17.3f} {:>16.3f} {:>18.3f} {:>6}".format(
+            rate, stopped, heading, moving, path_off, odometry.late))
+    print("(moving includes how far the robot went since the last sample: {:.2f} inches per 20 ms at {} deg/s)".format(
+        SPEED * 0.02 / robo.DEGREES_PER_INCH, SPEED))
+
+    per_sample, cpu = sample_cost()
+    print()
+    print("One sample reading the pretend sysfs: {:.1f} us, odometry at 50 Hz used {:.2f} % CPU ({} threads).".format(
+        per_sample * 1e6, cpu * 100, threading.active_count()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+  Benchmark of sequence numbers and the reorder buffer.
+
+  The PC sends MESSAGE_COUNT speed updates, alternating left and right motor, through a loopback broker that
+  swaps neighbouring messages, delivers some twice and loses a few, like a flaky link around reconnects.  The EV3
+  notes every update it applies.  Without ordering some updates run out of order or twice.  With
+  sequence_numbers on the PC and reorder_wait on the EV3 they all run in order and once (the lost ones are
+  skipped after reorder_wait), and the counts of the EV3's reorder buffer are printed.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_ordering.py
+"""
+
+import random
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+MESSAGE_COUNT = 5000
+SWAP_CHANCE = 0.05
+DUPLICATE_CHANCE = 0.02
+LOSS_CHANCE = 0.002
+REORDER_WAIT = 0.05
+
+
+class FlakyBroker(LoopbackBroker):
+    """Swaps neighbouring publishes, duplicates some and loses a few."""
+
+    def __init__(self):
+        super().__init__()
+        self.held_back = None
+        self.random = random.Random(120)
+
+    def publish(self, topic, payload):
+        roll = self.random.random()
+        if roll < LOSS_CHANCE:
+            return
+        if self.held_back is None and roll < LOSS_CHANCE + SWAP_CHANCE:
+            self.held_back = (topic, payload)  # Goes out after the next one.
+            return
+        super().publish(topic, payload)
+        if roll > 1 - DUPLICATE_CHANCE:
+            super().publish(topic, payload)
+        if self.held_back is not None:
+            held_back, self.held_back = self.held_back, None
+            super().publish(*held_back)
+
+
+class PretendRobot(object):
+    def __init__(self):
+        self.applied = []
+        self.done = threading.Event()
+
+    def set_left_speed(self, index, speed):
+        self._apply(index)
+
+    def set_right_speed(self, index, speed):
+        self._apply(index)
+
+    def last(self):
+        self.done.set()
+
+    def _apply(self, index):
+        self.applied.append(index)
+
+
+def run(sender_options, receiver_options):
+    broker = FlakyBroker()
+    robot = PretendRobot()
+    ev3_client = com.MqttClient(robot, ordering=com.OrderingOptions(**receiver_options))
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(ordering=com.OrderingOptions(**sender_options))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    for index in range(MESSAGE_COUNT):
+        pc_client.send_message("set_left_speed" if index % 2 == 0 else "set_right_speed", [index, 600])
+    for _ in range(3):
+        pc_client.send_message("last")  # More than one, in case the first is lost.
+    robot.done.wait(10)
+    elapsed = time.perf_counter() - start
+    time.sleep(REORDER_WAIT * 2)
+
+    applied = robot.applied
+    out_of_order = sum(1 for before, after in zip(applied, applied[1:]) if after < before)
+    twice = len(applied) - len(set(applied))
+    stats = ev3_client.ordering_stats()
+    pc_client.close()
+    ev3_client.close()
+    return len(applied), out_of_order, twice, elapsed, stats
+
+
+def main():
+    print()
+    print("{} speed updates through a link that swaps {:.0f}%, duplicates {:.0f}% and loses {:.1f}%".format(
+        MESSAGE_COUNT, SWAP_CHANCE * 100, DUPLICATE_CHANCE * 100, LOSS_CHANCE * 100))
+    print("{:<14}{:>10}{:>15}{:>8}{:>12}".format("", "applied", "out of order", "twice", "time (s)"))
+    stats = None
+    for label, sender_options, receiver_options in [
+            ("no ordering", {}, {}),
+            ("reorder", {"sequence_numbers": True}, {"reorder_wait": REORDER_WAIT})]:
+        applied, out_of_order, twice, elapsed, stats = run(sender_options, receiver_options)
+        print("{:<14}{:>10}{:>15}{:>8}{:>12.2f}".format(label, applied, out_of_order, twice, elapsed))
+    print()
+    for topic, counts in stats.items():
+        print("EV3 reorder buffer for {}: {}".format(topic, counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+  Benchmark of priorities and preempting: how long a shutdown takes to run when it is sent behind motion commands.
+
+  The PC sends MOTION_COUNT drive_inches calls (each pretends to drive for MOTION_SECONDS, and ends early if stop
+  is called) and then shutdown.  The EV3 uses a serial executor, first with no priorities (strict arrival order),
+  then with shutdown at a higher priority (it jumps the queue but waits for the running drive), then with
+  preempting (the waiting drives are cancelled and the running one is stopped).
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_priority.py
+"""
+
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+MOTION_COUNT = 5
+MOTION_SECONDS = 0.5
+
+
+class PretendRobot(object):
+    def __init__(self):
+        self.stopping = threading.Event()
+        self.drives_finished = 0
+        self.drives_stopped = 0
+        self.shutdown_at = None
+        self.shut_down = threading.Event()
+
+    def drive_inches(self, inches, speed):
+        if self.stopping.wait(MOTION_SECONDS):
+            self.drives_stopped += 1
+        else:
+            self.drives_finished += 1
+        self.stopping.clear()
+
+    def stop(self):
+        self.stopping.set()
+
+    def shutdown(self):
+        self.shutdown_at = time.perf_counter()
+        self.shut_down.set()
+
+
+def run(priority_options):
+    broker = LoopbackBroker()
+    robot = PretendRobot()
+    ev3_client = com.MqttClient(robot, executor="serial",
+                                priorities=com.PriorityOptions(cancel_method="stop", **priority_options))
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient()
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    drives = [pc_client.call("drive_inches", [24, 500]) for _ in range(MOTION_COUNT)]
+    time.sleep(0.1)  # The first drive is running by now.
+    sent_at = time.perf_counter()
+    pc_client.send_message("shutdown")
+    robot.shut_down.wait(MOTION_COUNT * MOTION_SECONDS + 5)
+    cancelled = sum(1 for drive in drives if drive.exception(MOTION_COUNT * MOTION_SECONDS + 5) is not None)
+
+    pc_client.close()
+    ev3_client.close()
+    return robot.shutdown_at - sent_at, robot.drives_finished, robot.drives_stopped, cancelled
+
+
+def main():
+    runs = [("arrival order", {}),
+            ("priority", {"methods": {"shutdown": 10}}),
+            ("preempt", {"methods": {"shutdown": 10}, "preempt_priority": 10})]
+    print()
+    print("{} drive_inches calls of {} s each, then shutdown, serial executor on the EV3".format(
+        MOTION_COUNT, MOTION_SECONDS))
+    print("{:<16}{:>16}{:>10}{:>10}{:>11}".format("", "shutdown after", "drove", "stopped", "cancelled"))
+    for label, priority_options in runs:
+        delay, finished, stopped, cancelled = run(priority_options)
+        print("{:<16}{:>13.0f} ms{:>10}{:>10}{:>11}".format(label, delay * 1000, finished, stopped, cancelled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+  Benchmark of RemoteProxy and the cached message headers of the codecs.
+
+  Three measurements:
+    - Encoding a drive_inches call with encode (the whole dictionary) and encode_call (cached header), per codec.
+    - Calls per second from the PC to the EV3 over the loopback broker with send_message and with a proxy
+      method (the proxy adds a local parameter count check).
+    - How long the describe handshake takes, and what it returns.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_proxy.py
+"""
+
+import threading
+import time
+import timeit
+
+import mqtt_codecs
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+MESSAGE_COUNT = 20000
+ENCODE_COUNT = 100000
+
+
+class PretendRobot(object):
+    def __init__(self):
+        self.count = 0
+        self.expected = None
+        self.done = threading.Event()
+
+    def drive_inches(self, inches, speed):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+    def turn_degrees(self, degrees, speed):
+        pass
+
+    def beep(self, *tones):
+        pass
+
+    def expect(self, count):
+        self.count = 0
+        self.expected = count
+        self.done.clear()
+
+
+def bench_encode():
+    results = []
+    for codec in mqtt_codecs.create_codecs().values():
+        encode = timeit.timeit(lambda: codec.encode({"type": "drive_inches", "payload": [24, 500]}),
+                               number=ENCODE_COUNT) / ENCODE_COUNT
+        encode_call = timeit.timeit(lambda: codec.encode_call("drive_inches", [24, 500]),
+                                    number=ENCODE_COUNT) / ENCODE_COUNT
+        results.append((codec.name, encode, encode_call))
+    return results
+
+
+def bench_sends(pc_client, robot, send):
+    robot.expect(MESSAGE_COUNT)
+    start = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        send()
+    robot.done.wait(60)
+    return MESSAGE_COUNT / (time.perf_counter() - start)
+
+
+def main():
+    encode_results = bench_encode()
+
+    broker = LoopbackBroker()
+    robot = PretendRobot()
+    ev3_client = com.MqttClient(robot)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient()
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    proxy = pc_client.remote_proxy()
+    describe_time = time.perf_counter() - start
+    send_message_rate = bench_sends(pc_client, robot, lambda: pc_client.send_message("drive_inches", [24, 500]))
+    proxy_rate = bench_sends(pc_client, robot, lambda: proxy.drive_inches(24, 500))
+    try:
+        proxy.drive_inches(24)
+        checked = "no error!"
+    except TypeError as error:
+        checked = str(error)
+    pc_client.close()
+    ev3_client.close()
+
+    print()
+    print("{:<8}{:>16}{:>18}".format("codec", "encode (us)", "encode_call (us)"))
+    for name, encode, encode_call in encode_results:
+        print("{:<8}{:>16.2f}{:>18.2f}".format(name, encode * 1e6, encode_call * 1e6))
+    print()
+    print("{} drive_inches calls over the loopback broker".format(MESSAGE_COUNT))
+    print("  send_message: {:.0f} calls/sec".format(send_message_rate))
+    print("  proxy:        {:.0f} calls/sec".format(proxy_rate))
+    print()
+    print("Describe handshake: {:.1f} ms, found {}".format(describe_time * 1000, pc_client.remote_signatures))
+    print("proxy.drive_inches(24) raised TypeError: {}".format(checked))
+
+
+if __name__ == "__main__":
+    main()
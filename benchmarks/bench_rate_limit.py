@@ -0,0 +1,84 @@
+"""
+  Benchmark of the rate limit policies on a simulated Tkinter remote with a key held down.
+
+  The PC sends drive calls at REPEAT_RATE per second (key auto-repeat) for HOLD_SECONDS, with a new speed each time
+  and a final stop (speed 0) when the key is let go.  The drive method is limited to LIMIT_RATE calls per second.
+  For no limit and each policy the EV3 side reports how many calls it ran, whether the last one it ran was the
+  stop, how late the stop arrived after the key was let go, and how long the sending loop was held up.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_rate_limit.py
+"""
+
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+REPEAT_RATE = 100
+HOLD_SECONDS = 1.0
+LIMIT_RATE = 20
+LIMIT_BURST = 5
+
+
+class DriveRecorder(object):
+    def __init__(self):
+        self.count = 0
+        self.last_speed = None
+        self.stopped_at = None
+        self.stopped = threading.Event()
+
+    def drive(self, left_speed, right_speed):
+        self.count += 1
+        self.last_speed = left_speed
+        if left_speed == 0:
+            self.stopped_at = time.perf_counter()
+            self.stopped.set()
+
+
+def run(policy):
+    broker = LoopbackBroker()
+    robot = DriveRecorder()
+    ev3_client = com.MqttClient(robot)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    rate_limits = {} if policy is None else {"drive": com.RateLimit(LIMIT_RATE, LIMIT_BURST, policy)}
+    pc_client = com.MqttClient(rate_limits=com.RateLimitOptions(rate_limits))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    repeats = int(REPEAT_RATE * HOLD_SECONDS)
+    start = time.perf_counter()
+    for index in range(repeats):
+        pc_client.send_message("drive", [100 + index, 100 + index])
+        time.sleep(max(0.0, start + (index + 1) / REPEAT_RATE - time.perf_counter()))
+    released_at = time.perf_counter()
+    pc_client.send_message("drive", [0, 0])
+    loop_time = time.perf_counter() - start
+    robot.stopped.wait(HOLD_SECONDS * REPEAT_RATE / LIMIT_RATE + 5)
+    time.sleep(0.2)  # Anything still held arrives after the stop would be a bug, give it time to show up.
+
+    stats = pc_client.rate_limit_stats()["methods"].get("drive", {})
+    pc_client.close()
+    ev3_client.close()
+    stop_lag = robot.stopped_at - released_at if robot.stopped_at is not None else None
+    return robot.count, robot.last_speed == 0, stop_lag, loop_time - HOLD_SECONDS, stats
+
+
+def main():
+    print()
+    print("Drive key held for {} s at {} repeats/sec, drive limited to {}/sec (burst {})".format(
+        HOLD_SECONDS, REPEAT_RATE, LIMIT_RATE, LIMIT_BURST))
+    print("{:<10}{:>8}{:>12}{:>12}{:>14}{:>11}{:>11}".format(
+        "policy", "ran", "ended on", "stop lag", "sender held", "throttled", "coalesced"))
+    for policy in [None, "drop", "coalesce", "block"]:
+        count, ended_on_stop, stop_lag, held, stats = run(policy)
+        print("{:<10}{:>8}{:>12}{:>12}{:>11.0f} ms{:>11}{:>11}".format(
+            policy or "none", count, "stop" if ended_on_stop else "a drive",
+            "lost" if stop_lag is None else "{:.0f} ms".format(stop_lag * 1000), max(0.0, held) * 1000,
+            stats.get("throttled", 0), stats.get("coalesced", 0)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+  Check of the MqttClient offline queue: the PC keeps sending while its connection to the loopback broker is cut.
+
+  The PC sends a stream of drive commands (with a short time to live, an old drive command is worse than none)
+  and a numbered log message every so often (no time to live, these must all arrive).  Part way through the PC
+  is cut off for a while, then let back in.  The report shows what reached the EV3, whether it arrived in order,
+  and the link statistics of the PC client.
+
+  This runs three ways: only the PC is cut off (its wifi drops), the same with the offline queue kept on disk,
+  and the whole broker restarted.  After a broker restart both clients have to reconnect and subscribe again,
+  anything the PC sends before the EV3 has resubscribed is lost (the broker has nobody to give it to), so a few
+  log messages go missing in that run.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_reconnect.py
+"""
+
+import os
+import tempfile
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+SEND_SECONDS = 3.0
+SEND_INTERVAL = 0.02
+OUTAGE_START = 1.0
+OUTAGE_SECONDS = 1.0
+DRIVE_TTL = 0.25
+
+
+class CountingRobot(object):
+    """Records the calls that made it to the EV3."""
+
+    def __init__(self):
+        self.drives = []
+        self.logs = []
+
+    def drive(self, sequence, sent_at):
+        self.drives.append((sequence, time.time() - sent_at))
+
+    def log(self, sequence):
+        self.logs.append(sequence)
+
+
+def run(whole_broker, queue_path=None):
+    broker = LoopbackBroker()
+    robot = CountingRobot()
+    ev3_client = com.MqttClient(robot, offline=com.OfflineOptions(reconnect_min_delay=0.05, reconnect_max_delay=0.4))
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(offline=com.OfflineOptions(queue_path=queue_path, reconnect_min_delay=0.05,
+                                                          reconnect_max_delay=0.4))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+    cut_off = None if whole_broker else [pc_client.client]
+
+    drives_sent = 0
+    logs_sent = 0
+    start = time.time()
+    outage = False
+    while time.time() - start < SEND_SECONDS:
+        elapsed = time.time() - start
+        if not outage and OUTAGE_START <= elapsed < OUTAGE_START + OUTAGE_SECONDS:
+            broker.stop(cut_off)
+            outage = True
+        elif outage and elapsed >= OUTAGE_START + OUTAGE_SECONDS:
+            broker.start(cut_off)
+            outage = False
+        pc_client.send_message("drive", [drives_sent, time.time()], ttl=DRIVE_TTL)
+        drives_sent += 1
+        if drives_sent % 5 == 0:
+            pc_client.send_message("log", [logs_sent])
+            logs_sent += 1
+        time.sleep(SEND_INTERVAL)
+    while not (pc_client.online and ev3_client.online):
+        time.sleep(0.05)
+    time.sleep(0.2)
+
+    stats = pc_client.link_stats()
+    pc_client.close()
+    ev3_client.close()
+
+    sequences = [sequence for sequence, _ in robot.drives]
+    worst_delay = max(delay for _, delay in robot.drives)
+    print("  drive: sent {}, received {}, in order {}, oldest on arrival {:.0f} ms (ttl {:.0f} ms)".format(
+        drives_sent, len(robot.drives), sequences == sorted(sequences), worst_delay * 1000, DRIVE_TTL * 1000))
+    print("  log:   sent {}, received {}, in order {}".format(
+        logs_sent, len(robot.logs), robot.logs == sorted(robot.logs)))
+    print("  link:  outages {outages}, longest {longest_outage:.2f} s, reconnect attempts {reconnect_attempts}, "
+          "flushed {flushed}, dropped expired {dropped_expired}, dropped overflow {dropped_overflow}".format(**stats))
+
+
+def main():
+    print()
+    print("PC cut off for {} s during {} s of sending, queue in memory".format(OUTAGE_SECONDS, SEND_SECONDS))
+    run(False)
+    queue_path = os.path.join(tempfile.mkdtemp(), "offline_queue.jsonl")
+    print("Same again with the queue on disk ({})".format(queue_path))
+    run(False, queue_path)
+    os.remove(queue_path)
+    print("Whole broker down for {} s".format(OUTAGE_SECONDS))
+    run(True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+  Benchmark of the MqttClient record_path option and of replaying a recording with mqtt_replay.
+
+  First the PC sends drive calls to the EV3 over the loopback broker with recording off and then on (at both
+  ends), to show what recording costs and how big the file gets.  The calls per second move around from run to
+  run with thread scheduling, so the time to record one message is also measured on its own.  Then a short
+  session of a pretend game delegate (a slow draw_dice method among quick ones) is recorded and replayed into a
+  new delegate at 1x, 10x and max speed, printing the per method times of the last replay.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_replay.py
+"""
+
+import os
+import random
+import tempfile
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+import mqtt_replay
+from loopback_broker import LoopbackBroker
+
+MESSAGE_COUNT = 20000
+SESSION_MESSAGES = 200
+SESSION_SECONDS = 2.0
+
+
+class PretendRobot(object):
+    def __init__(self, expected):
+        self.count = 0
+        self.expected = expected
+        self.done = threading.Event()
+
+    def drive(self, left_speed, right_speed):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+class PretendGameMaster(object):
+    """Stands in for GameMaster: a slow LCD redraw among quick methods."""
+
+    def __init__(self):
+        self.mqtt_client = None
+        self.count = 0
+        self.done = threading.Event()
+
+    def guess(self, value):
+        self._count()
+
+    def roll(self, dice_values):
+        self._count()
+
+    def draw_dice(self, dice_values):
+        time.sleep(0.004)  # Drawing five dice images on the LCD.
+        self._count()
+
+    def _count(self):
+        self.count += 1
+        if self.count == SESSION_MESSAGES:
+            self.done.set()
+
+
+def connect(broker, ev3_delegate, record_dir=None):
+    ev3_client = com.MqttClient(ev3_delegate, record_path=record_dir and os.path.join(record_dir, "ev3.mqrl"))
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(record_path=record_dir and os.path.join(record_dir, "pc.mqrl"))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+    return ev3_client, pc_client
+
+
+def bench_recording(record_dir):
+    robot = PretendRobot(MESSAGE_COUNT)
+    ev3_client, pc_client = connect(LoopbackBroker(), robot, record_dir)
+    start = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        pc_client.send_message("drive", [600, 600])
+    robot.done.wait(60)
+    elapsed = time.perf_counter() - start
+    size = ev3_client.recorder.stats()["bytes"] if ev3_client.recorder else 0
+    pc_client.close()
+    ev3_client.close()
+    return MESSAGE_COUNT / elapsed, size
+
+
+def bench_record_call(record_dir):
+    recorder = mqtt_replay.ReplayRecorder(os.path.join(record_dir, "calls.mqrl"))
+    frame = com.mqtt_codecs.JsonCodec().encode({"type": "drive", "payload": [600, 600]})
+    start = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        recorder.record_received("lego99/msg4ev3", frame)
+    elapsed = time.perf_counter() - start
+    recorder.close()
+    return elapsed / MESSAGE_COUNT
+
+
+def record_session(record_dir):
+    game_master = PretendGameMaster()
+    ev3_client, pc_client = connect(LoopbackBroker(), game_master, record_dir)
+    for _ in range(SESSION_MESSAGES):
+        method_name = random.choice(["guess", "roll", "draw_dice"])
+        pc_client.send_message(method_name, [random.randint(1, 6)] if method_name == "guess" else [[1, 2, 3, 4, 5]])
+        time.sleep(SESSION_SECONDS / SESSION_MESSAGES)
+    game_master.done.wait(10)
+    pc_client.close()
+    ev3_client.close()
+    return os.path.join(record_dir, "ev3.mqrl")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as record_dir:
+        rate_off, _ = bench_recording(None)
+        rate_on, size = bench_recording(record_dir)
+        record_time = bench_record_call(record_dir)
+        print()
+        print("{} drive calls from the PC to the EV3 over the loopback broker".format(MESSAGE_COUNT))
+        print("  recording off: {:.0f} calls/sec".format(rate_off))
+        print("  recording on:  {:.0f} calls/sec ({:+.1f}%), {:.1f} bytes per message in the EV3's file".format(
+            rate_on, (rate_on / rate_off - 1) * 100, size / MESSAGE_COUNT))
+        print("  {:.2f} us to record one message".format(record_time * 1e6))
+
+    with tempfile.TemporaryDirectory() as record_dir:
+        path = record_session(record_dir)
+        print()
+        print("Replaying a {} s session of {} messages".format(SESSION_SECONDS, SESSION_MESSAGES))
+        result = None
+        for speed in [1.0, 10.0, None]:
+            result = mqtt_replay.replay(path, PretendGameMaster(), speed)
+            print("  {:<5} {:.2f} s".format("max" if speed is None else "{:.0f}x".format(speed),
+                                            result["replay_time"]))
+        print()
+        print(mqtt_replay.format_replay(result))
+
+
+if __name__ == "__main__":
+    main()
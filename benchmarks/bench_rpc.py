@@ -0,0 +1,115 @@
+"""
+  Benchmark (and check) for MqttClient.call over the loopback broker.
+
+  First it times round trips of a call that does nothing, reporting latency percentiles.  Then it drives a square
+  the way m0e_code_snippet_examples.sending_messages_to_ev3 does, once by sleeping a guessed amount of time after
+  each send_message and once by pipelining call and waiting on the Futures.  Finally it checks that return
+  values, remote exceptions, unknown methods and timeouts all come back to the caller.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_rpc.py
+"""
+
+import concurrent.futures
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+ROUND_TRIPS = 2000
+SECONDS_PER_INCH = 0.004  # A pretend robot that is much faster than the real one, to keep the benchmark short.
+SECONDS_PER_DEGREE = 0.002
+
+
+class PretendRobot(object):
+    """Stands in for the Snatch3r, motion blocks for a time that depends on the distance."""
+
+    def __init__(self):
+        self.position = 0
+
+    def ping(self):
+        pass
+
+    def drive_inches(self, inches_to_drive, drive_speed_sp):
+        time.sleep(inches_to_drive * SECONDS_PER_INCH)
+        self.position += inches_to_drive
+
+    def where_am_i(self):
+        return self.position
+
+    def turn_degrees(self, degrees_to_turn, turn_speed_sp):
+        time.sleep(degrees_to_turn * SECONDS_PER_DEGREE)
+
+    def explode(self):
+        raise RuntimeError("Kaboom")
+
+    def stall(self):
+        time.sleep(1)
+
+
+def connect_pair():
+    broker = LoopbackBroker()
+    ev3_client = com.MqttClient(PretendRobot(), executor="serial", method_lanes={"ping": "inline"})
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient()
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+    return pc_client, ev3_client
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def main():
+    pc_client, ev3_client = connect_pair()
+
+    latencies = []
+    for _ in range(ROUND_TRIPS):
+        start = time.perf_counter()
+        pc_client.call("ping", timeout=5).result()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    print()
+    print("Round trip of {} calls to ping: p50 {:.0f} us, p90 {:.0f} us, p99 {:.0f} us, max {:.0f} us".format(
+        ROUND_TRIPS, percentile(latencies, 0.5), percentile(latencies, 0.9), percentile(latencies, 0.99),
+        latencies[-1]))
+
+    # The sleep amounts are what a student would guess: a bit more than the motion should take.
+    start = time.perf_counter()
+    for _ in range(4):
+        pc_client.send_message("drive_inches", [24, 500])
+        time.sleep(24 * SECONDS_PER_INCH * 1.5)
+        pc_client.send_message("turn_degrees", [90, 300])
+        time.sleep(90 * SECONDS_PER_DEGREE * 1.5)
+    print("Square with guessed sleeps:    {:.0f} ms".format((time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    futures = []
+    for _ in range(4):
+        futures.append(pc_client.call("drive_inches", [24, 500], timeout=10))
+        futures.append(pc_client.call("turn_degrees", [90, 300], timeout=10))
+    concurrent.futures.wait(futures)
+    print("Square with pipelined calls:   {:.0f} ms (ideal {:.0f} ms)".format(
+        (time.perf_counter() - start) * 1000, 4 * (24 * SECONDS_PER_INCH + 90 * SECONDS_PER_DEGREE) * 1000))
+
+    print()
+    print("where_am_i returned", pc_client.call("where_am_i", timeout=5).result())
+    for method_name, timeout in (("explode", 5), ("no_such_method", 5), ("stall", 0.2)):
+        try:
+            pc_client.call(method_name, timeout=timeout).result()
+            print(method_name, "unexpectedly succeeded")
+        except com.RemoteCallError as error:
+            print("{} raised RemoteCallError: {}".format(method_name, error))
+        except concurrent.futures.TimeoutError as error:
+            print("{} raised TimeoutError: {}".format(method_name, error))
+
+    pc_client.close()
+    ev3_client.close()
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,101 @@
+"""
+  Benchmark of telemetry streams against one send_message call per sample, over real sockets through the broker
+  in libs/mqtt_broker.py.
+
+  The EV3 side sends Pixy style samples (x, y, width, height) as fast as it can, first with send_message and then
+  through a telemetry stream with 1, 16 and 64 (the default) samples per frame.  The PC side counts the samples
+  it receives.
+  Reported per run: samples per second received, CPU (both ends and the broker) per sample, and frames missed.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_telemetry.py
+"""
+
+import threading
+import time
+
+import mqtt_broker
+import mqtt_remote_method_calls as com
+
+SAMPLE_COUNT = 50000
+SAMPLES_PER_FRAME = [1, 16, 64]
+PIXY_FIELDS = [("x", "h"), ("y", "h"), ("width", "h"), ("height", "h")]
+
+
+class SampleCounter(object):
+    """Counts received samples, from method calls or telemetry frames."""
+
+    def __init__(self, expected):
+        self.count = 0
+        self.expected = expected
+        self.done = threading.Event()
+
+    def pixy_sample(self, x, y, width, height):
+        self._add(1)
+
+    def on_frame(self, frame):
+        self._add(frame.count)
+
+    def _add(self, count):
+        self.count += count
+        if self.count >= self.expected:
+            self.done.set()
+
+
+def connect_pair(port, lego_robot_number, counter):
+    pc_client = com.MqttClient(counter)
+    pc_client.connect_to_ev3("localhost", lego_robot_number, port)
+    pc_client.on_telemetry("pixy", PIXY_FIELDS, counter.on_frame)
+    ev3_client = com.MqttClient()
+    ev3_client.connect_to_pc("localhost", lego_robot_number, port)
+    while not (pc_client.online and ev3_client.online):
+        time.sleep(0.01)
+    time.sleep(0.1)
+    return pc_client, ev3_client
+
+
+def run(port, lego_robot_number, samples_per_frame):
+    """Sends the samples with send_message if samples_per_frame is None, otherwise through a telemetry stream."""
+    counter = SampleCounter(SAMPLE_COUNT)
+    pc_client, ev3_client = connect_pair(port, lego_robot_number, counter)
+    stream = ev3_client.telemetry_stream("pixy", PIXY_FIELDS, samples_per_frame or 1)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for index in range(SAMPLE_COUNT):
+        x, y = index % 320, index % 200
+        if samples_per_frame is None:
+            ev3_client.send_message("pixy_sample", [x, y, 40, 30])
+        else:
+            stream.send(x, y, 40, 30)
+    stream.flush()
+    counter.done.wait(60)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    missed = pc_client.telemetry_stats()["received"]["pixy"]["missed_frames"]
+    ev3_client.close()
+    pc_client.close()
+    return counter.count / elapsed, cpu / max(counter.count, 1), counter.count, missed
+
+
+def main():
+    broker = mqtt_broker.MqttBroker(port=0)
+    broker.start()
+    runs = [("send_message", None)] + [("stream, {} per frame".format(size), size) for size in SAMPLES_PER_FRAME]
+    results = []
+    for lego_robot_number, (label, samples_per_frame) in enumerate(runs, 1):
+        results.append((label, run(broker.port, lego_robot_number, samples_per_frame)))
+    broker.stop()
+
+    base_rate = results[0][1][0]
+    print()
+    print("{} Pixy samples from the EV3 client to the PC client through libs/mqtt_broker.py".format(SAMPLE_COUNT))
+    print("{:<24}{:>14}{:>10}{:>16}{:>10}{:>10}".format("", "samples/sec", "speedup", "CPU per sample",
+                                                       "received", "missed"))
+    for label, (rate, cpu_per_sample, received, missed) in results:
+        print("{:<24}{:>14.0f}{:>9.1f}x{:>13.1f} us{:>10}{:>10}".format(
+            label, rate, rate / base_rate, cpu_per_sample * 1e6, received, missed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+  Benchmark of the MqttClient timing option: how much it costs, and what its stats look like.
+
+  The PC sends drive calls (quick) and beep calls (slow, they sit in the serial queue) to the EV3 over the
+  loopback broker, with timing off and then on.  The calls per second of the two runs show the overhead of
+  stamping and recording, then the table from the timing run shows where the time went for each method.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_timing.py
+"""
+
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+import mqtt_stats
+from loopback_broker import LoopbackBroker
+
+MESSAGE_COUNT = 20000
+BEEP_EVERY = 500
+BEEP_SECONDS = 0.005
+
+
+class PretendRobot(object):
+    def __init__(self, expected):
+        self.count = 0
+        self.expected = expected
+        self.done = threading.Event()
+
+    def drive(self, left_speed, right_speed):
+        self._count()
+
+    def beep(self):
+        time.sleep(BEEP_SECONDS)
+        self._count()
+
+    def _count(self):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+def run(timing):
+    broker = LoopbackBroker()
+    robot = PretendRobot(MESSAGE_COUNT)
+    ev3_client = com.MqttClient(robot, executor="serial", timing=timing)
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(timing=timing)
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    for index in range(MESSAGE_COUNT):
+        if index % BEEP_EVERY == 0:
+            pc_client.send_message("beep")
+        else:
+            pc_client.send_message("drive", [600, 600])
+    robot.done.wait(60)
+    elapsed = time.perf_counter() - start
+    stats = ev3_client.stats()
+    pc_client.close()
+    ev3_client.close()
+    return MESSAGE_COUNT / elapsed, stats
+
+
+def main():
+    rate_off, _ = run(False)
+    rate_on, stats = run(True)
+    print()
+    print("{} calls from the PC to the EV3 (serial executor) over the loopback broker".format(MESSAGE_COUNT))
+    print("  timing off: {:.0f} calls/sec".format(rate_off))
+    print("  timing on:  {:.0f} calls/sec ({:+.1f}%)".format(rate_on, (rate_on / rate_off - 1) * 100))
+    print()
+    print(mqtt_stats.format_stats(stats))
+
+
+if __name__ == "__main__":
+    main()
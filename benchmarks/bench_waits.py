@@ -0,0 +1,99 @@
+"""
+  Benchmark of device_waits.wait_until against the while / time.sleep(0.01) loops it replaces.
+
+  The real ev3dev library reads a touch sensor from the pretend sysfs tree in fake_sysfs.py, and a helper thread
+  "presses" it (writes 1 to its value file) at a random moment.  Each way of waiting is timed for how late it
+  noticed the press and how much CPU the program used while waiting, first with one wait and then with WAITERS
+  threads waiting at once (like a program whose threads each wait for their own sensor).  The shared poller is
+  run with its default CPU share (0.02) and a bigger one, which buys a quicker reaction.
+
+  Motor waits sleep in poll() until the kernel says the motor's state changed, which an ordinary file can't do, so
+  they aren't measured here (on the pretend tree they only wake every device_waits.MAX_POLL_BLOCK seconds).
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 benchmarks/bench_waits.py
+  (needs the ev3dev library, pip install python-ev3dev, but no EV3)
+"""
+
+import random
+import threading
+import time
+
+import ev3dev.ev3 as ev3
+
+import device_waits
+from fake_sysfs import FakeSysfs
+
+PRESSES = 20
+WAITERS = 10
+
+
+def sleep_loop(touch_sensor):
+    while not touch_sensor.is_pressed:
+        time.sleep(0.01)
+
+
+def shared_wait(touch_sensor):
+    device_waits.wait_until((touch_sensor, "is_pressed"))
+
+
+def with_cpu_share(cpu_share):
+    def wait(touch_sensor):
+        device_waits.shared_poller.cpu_share = cpu_share
+        shared_wait(touch_sensor)
+    return wait
+
+
+def set_value(sysfs, value):
+    # Overwritten in place (not truncated first) so a sensor being read never sees an empty file.
+    with open(sysfs.root + "/lego-sensor/sensor0/value0", "r+") as file:
+        file.write(value + "\n")
+
+
+def press_later(sysfs, pressed_at):
+    time.sleep(random.uniform(0.1, 0.3))
+    set_value(sysfs, "1")
+    pressed_at.append(time.perf_counter())
+
+
+def measure(sysfs, wait, waiters):
+    lateness = []
+    cpu = wall = 0.0
+    for _ in range(PRESSES):
+        set_value(sysfs, "0")
+        touch_sensors = [ev3.TouchSensor() for _ in range(waiters)]
+        noticed = []
+        threads = [threading.Thread(target=lambda sensor=sensor: (wait(sensor), noticed.append(time.perf_counter())))
+                   for sensor in touch_sensors]
+        pressed_at = []
+        presser = threading.Thread(target=press_later, args=(sysfs, pressed_at))
+        cpu_started, started = time.process_time(), time.perf_counter()
+        for thread in threads + [presser]:
+            thread.start()
+        for thread in threads + [presser]:
+            thread.join()
+        cpu += time.process_time() - cpu_started
+        wall += time.perf_counter() - started
+        lateness.extend(when - pressed_at[0] for when in noticed)
+    lateness.sort()
+    return sum(lateness) / len(lateness), lateness[-1], cpu / wall
+
+
+def main():
+    with FakeSysfs() as sysfs:
+        print()
+        print("{:>46} {:>12} {:>12} {:>7} {:>12}".format("", "late avg ms", "late max ms", "CPU %", "checks ms"))
+        for waiters in (1, WAITERS):
+            for name, wait in [("time.sleep(0.01) loop", sleep_loop),
+                               ("wait_until, cpu_share 0.02", with_cpu_share(0.02)),
+                               ("wait_until, cpu_share 0.05", with_cpu_share(0.05))]:
+                average, worst, cpu = measure(sysfs, wait, waiters)
+                interval = device_waits.shared_poller.interval if wait is not sleep_loop else 0.01
+                print("{:>46} {:>12.2f} {:>12.2f} {:>7.1f} {:>12.2f}".format(
+                    "{}, {} waiting".format(name, waiters), average * 1000, worst * 1000, cpu * 100,
+                    interval * 1000))
+        print()
+        print("(checks ms is how long the shared poller ended up sleeping between rounds of checks)")
+
+
+if __name__ == "__main__":
+    main()
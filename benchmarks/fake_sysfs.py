@@ -0,0 +1,71 @@
+"""
+  A pretend /sys/class tree with the Snatch3r's motors and sensors, for running ev3dev code on a PC.
+
+  The real ev3dev library finds devices by listing /sys/class/tacho-motor and /sys/class/lego-sensor and reading
+  each device's address and driver_name files, then reads and writes one small file per attribute.  Here those
+  are ordinary files in a temporary folder, so commands "work" but nothing moves (state is always empty, which
+  means not running).  Motor.wait blocks on poll(), which never fires on an ordinary file, so code that waits for
+  a motor can not be run against this tree.
+
+  Example:
+    with FakeSysfs() as sysfs:
+        robot = robo.Snatch3r()
+        robot.left_motor.run_forever(speed_sp=600)
+        print(sysfs.read("tacho-motor/motor1/command"))    # run-forever
+"""
+
+import os
+import shutil
+import tempfile
+
+import ev3dev.ev3 as ev3
+
+MOTOR_ATTRIBUTES = {"command": "", "commands": "run-forever run-to-abs-pos run-to-rel-pos run-timed run-direct "
+                    "stop reset", "count_per_rot": "360", "duty_cycle": "0", "duty_cycle_sp": "0",
+                    "polarity": "normal", "position": "0", "position_sp": "0", "speed": "0", "speed_sp": "0",
+                    "max_speed": "1050", "state": "", "stop_action": "coast", "time_sp": "0"}
+SENSOR_ATTRIBUTES = {"mode": "", "num_values": "1", "decimals": "0", "value0": "0"}
+
+DEVICES = [("tacho-motor", "motor0", "outA", "lego-ev3-m-motor", MOTOR_ATTRIBUTES),
+           ("tacho-motor", "motor1", "outB", "lego-ev3-l-motor", MOTOR_ATTRIBUTES),
+           ("tacho-motor", "motor2", "outC", "lego-ev3-l-motor", MOTOR_ATTRIBUTES),
+           ("lego-sensor", "sensor0", "in1", "lego-ev3-touch", SENSOR_ATTRIBUTES),
+           ("lego-sensor", "sensor1", "in3", "lego-ev3-color", SENSOR_ATTRIBUTES)]
+
+
+class FakeSysfs(object):
+    """Builds the tree and points ev3dev at it for the length of a with block."""
+
+    def __init__(self):
+        self.root = None
+        self.old_root = None
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix="fake_sysfs_")
+        for class_name, device_name, address, driver_name, attributes in DEVICES:
+            self.add_device(class_name, device_name, address, driver_name, attributes)
+        self.old_root = ev3.Device.DEVICE_ROOT_PATH
+        ev3.Device.DEVICE_ROOT_PATH = self.root
+        return self
+
+    def __exit__(self, *exc_info):
+        ev3.Device.DEVICE_ROOT_PATH = self.old_root
+        shutil.rmtree(self.root)
+
+    def add_device(self, class_name, device_name, address, driver_name, attributes):
+        """Plugs a device in (hot-plug)."""
+        path = os.path.join(self.root, class_name, device_name)
+        os.makedirs(path)
+        for name, value in dict(attributes, address=address, driver_name=driver_name).items():
+            file_name = os.path.join(path, name)
+            with open(file_name, "w") as file:
+                file.write(value + "\n")
+            os.chmod(file_name, 0o444 if name in ("address", "driver_name") else 0o664)
+
+    def remove_device(self, class_name, device_name):
+        """Unplugs a device."""
+        shutil.rmtree(os.path.join(self.root, class_name, device_name))
+
+    def read(self, attribute_path):
+        with open(os.path.join(self.root, attribute_path)) as file:
+            return file.read().strip()
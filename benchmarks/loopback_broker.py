@@ -0,0 +1,237 @@
+"""
+  An in-process stand-in for an MQTT broker, used by the benchmarks.
+
+  The LoopbackBroker hands out LoopbackClient objects that implement the small part of the
+  paho.mqtt.client.Client interface that the MqttClient uses.  Messages published by one client are
+  delivered to every client subscribed to that topic on that client's own network thread (started with
+  loop_start, just like paho), so the delegate calls happen the same way they would with a real broker.
+
+  Example:
+    broker = LoopbackBroker()
+    mqtt_client = com.MqttClient(my_delegate)
+    mqtt_client.client = broker.create_client()
+    mqtt_client.connect_to_pc()
+
+  broker.stop() and broker.start() simulate the broker going down and coming back: every client loses its
+  connection (and its subscriptions) and reconnects using the delays set with reconnect_delay_set, like paho.
+  Passing a list of clients to both only cuts those clients off, like one robot losing its wifi.
+
+  LoopbackBroker(delay=function) holds each delivery back by function() seconds, to pretend to be a wifi
+  network with an uneven delay (for example delay=lambda: random.uniform(0.002, 0.030)).
+"""
+
+import collections
+import queue
+import threading
+import time
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+
+class LoopbackMessage(object):
+    """Looks like the paho MQTTMessage passed to message callbacks."""
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class LoopbackMessageInfo(object):
+    """Looks like the paho MQTTMessageInfo returned by publish."""
+
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class LoopbackBroker(object):
+    """Routes publishes between the LoopbackClients it created (exact topic match only)."""
+
+    def __init__(self, delay=None):
+        self.delay = delay
+        self.subscriptions = collections.defaultdict(list)
+        self.publish_count = 0
+        self.byte_count = 0
+        self.lock = threading.Lock()
+        self.running = True
+        self.clients = []
+        self.cut_off = set()
+
+    def create_client(self):
+        """
+        Returns a new client connected to this broker.
+
+        Type hints:
+          :rtype: LoopbackClient
+        """
+        client = LoopbackClient(self)
+        with self.lock:
+            self.clients.append(client)
+        return client
+
+    def stop(self, clients=None):
+        """
+        Takes the broker down (or only cuts off the given clients).  The disconnected clients lose their
+        subscriptions and can not connect again until start is called.
+
+        Type hints:
+          :type clients: list of LoopbackClient | None
+        """
+        with self.lock:
+            if clients is None:
+                self.running = False
+                clients = list(self.clients)
+            self.cut_off.update(clients)
+            for subscribers in self.subscriptions.values():
+                subscribers[:] = [client for client in subscribers if client not in self.cut_off]
+        for client in clients:
+            client.inbox.put("disconnect")
+
+    def start(self, clients=None):
+        """
+        Brings the broker back after stop (or lets the given clients back in), clients reconnect on their own.
+
+        Type hints:
+          :type clients: list of LoopbackClient | None
+        """
+        with self.lock:
+            if clients is None:
+                self.running = True
+                self.cut_off.clear()
+            else:
+                self.cut_off.difference_update(clients)
+
+    def accepts(self, client):
+        """Returns True if the client could connect right now."""
+        with self.lock:
+            return self.running and client not in self.cut_off
+
+    def subscribe(self, client, topic):
+        with self.lock:
+            if client not in self.subscriptions[topic]:
+                self.subscriptions[topic].append(client)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self.lock:
+            self.publish_count += 1
+            self.byte_count += len(payload)
+            subscribers = list(self.subscriptions.get(topic, []))
+        for client in subscribers:
+            client.inbox.put(LoopbackMessage(topic, payload))
+
+
+class LoopbackClient(object):
+    """The part of paho.mqtt.client.Client that the MqttClient uses."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.inbox = queue.Queue()
+        self.callbacks = {}
+        self.on_connect = None
+        self.on_subscribe = None
+        self.on_message = None
+        self.on_disconnect = None
+        self.on_connect_fail = None
+        self.thread = None
+        self.running = False
+        self.connected = False
+        self.min_delay = 1
+        self.max_delay = 120
+        self.reconnect_delay = None
+
+    def connect(self, host, port=1883, keepalive=60):
+        pass  # The network thread connects once loop_start is called.
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.reconnect_delay = None
+
+    def message_callback_add(self, topic, callback):
+        self.callbacks[topic] = callback
+
+    def subscribe(self, topic, qos=0):
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for topic_name, _ in topics:
+            self.broker.subscribe(self, topic_name)
+        if self.on_subscribe:
+            self.on_subscribe(self, None, 1, tuple(topic_qos for _, topic_qos in topics))
+        return 0, 1
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if not self.connected:
+            return LoopbackMessageInfo(MQTT_ERR_NO_CONN)
+        self.broker.publish(topic, payload)
+        return LoopbackMessageInfo(MQTT_ERR_SUCCESS)
+
+    def loop(self, timeout=1.0):
+        try:
+            item = self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return 0
+        if item is None:
+            return 0
+        if item == "disconnect":
+            if self.connected:
+                self.connected = False
+                if self.on_disconnect:
+                    self.on_disconnect(self, None, 1)
+            return 0
+        if not self.connected:
+            return 0  # Sent before the broker went down, lost with the connection.
+        if self.broker.delay is not None:
+            time.sleep(self.broker.delay())
+        callback = self.callbacks.get(item.topic, self.on_message)
+        if callback:
+            callback(self, None, item)
+        return 0
+
+    def loop_start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._thread_main, daemon=True)
+        self.thread.start()
+
+    def loop_stop(self):
+        self.running = False
+        self.inbox.put(None)
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def disconnect(self):
+        self.connected = False
+
+    def pending(self):
+        """Returns the number of messages waiting to be delivered to this client."""
+        return self.inbox.qsize()
+
+    def _connected(self):
+        self.connected = True
+        self.reconnect_delay = None
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    def _thread_main(self):
+        # Like paho's loop_forever(retry_first_connection=True): connect, then reconnect whenever the broker is lost.
+        while self.running:
+            if self.connected:
+                self.loop(0.1)
+            elif self.broker.accepts(self):
+                self._connected()
+            else:
+                if self.on_connect_fail:
+                    self.on_connect_fail(self, None)
+                self._reconnect_wait()
+
+    def _reconnect_wait(self):
+        if self.reconnect_delay is None:
+            self.reconnect_delay = self.min_delay
+        else:
+            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_delay)
+        deadline = time.monotonic() + self.reconnect_delay
+        while self.running and time.monotonic() < deadline:
+            time.sleep(0.01)
@@ -0,0 +1,498 @@
+"""
+  An asyncio version of the MqttClient in mqtt_remote_method_calls.
+
+  The regular MqttClient runs paho on a background thread and calls the delegate from that thread.  That is
+  simple, but a PC dashboard that talks to many robots ends up with a thread per robot, and it is awkward to mix
+  with code that uses asyncio.  The AsyncMqttClient instead lets the asyncio event loop do all the socket work,
+  so one event loop (one thread) can handle dozens of robot connections.
+
+  It has the same connect / send surface as the MqttClient:
+
+  Code running on the PC:
+    import async_mqtt_remote_method_calls as acom
+
+    class MyDelegate(object):
+        async def on_rectangle_update(self, x, y, width, height):  # async def methods work, so do normal ones.
+            ...
+
+    async def main():
+        mqtt_client = acom.AsyncMqttClient(MyDelegate())
+        await mqtt_client.connect_to_ev3()
+        mqtt_client.send_message("arm_up")                        # Same as the MqttClient, does not wait.
+        await mqtt_client.publish("drive_inches", [24, 500])      # Waits until the message has been sent.
+        position = await mqtt_client.call("get_position", timeout=5)  # Waits for the return value.
+        await mqtt_client.close()
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+  Instead of (or as well as) a delegate, messages can be read with an async for loop:
+
+    async for message in mqtt_client.messages():
+        print(message["type"], message.get("payload"))
+
+  Delegate methods written as async def run as their own asyncio tasks, so they can await without holding up
+  other messages.  Normal methods run right away on the event loop, so they should be quick.
+
+  Like the MqttClient it reconnects whenever the connection to the broker drops, and send_message and call queue
+  their messages in the offline queue until it is back (publish raises ConnectionError instead, since it promises
+  the message has been sent).
+"""
+
+import asyncio
+import inspect
+import socket
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import mqtt_remote_method_calls as com
+
+
+class AsyncioExecutor(object):
+    """
+    Executor that runs delegate calls on the event loop.  Methods written with async def become tasks, normal
+    methods are called right away.  Calls submitted from another thread (a scheduled call's timer, for example)
+    are handed to the event loop's thread first.
+    """
+
+    def __init__(self, loop=None, name="asyncio"):
+        self.name = name
+        self.loop = loop
+        self.loop_thread_id = None
+        self.completed = 0
+        self.running_tasks = 0
+        self.tasks = {}  # Running task --> its com.Invocation
+        self.cancelled = 0
+
+    def submit(self, invocation):
+        """
+        Type hints:
+          :type invocation: com.Invocation
+          :rtype: bool
+        """
+        if threading.get_ident() != self.loop_thread_id:
+            self.loop.call_soon_threadsafe(self.submit, invocation)
+            return True
+        if inspect.iscoroutinefunction(invocation.method):
+            self.running_tasks += 1
+            task = self.loop.create_task(self._run(invocation))
+            self.tasks[task] = invocation
+            task.add_done_callback(self.tasks.pop)
+        else:
+            invocation.run()
+            self.completed += 1
+        return True
+
+    def attach(self, loop):
+        """Sets the event loop to run the calls on, must be called on that loop's thread."""
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+
+    async def _run(self, invocation):
+        invocation.started_at = time.monotonic()
+        try:
+            attempted_return = await invocation.method(*invocation.args)
+        except asyncio.CancelledError:
+            invocation.cancel("Cancelled by a higher priority call")
+        except Exception as error:
+            invocation.fail(error)
+        else:
+            invocation.finish(attempted_return)
+        finally:
+            self.running_tasks -= 1
+            self.completed += 1
+
+    def cancel_below(self, priority, client=None):
+        """
+        Cancels the running tasks with a lower priority (nothing waits in this executor, so none are returned).
+        Tasks can stop right away at their next await, so there is no need for the delegate's cancel method.
+        """
+        for task, invocation in list(self.tasks.items()):
+            if invocation.priority < priority and (client is None or invocation.client is client):
+                task.cancel()
+                self.cancelled += 1
+        return [], False
+
+    def stats(self):
+        return {"workers": 0, "queue_depth": self.running_tasks, "max_queue_depth": 0,
+                "submitted": self.completed + self.running_tasks, "completed": self.completed, "rejected": 0,
+                "coalesced": 0, "cancelled": self.cancelled, "mean_wait": 0.0, "max_wait": 0.0}
+
+    def shutdown(self):
+        pass
+
+
+class MessageStream(object):
+    """
+    An async iterator over received messages (the message dictionaries, for example
+    {"type": "on_rectangle_update", "payload": [143, 87, 32, 27]}).  Made by AsyncMqttClient.messages.
+    """
+
+    def __init__(self, client, method_names=None, max_size=0):
+        self.client = client
+        self.method_names = set(method_names) if method_names else None
+        self.queue = asyncio.Queue(max_size)
+        self.dropped = 0
+
+    def put(self, message_dict):
+        if self.method_names is not None and message_dict.get("type") not in self.method_names:
+            return
+        try:
+            self.queue.put_nowait(message_dict)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def close(self):
+        """Stops receiving messages, the async for loop ends once the waiting messages are read."""
+        if self in self.client.streams:
+            self.client.streams.remove(self)
+        self.queue.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message_dict = await self.queue.get()
+        if message_dict is None:
+            raise StopAsyncIteration
+        return message_dict
+
+
+class AsyncMqttClient(com.MqttClient):
+    """An MqttClient driven by the asyncio event loop instead of a paho network thread."""
+
+    def __init__(self, delegate=None, codec="json", allowed_methods=None, denied_methods=None,
+                 coalesce_methods=None, timing=False, offline=None, compression=None, priorities=None):
+        """
+        Constructs the client, see MqttClient for the parameters.  Batching and executors are not offered since
+        the event loop takes care of both jobs.  A preempting call cancels the running async delegate methods
+        with a lower priority (as tasks), so the cancel_method of the priorities is not needed.
+
+        Type hints:
+          :type codec: str
+          :type allowed_methods: list of str | None
+          :type denied_methods: list of str | None
+          :type coalesce_methods: list of str | None
+          :type timing: bool
+          :type offline: com.OfflineOptions | None
+          :type compression: com.CompressionOptions | None
+          :type priorities: com.PriorityOptions | None
+        """
+        super().__init__(delegate, codec=codec, allowed_methods=allowed_methods, denied_methods=denied_methods,
+                         executor=AsyncioExecutor(), coalesce_methods=coalesce_methods, timing=timing,
+                         offline=offline, compression=compression, priorities=priorities)
+        self.loop = None
+        self.streams = []
+        self._connected = None
+        self._link_lost = None  # Future that is done when the current connection drops.
+        self._closing = False
+        self._reconnect_delay = self.reconnect_min_delay
+        self._published = {}  # Message id --> Future that is done once paho has sent the message.
+        self._connection_task = None
+        self._misc_task = None
+        self._clock_sync_task = None
+
+    async def connect_to_ev3(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu",
+                             lego_robot_number=com.LEGO_NUMBER, mqtt_broker_port=1883):
+        """
+        Code running on the PC should use this command to connect to the EV3 robot (see MqttClient).
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_number: int
+          :type mqtt_broker_port: int
+        """
+        await self.connect("msg4pc", "msg4ev3", mqtt_broker_ip_address, lego_robot_number, mqtt_broker_port)
+
+    async def connect_to_pc(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu",
+                            lego_robot_number=com.LEGO_NUMBER, mqtt_broker_port=1883):
+        """
+        Code running on the EV3 should use this command to connect to the student PC (see MqttClient).
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_number: int
+          :type mqtt_broker_port: int
+        """
+        await self.connect("msg4ev3", "msg4pc", mqtt_broker_ip_address, lego_robot_number, mqtt_broker_port)
+
+    async def connect(self, subscription_suffix, publish_suffix,
+                      mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=com.LEGO_NUMBER,
+                      mqtt_broker_port=1883):
+        """
+        Connects to the broker and returns once the subscriptions are in place (see MqttClient.connect).  Like the
+        MqttClient it reconnects whenever the connection drops (backing off the same way), and messages sent while
+        it is down wait in the offline queue.  If the broker can't be reached this keeps trying, so wrap it in
+        asyncio.wait_for to give up after a while.
+
+        Type hints:
+          :type subscription_suffix: str
+          :type publish_suffix: str
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_number: int
+          :type mqtt_broker_port: int
+        """
+        self.loop = asyncio.get_event_loop()
+        self.executor.attach(self.loop)
+        self._set_topics(subscription_suffix, publish_suffix, lego_robot_number)
+        self.client.on_publish = self._on_publish
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self._connected = self.loop.create_future()
+        self._schedule_reconnect()
+
+        print("Connecting to mqtt broker {}".format(mqtt_broker_ip_address), end="")
+        self._connection_task = self.loop.create_task(self._keep_connected(mqtt_broker_ip_address,
+                                                                           mqtt_broker_port))
+        self._misc_task = self.loop.create_task(self._misc_loop())
+        await self._connected
+
+    async def publish(self, function_name, parameter_list=None, priority=None):
+        """
+        Like send_message, but waits until the message has been handed to the network.
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list of object | None
+          :type priority: int | None
+        """
+        message_dict = {"type": function_name}
+        if parameter_list is not None:
+            message_dict["payload"] = list(parameter_list)
+        if priority is not None:
+            message_dict["pri"] = priority
+        if self.timing:
+            self._stamp(message_dict)
+        message_info = self.client.publish(self.publish_topic_name, self._encode_frame(message_dict))
+        if message_info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError("Unable to publish {} ({})".format(function_name, mqtt.error_string(message_info.rc)))
+        if message_info.is_published():
+            return
+        future = self.loop.create_future()
+        self._published[message_info.mid] = future
+        await future
+
+    async def call(self, function_name, parameter_list=None, timeout=None, priority=None):
+        """
+        Calls a method on the other end and returns what it returned (see MqttClient.call).  Raises
+        com.RemoteCallError if the method failed on the other end, or asyncio.TimeoutError after timeout seconds.
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list of object | None
+          :type timeout: float | None
+          :type priority: int | None
+        """
+        call_id = "{}:{}".format(self._call_prefix, next(self._call_ids))
+        future = self.loop.create_future()
+        self._pending_calls[call_id] = (future, None)
+        message_dict = {"type": function_name, "id": call_id}
+        if parameter_list is not None:
+            message_dict["payload"] = list(parameter_list)
+        if priority is not None:
+            message_dict["pri"] = priority
+        if self.timing:
+            self._stamp(message_dict)
+        self._send(message_dict)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending_calls.pop(call_id, None)
+
+    async def describe_remote(self, timeout=5.0):
+        """
+        Asks the other end for the names and parameter counts of its delegate's methods, the first time only
+        (see MqttClient.describe_remote).  Raises asyncio.TimeoutError if no answer came within timeout seconds.
+
+        Type hints:
+          :type timeout: float
+          :rtype: dict
+        """
+        if self.remote_signatures is None:
+            self.remote_signatures = await self.call(com.DESCRIBE_MESSAGE_TYPE, timeout=timeout)
+        return self.remote_signatures
+
+    async def remote_proxy(self, delegate_class=None, timeout=5.0):
+        """
+        Returns a com.RemoteProxy whose methods send messages to the other end (see MqttClient.remote_proxy).
+        Its methods on robot.call are coroutines, so await them:  position = await robot.call.get_position()
+
+        Type hints:
+          :type delegate_class: type | None
+          :type timeout: float
+          :rtype: com.RemoteProxy
+        """
+        if delegate_class is not None:
+            return com.RemoteProxy(self, com.DispatchTable.class_signatures(delegate_class))
+        return com.RemoteProxy(self, await self.describe_remote(timeout))
+
+    async def sync_clock(self, samples=8, timeout=2.0):
+        """
+        Measures the offset to the other end's clock and returns the estimate (see MqttClient.sync_clock).  Raises
+        asyncio.TimeoutError if a request got no answer within timeout seconds.
+
+        Type hints:
+          :type samples: int
+          :type timeout: float
+          :rtype: float
+        """
+        for _ in range(samples):
+            t0 = self.clock()
+            _, t1, t2 = await self.call(com.TIME_MESSAGE_TYPE, [t0], timeout=timeout)
+            self.clock_sync.add_sample(t0, t1, t2, self.clock())
+        return self.clock_sync.offset
+
+    def start_clock_sync(self, interval=30.0, samples=4, timeout=2.0):
+        """
+        Keeps the clock offset up to date by running sync_clock every interval seconds as a task on the event
+        loop (see MqttClient.start_clock_sync).  The task stops when the client is closed.
+
+        Type hints:
+          :type interval: float
+          :type samples: int
+          :type timeout: float
+        """
+        if self._clock_sync_task is not None:
+            self._clock_sync_task.cancel()
+        self._clock_sync_task = asyncio.ensure_future(self._keep_clock_in_sync(interval, samples, timeout))
+
+    async def _keep_clock_in_sync(self, interval, samples, timeout):
+        while True:
+            try:
+                await self.sync_clock(samples, timeout)
+            except (asyncio.TimeoutError, com.RemoteCallError, com.RateLimitError):
+                pass
+            await asyncio.sleep(interval)
+
+    def messages(self, method_names=None, max_size=0):
+        """
+        Returns an async iterator over the received messages, optionally only those for the given method names.
+        If max_size is set and that many messages are waiting, newer messages are dropped (and counted).
+
+        Type hints:
+          :type method_names: list of str | None
+          :type max_size: int
+          :rtype: MessageStream
+        """
+        stream = MessageStream(self, method_names, max_size)
+        self.streams.append(stream)
+        return stream
+
+    async def close(self):
+        """Closes the connection and ends every message stream."""
+        self._closing = True
+        was_online = self.online
+        if not was_online and self._connection_task is not None:
+            self._connection_task.cancel()  # Nothing to disconnect, stop trying to connect.
+        if self._connected is not None and not self._connected.done():
+            self._connected.set_exception(ConnectionError("The client was closed before it connected"))
+        super().close()
+        for stream in list(self.streams):
+            stream.close()
+        if was_online:
+            await self._link_lost
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+        if self._clock_sync_task is not None:
+            self._clock_sync_task.cancel()
+
+    async def _keep_connected(self, mqtt_broker_ip_address, mqtt_broker_port):
+        """
+        Does the job of paho's network thread: connects, and whenever that fails or the connection drops, tries
+        again after the reconnect delay.
+        """
+        while not self._closing:
+            try:
+                # Look up the address without blocking the event loop, paho's connect would do it the blocking way.
+                addresses = await self.loop.getaddrinfo(mqtt_broker_ip_address, mqtt_broker_port,
+                                                        type=socket.SOCK_STREAM)
+                self.client.connect_async(addresses[0][4][0], mqtt_broker_port, 60)
+                self._link_lost = self.loop.create_future()
+                # paho's TCP connect blocks (for a long time if the broker doesn't answer), so it runs on a worker
+                # thread.  The socket hooks it calls from there hand their work to the event loop's thread.
+                reconnecting = self.loop.run_in_executor(None, self.client.reconnect)
+                try:
+                    await asyncio.shield(reconnecting)
+                except asyncio.CancelledError:
+                    reconnecting.add_done_callback(self._drop_late_connection)
+                    raise
+            except OSError:
+                self._on_connect_fail(self.client, None)
+            else:
+                await self._link_lost
+            if not self._closing:
+                await asyncio.sleep(self._reconnect_delay)
+
+    def _drop_late_connection(self, reconnecting):
+        """Disconnects again if the connection was made after close() stopped waiting for it."""
+        if not reconnecting.cancelled() and reconnecting.exception() is None:
+            self.client.disconnect()
+
+    def _schedule_reconnect(self):
+        self._reconnect_delay = super()._schedule_reconnect()
+        return self._reconnect_delay
+
+    def _dispatch(self, message_dict):
+        if self.streams and isinstance(message_dict, dict) and isinstance(message_dict.get("type"), str):
+            for stream in self.streams:
+                stream.put(message_dict)
+            if not self.delegate:
+                return  # The streams are the receivers, so there is no need for a delegate.
+        super()._dispatch(message_dict)
+
+    # ------------------------------------------------------------------
+    # Hooks that connect paho to the event loop.  paho never starts a thread, instead the event loop tells it
+    # when its socket can be read or written, and the misc loop handles the keep alive pings.  Only reconnect
+    # calls them from another thread (see _keep_connected), their work is always done on the loop's thread.
+    # ------------------------------------------------------------------
+    def _on_loop_thread(self, function, *args):
+        if threading.get_ident() == self.executor.loop_thread_id:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    # noinspection PyUnusedLocal
+    def _on_socket_open(self, client, userdata, sock):
+        self._on_loop_thread(self.loop.add_reader, sock, client.loop_read)
+
+    # noinspection PyUnusedLocal
+    def _on_socket_close(self, client, userdata, sock):
+        self._on_loop_thread(self.loop.remove_reader, sock)
+
+    # noinspection PyUnusedLocal
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._on_loop_thread(self.loop.add_writer, sock, client.loop_write)
+
+    # noinspection PyUnusedLocal
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop_thread(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self):
+        while True:
+            self.client.loop_misc()  # Does nothing while disconnected.
+            await asyncio.sleep(1)
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        super()._on_subscribe(client, userdata, mid, granted_qos)
+        if not self._connected.done():
+            self._connected.set_result(True)
+
+    # noinspection PyUnusedLocal
+    def _on_publish(self, client, userdata, mid):
+        future = self._published.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(True)
+
+    # noinspection PyUnusedLocal
+    def _on_disconnect(self, client, userdata, rc):
+        super()._on_disconnect(client, userdata, rc)
+        if self._link_lost is not None and not self._link_lost.done():
+            self._link_lost.set_result(rc)
+        for future in self._published.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Disconnected before the message was sent"))
+        self._published.clear()
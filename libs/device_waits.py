@@ -0,0 +1,167 @@
+"""
+  Waiting for something to happen on the robot (the touch sensor pressed, a motor stopped) without a
+  while / time.sleep(0.01) loop in every program.
+
+  wait_until blocks until a condition is true.  For a motor's state (is_running, is_stalled, ...) the kernel tells
+  us when it changes, so the wait sleeps in poll() on the motor's state file and wakes up right away.  Sensors
+  don't send notifications, so every other condition is checked by one poller thread shared by all the waits in
+  the program.  It checks as often as it can while keeping the time it spends reading sensors under a share of the
+  CPU (the EV3's is slow), so a quick check is made every millisecond or so and a slow one less often.
+
+  Example:
+    import device_waits
+
+    arm_motor.run_forever(speed_sp=900)
+    device_waits.wait_until((touch_sensor, "is_pressed"))    # Or wait_until(lambda: touch_sensor.is_pressed)
+    arm_motor.stop()
+
+    if not device_waits.wait_until(lambda: color_sensor.color == ev3.ColorSensor.COLOR_RED, timeout=5):
+        print("No red within 5 seconds")
+"""
+
+import threading
+import time
+
+try:
+    import resource  # Not on Windows.
+except ImportError:
+    resource = None
+
+import ev3dev.ev3 as ev3
+
+# Motor attributes that only depend on the state file, which the kernel notifies on.
+MOTOR_STATE_ATTRIBUTES = ("state", "is_running", "is_ramping", "is_holding", "is_overloaded", "is_stalled")
+
+# Longest a wait sleeps in poll() before checking again anyway, in case a notification never comes (an ordinary
+# file, like the pretend sysfs in benchmarks/fake_sysfs.py, never sends one).
+MAX_POLL_BLOCK = 0.5
+
+
+def _thread_cpu_time():
+    # time.thread_time is new in Python 3.7, the EV3 has 3.5, which has RUSAGE_THREAD (Linux only).  Elsewhere the
+    # CPU time of the whole process is the best there is, which only makes the poller check less often.
+    if hasattr(time, "thread_time"):
+        return time.thread_time()
+    if resource is not None and hasattr(resource, "RUSAGE_THREAD"):
+        user_time, system_time = resource.getrusage(resource.RUSAGE_THREAD)[:2]
+        return user_time + system_time
+    return time.process_time()
+
+
+class SharedPoller(object):
+    """
+    One thread that checks the conditions of every wait_until in the program.  It sleeps while nobody is waiting,
+    and between rounds of checks it sleeps long enough that the thread uses at most cpu_share of the CPU (but at
+    least min_interval and at most max_interval seconds), measured from the CPU time its recent rounds took.  The
+    default max_interval is the 10 ms of the loops it replaces, so a wait never reacts later than they did.
+    """
+
+    def __init__(self, min_interval=0.001, max_interval=0.01, cpu_share=0.02):
+        """
+        Type hints:
+          :type min_interval: float
+          :type max_interval: float
+          :type cpu_share: float
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cpu_share = cpu_share
+        self.interval = min_interval
+        self.waiters = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.rounds = 0
+        self.round_cpu_time = 0.0  # Average CPU seconds per round (checks and waking up).
+
+    def wait(self, condition, timeout=None):
+        """
+        Blocks until condition() returns something true, or for at most timeout seconds.  Returns True if the
+        condition came true.  If condition raises, the exception is raised here.
+
+        Type hints:
+          :type condition: callable
+          :type timeout: float | None
+          :rtype: bool
+        """
+        waiter = [condition, threading.Event(), None]  # The condition, set when done, an exception it raised.
+        with self.condition:
+            self.waiters.append(waiter)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="shared-poller", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        done = waiter[1].wait(timeout)
+        with self.condition:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        if waiter[2] is not None:
+            raise waiter[2]
+        return done
+
+    def _run(self):
+        cpu_time = _thread_cpu_time()
+        while True:
+            with self.condition:
+                while not self.waiters:
+                    self.condition.wait()
+                waiters = list(self.waiters)
+            for waiter in waiters:
+                try:
+                    if not waiter[0]():
+                        continue
+                except Exception as error:
+                    waiter[2] = error
+                with self.condition:
+                    if waiter in self.waiters:
+                        self.waiters.remove(waiter)
+                waiter[1].set()
+            # CPU time since the last round ended, which includes waking up from the sleep.
+            last_cpu_time, cpu_time = cpu_time, _thread_cpu_time()
+            self.round_cpu_time += (cpu_time - last_cpu_time - self.round_cpu_time) / min(self.rounds + 1, 20)
+            self.rounds += 1
+            self.interval = min(self.max_interval, max(self.min_interval, self.round_cpu_time / self.cpu_share))
+            time.sleep(self.interval)
+
+
+shared_poller = SharedPoller()
+
+
+def wait_until(condition, timeout=None, motor=None):
+    """
+    Blocks until a condition is true, or for at most timeout seconds (forever if None).  Returns True if the
+    condition came true, False if the time ran out.
+
+    condition is either a function that takes no arguments, or a (device, attribute name) pair meaning "until
+    that attribute is true", like (touch_sensor, "is_pressed").  A pair with a motor state attribute, or a
+    function given with the motor it watches, waits for the kernel to say the motor's state changed.  Everything
+    else is checked by the shared poller.
+
+    Type hints:
+      :type condition: callable | (object, str)
+      :type timeout: float | None
+      :type motor: ev3.Motor | None
+      :rtype: bool
+    """
+    if not callable(condition):
+        device, attribute = condition
+        condition = lambda: getattr(device, attribute)
+        if motor is None and attribute in MOTOR_STATE_ATTRIBUTES:
+            motor = device
+    if condition():
+        return True
+    if isinstance(motor, ev3.Motor):
+        return _wait_for_state_change(motor, condition, timeout)
+    return shared_poller.wait(condition, timeout)
+
+
+def _wait_for_state_change(motor, condition, timeout):
+    # ev3dev's Motor.wait sleeps in poll() on the state file and checks its condition (reading the state, which
+    # lets the next change wake poll() up again) when the kernel says the state changed.  It gives up at its
+    # timeout without checking, so the condition is checked here after every slice as well.
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        block = MAX_POLL_BLOCK if deadline is None else min(MAX_POLL_BLOCK, deadline - time.monotonic())
+        if block <= 0:
+            return False
+        if motor.wait(lambda state: condition(), block * 1000) or condition():
+            return True
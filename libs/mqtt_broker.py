@@ -0,0 +1,389 @@
+"""
+  A small MQTT 3.1.1 broker written in pure Python, so you can test and benchmark MQTT programs without the
+  broker at mosquitto.csse.rose-hulman.edu (or without any network at all).
+
+  It covers the part of MQTT that paho (and so the MqttClient) uses:
+    - CONNECT / DISCONNECT and keep alive pings
+    - SUBSCRIBE / UNSUBSCRIBE, including the + and # wildcards
+    - PUBLISH with QoS 0 and 1 (QoS 2 publishes are accepted and delivered as QoS 1)
+    - Retained messages
+  There are no persistent sessions, passwords, or wills.  It is meant for a lab bench, not a real deployment.
+
+  To run a broker from a terminal (then connect with mqtt_client.connect_to_ev3("localhost")):
+    python3 mqtt_broker.py            (or add a port number, the default is 1883)
+
+  To run one inside a program (for example a benchmark):
+    import mqtt_broker
+    broker = mqtt_broker.MqttBroker(port=1883)
+    broker.start()   # Runs on a background thread.
+    ...
+    broker.stop()
+"""
+
+import asyncio
+import struct
+import sys
+import threading
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+_UINT16 = struct.Struct(">H")
+
+
+class MqttProtocolError(Exception):
+    """A client sent something the broker does not understand, the connection gets closed."""
+
+
+def topic_matches(topic_filter, topic):
+    """
+    Returns True if the topic matches the subscription topic filter (which may use the + and # wildcards).
+
+    Type hints:
+      :type topic_filter: str
+      :type topic: str
+      :rtype: bool
+    """
+    if topic.startswith("$") and not topic_filter.startswith("$"):
+        return False  # Wildcards never match the special $ topics.
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, filter_level in enumerate(filter_levels):
+        if filter_level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if filter_level != "+" and filter_level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def encode_packet(packet_type, flags, body):
+    """
+    Adds the MQTT fixed header (type, flags and remaining length) to a packet body.
+
+    Type hints:
+      :type packet_type: int
+      :type flags: int
+      :type body: bytes
+      :rtype: bytes
+    """
+    header = bytearray([(packet_type << 4) | flags])
+    length = len(body)
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def encode_string(text):
+    """Encodes a string the MQTT way, a 2 byte length then UTF-8."""
+    encoded = text.encode()
+    return _UINT16.pack(len(encoded)) + encoded
+
+
+def encode_publish(topic, payload, qos=0, packet_id=0, retain=False):
+    """
+    Builds a PUBLISH packet.
+
+    Type hints:
+      :type topic: str
+      :type payload: bytes
+      :type qos: int
+      :type packet_id: int
+      :type retain: bool
+      :rtype: bytes
+    """
+    body = encode_string(topic)
+    if qos:
+        body += _UINT16.pack(packet_id)
+    return encode_packet(PUBLISH, (qos << 1) | (1 if retain else 0), body + payload)
+
+
+class Session(object):
+    """One connected client."""
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = None
+        self.subscriptions = {}  # Topic filter --> granted QoS
+        self.next_packet_id = 0
+        self.keepalive = 0
+        self.finished = asyncio.Event()
+
+    def send(self, data):
+        if not self.writer.transport.is_closing():
+            self.writer.write(data)
+
+    def deliver(self, topic, payload, qos, retain=False):
+        """Sends a message to this client."""
+        packet_id = 0
+        if qos:
+            self.next_packet_id = self.next_packet_id % 0xFFFF + 1
+            packet_id = self.next_packet_id
+        self.send(encode_publish(topic, payload, qos, packet_id, retain))
+        self.broker.messages_out += 1
+
+    def granted_qos(self, topic):
+        """Returns the highest QoS of this client's subscriptions that match the topic (None if none match)."""
+        granted = None
+        for topic_filter, qos in self.subscriptions.items():
+            if topic_matches(topic_filter, topic) and (granted is None or qos > granted):
+                granted = qos
+        return granted
+
+    async def run(self):
+        try:
+            packet_type, flags, body = await self._read_packet(None)
+            if packet_type != CONNECT:
+                raise MqttProtocolError("The first packet must be CONNECT")
+            self._handle_connect(body)
+            while True:
+                timeout = self.keepalive * 1.5 if self.keepalive else None
+                packet_type, flags, body = await self._read_packet(timeout)
+                if packet_type == DISCONNECT:
+                    break
+                self._handle_packet(packet_type, flags, body)
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, MqttProtocolError):
+            pass
+        except (struct.error, IndexError, UnicodeDecodeError):
+            pass  # A truncated or garbled packet, which is a protocol error too: only this client is dropped.
+        finally:
+            self.broker.remove_session(self)
+            self.writer.close()
+            self.finished.set()
+
+    async def _read_packet(self, timeout):
+        header = await asyncio.wait_for(self.reader.readexactly(1), timeout)
+        length = 0
+        shift = 0
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+            if shift > 21:
+                raise MqttProtocolError("Remaining length is too long")
+        body = await self.reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def _handle_connect(self, body):
+        protocol_name, index = _read_string(body, 0)
+        if protocol_name not in ("MQTT", "MQIsdp"):
+            raise MqttProtocolError("Unknown protocol {}".format(protocol_name))
+        # The connect flags (body[index + 1]) are not needed: wills, user names and passwords are ignored.
+        self.keepalive = _UINT16.unpack_from(body, index + 2)[0]
+        self.client_id, index = _read_string(body, index + 4)
+        if not self.client_id:
+            self.client_id = "anonymous-{}".format(id(self))
+        self.broker.add_session(self)
+        self.send(encode_packet(CONNACK, 0, b"\x00\x00"))
+
+    def _handle_packet(self, packet_type, flags, body):
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, index = _read_string(body, 0)
+            if qos:
+                packet_id = _UINT16.unpack_from(body, index)[0]
+                index += 2
+                self.send(encode_packet(PUBACK if qos == 1 else PUBREC, 0, _UINT16.pack(packet_id)))
+            self.broker.publish(topic, body[index:], min(qos, 1), bool(flags & 0x01))
+        elif packet_type == PUBREL:
+            self.send(encode_packet(PUBCOMP, 0, body[:2]))
+        elif packet_type == SUBSCRIBE:
+            packet_id = _UINT16.unpack_from(body, 0)[0]
+            index = 2
+            granted = bytearray()
+            new_filters = []
+            while index < len(body):
+                topic_filter, index = _read_string(body, index)
+                qos = min(body[index] & 0x03, 1)
+                index += 1
+                self.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                new_filters.append((topic_filter, qos))
+            self.send(encode_packet(SUBACK, 0, _UINT16.pack(packet_id) + bytes(granted)))
+            for topic_filter, qos in new_filters:
+                self.broker.send_retained(self, topic_filter, qos)
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = _UINT16.unpack_from(body, 0)[0]
+            index = 2
+            while index < len(body):
+                topic_filter, index = _read_string(body, index)
+                self.subscriptions.pop(topic_filter, None)
+            self.send(encode_packet(UNSUBACK, 0, _UINT16.pack(packet_id)))
+        elif packet_type == PINGREQ:
+            self.send(encode_packet(PINGRESP, 0, b""))
+        elif packet_type in (PUBACK, PUBREC, PUBCOMP):
+            pass  # Acknowledgements of our QoS 1 deliveries, nothing is redelivered so there is nothing to do.
+        else:
+            raise MqttProtocolError("Unexpected packet type {}".format(packet_type))
+
+
+class MqttBroker(object):
+    """The broker, it can run on a background thread (start / stop) or in your own event loop (serve)."""
+
+    def __init__(self, host="127.0.0.1", port=1883):
+        """
+        Type hints:
+          :type host: str
+          :type port: int
+        """
+        self.host = host
+        self.port = port
+        self.sessions = {}  # Client id --> Session
+        self.all_sessions = set()  # Includes sessions that have not sent CONNECT yet.
+        self.retained = {}  # Topic --> (payload, qos)
+        self.messages_in = 0
+        self.messages_out = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.start_error = None  # What stopped start from listening (a port already in use, say).
+
+    def add_session(self, session):
+        old_session = self.sessions.get(session.client_id)
+        if old_session is not None:
+            old_session.writer.close()  # MQTT says a new connection with the same id takes over.
+        self.sessions[session.client_id] = session
+
+    def remove_session(self, session):
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+    def publish(self, topic, payload, qos, retain):
+        """
+        Delivers a message to every client with a matching subscription.
+
+        Type hints:
+          :type topic: str
+          :type payload: bytes
+          :type qos: int
+          :type retain: bool
+        """
+        self.messages_in += 1
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        for session in list(self.sessions.values()):
+            granted = session.granted_qos(topic)
+            if granted is not None:
+                session.deliver(topic, payload, min(qos, granted))
+
+    def send_retained(self, session, topic_filter, qos):
+        for topic, (payload, retained_qos) in self.retained.items():
+            if topic_matches(topic_filter, topic):
+                session.deliver(topic, payload, min(qos, retained_qos), True)
+
+    async def serve(self):
+        """Starts listening for clients in the current event loop."""
+        self.server = await asyncio.start_server(self._on_client, self.host, self.port)
+        if self.port == 0:
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stops listening and closes every client connection."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        sessions = list(self.all_sessions)
+        for session in sessions:
+            session.writer.transport.abort()
+        for session in sessions:
+            await session.finished.wait()
+        self.sessions.clear()
+
+    def start(self):
+        """
+        Runs the broker on a background thread and waits until it is ready for clients.  Using port 0 picks a
+        free port, the chosen port is in self.port afterwards.  Raises OSError if it can't listen on the port (for
+        example because another broker already is).
+        """
+        self.ready.clear()
+        self.start_error = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._thread_main, name="mqtt-broker", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.start_error is not None:
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+            raise self.start_error
+
+    def stop(self):
+        """Stops a broker started with start (clients see their connection drop)."""
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def _thread_main(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        except Exception as error:
+            self.start_error = error
+            return
+        finally:
+            self.ready.set()
+        self.loop.run_forever()
+
+    async def _on_client(self, reader, writer):
+        session = Session(self, reader, writer)
+        self.all_sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.all_sessions.discard(session)
+
+
+def _read_string(data, index):
+    length = _UINT16.unpack_from(data, index)[0]
+    end = index + 2 + length
+    if end > len(data):
+        raise MqttProtocolError("String runs past the end of the packet")
+    return data[index + 2:end].decode(), end
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1883
+    broker = MqttBroker("0.0.0.0", port)
+    print("MQTT broker listening on port {}, press Ctrl C to stop".format(port))
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(broker.serve())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        loop.run_until_complete(broker.close())
+    print("Goodbye")
+
+
+if __name__ == "__main__":
+    main()
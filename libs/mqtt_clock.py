@@ -0,0 +1,171 @@
+"""
+  Clock synchronization for the MqttClient, so a command can run at a chosen moment (see execute_at in
+  mqtt_remote_method_calls) instead of whenever MQTT happens to deliver it.
+
+  The clocks of a PC and an EV3 can be seconds apart.  The offset between them is estimated the way NTP does it:
+  the sender notes its time t0 and sends a time request, the other end notes when it arrived (t1) and when it
+  answered (t2), and the sender notes when the answer came back (t3).  Then
+    offset = ((t1 - t0) + (t2 - t3)) / 2      (how far the other clock is ahead of ours)
+    delay  = (t3 - t0) - (t2 - t1)            (the time spent on the network, both ways)
+  The offset of a sample is only wrong by as much as the trip there and the trip back took different times, so
+  of the recent samples the one with the smallest delay is trusted.  The jitter is how much the recent offsets
+  spread around that one.
+"""
+
+import collections
+import heapq
+import itertools
+import math
+import threading
+
+import mqtt_stats
+
+Sample = collections.namedtuple("Sample", ["offset", "delay", "at"])
+
+
+class ClockSync(object):
+    """Estimates the offset to the other end's clock from time request samples."""
+
+    def __init__(self, window=16):
+        """
+        Keeps the last window samples.
+
+        Type hints:
+          :type window: int
+        """
+        self.samples = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.sample_count = 0
+
+    def add_sample(self, t0, t1, t2, t3):
+        """
+        Adds one time request: sent at t0 and answered at t3 (our clock), arrived at t1 and answered at t2 (theirs).
+
+        Type hints:
+          :type t0: float
+          :type t1: float
+          :type t2: float
+          :type t3: float
+        """
+        sample = Sample(((t1 - t0) + (t2 - t3)) / 2, (t3 - t0) - (t2 - t1), t3)
+        with self.lock:
+            self.samples.append(sample)
+            self.sample_count += 1
+
+    @property
+    def offset(self):
+        """Seconds the other clock is ahead of ours (None until there is a sample)."""
+        best = self._best_sample()
+        return best.offset if best else None
+
+    def stats(self):
+        """
+        Returns {"offset", "delay", "jitter", "samples"}: the offset and the round trip delay of the best recent
+        sample, the root mean square distance of the recent offsets from that offset, and how many samples were
+        taken in all.  All but samples are None before the first sample.
+
+        Type hints:
+          :rtype: dict
+        """
+        with self.lock:
+            samples = list(self.samples)
+            sample_count = self.sample_count
+        if not samples:
+            return {"offset": None, "delay": None, "jitter": None, "samples": 0}
+        best = min(samples, key=lambda sample: sample.delay)
+        jitter = math.sqrt(sum((sample.offset - best.offset) ** 2 for sample in samples) / len(samples))
+        return {"offset": best.offset, "delay": best.delay, "jitter": jitter, "samples": sample_count}
+
+    def _best_sample(self):
+        with self.lock:
+            return min(self.samples, key=lambda sample: sample.delay) if self.samples else None
+
+
+class ScheduledCalls(object):
+    """
+    Runs functions at given times of a clock, on one background thread (started when first needed).  Keeps a
+    histogram of how late each one ran, the ones that arrived already too late included.
+    """
+
+    def __init__(self, clock):
+        """
+        Type hints:
+          :type clock: callable
+        """
+        self.clock = clock
+        self.heap = []
+        self.order = itertools.count()  # Keeps calls for the same time in the order they were scheduled.
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = True
+        self.scheduled = 0
+        self.late = 0
+        self.invalid = 0
+        self.lateness = mqtt_stats.Histogram()
+
+    def schedule(self, at, function):
+        """
+        Calls function (with no arguments) once clock() reaches at, or right away if it already has.  Returns
+        False, and drops the call, if at is not a finite number (it comes from the other end of the connection).
+
+        Type hints:
+          :type at: float
+          :type function: callable
+          :rtype: bool
+        """
+        if isinstance(at, bool) or not isinstance(at, (int, float)) or not math.isfinite(at):
+            with self.condition:
+                self.invalid += 1
+            return False
+        with self.condition:
+            if not self.running:
+                return True
+            self.scheduled += 1
+            if at <= self.clock():
+                self.late += 1  # Arrived too late to be on time.
+            heapq.heappush(self.heap, (at, next(self.order), function))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="mqtt-scheduled-calls", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return True
+
+    def stats(self):
+        """
+        Returns {"scheduled", "waiting", "late", "invalid", "lateness"} where late counts the calls that arrived
+        after their time, invalid the calls dropped because their time was not a number, and lateness is the
+        Histogram summary of how late (in seconds) every call ran.
+
+        Type hints:
+          :rtype: dict
+        """
+        with self.condition:
+            return {"scheduled": self.scheduled, "waiting": len(self.heap), "late": self.late,
+                    "invalid": self.invalid, "lateness": self.lateness.summary()}
+
+    def shutdown(self):
+        """Stops the thread, calls still waiting are dropped."""
+        with self.condition:
+            self.running = False
+            self.heap = []
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.heap:
+                        wait = self.heap[0][0] - self.clock()
+                        if wait <= 0:
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+                if not self.running:
+                    return
+                at, _, function = heapq.heappop(self.heap)
+                self.lateness.add(max(0.0, self.clock() - at))
+            try:
+                function()
+            except Exception as error:
+                print("A scheduled call raised {}: {}".format(type(error).__name__, error))
@@ -0,0 +1,456 @@
+"""
+  Codecs that turn MqttClient messages into bytes (and back again).
+
+  A message is the dictionary built by MqttClient.send_message, for example
+    {"type": "drive_inches", "payload": [24, 500]}
+  and a batch frame is a list of those dictionaries.
+
+  Two codecs are available:
+    JsonCodec   - The original format. Easy to read when debugging and always understood by every client.
+    BinaryCodec - A compact msgpack-style format.  Method names are sent as small integer ids (using the list of
+                  method names the receiving end sent when it connected) so a drive_inches call is only a few bytes.
+
+  Every frame can be decoded without knowing which codec was used to make it, since the first byte tells them
+  apart (JSON always starts with { or [ and binary frames start with BINARY_MAGIC).  That way the two ends of a
+  connection can switch codecs at any time without losing messages.
+
+  Most messages are a plain call (just "type" and "payload"), so both codecs also have encode_call, which makes
+  the same bytes as encode but reuses the encoded start of the message (everything up to the payload) for each
+  method name instead of encoding it again every time.
+
+  A frame made by either codec can also be compressed with zlib (see compress_frame).  Compressed frames start
+  with COMPRESSED_MAGIC, so they are told apart the same way and the receiver decompresses them automatically.
+  A frame that would decompress to more than MAX_DECOMPRESSED_SIZE bytes is refused, so a small frame can't make
+  the receiver run out of memory.
+"""
+
+import json
+import struct
+import zlib
+
+BINARY_MAGIC = 0xB1
+COMPRESSED_MAGIC = 0xC5
+
+# The largest frame decompress_frame will make (the EV3 has 64 MB of memory in all).
+MAX_DECOMPRESSED_SIZE = 4 * 1024 * 1024
+
+# Method names whose encoded message header is kept for encode_call, per codec (plenty for any delegate).
+MAX_CACHED_HEADERS = 256
+
+_DOUBLE = struct.Struct(">d")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+
+
+class JsonCodec(object):
+    """Encodes messages as JSON text, the default format."""
+
+    name = "json"
+
+    def __init__(self):
+        self.headers = {}  # Method name --> the encoded message up to its payload.
+
+    def encode(self, message):
+        """
+        Type hints:
+          :type message: dict | list of dict
+          :rtype: bytes
+        """
+        return json.dumps(message).encode()
+
+    def encode_call(self, method_name, payload):
+        """
+        Same as encode({"type": method_name, "payload": payload}), but quicker.
+
+        Type hints:
+          :type method_name: str
+          :type payload: list
+          :rtype: bytes
+        """
+        header = self.headers.get(method_name)
+        if header is None:
+            header = '{{"type": {}, "payload": '.format(json.dumps(method_name)).encode()
+            if len(self.headers) < MAX_CACHED_HEADERS:
+                self.headers[method_name] = header
+        return header + json.dumps(payload).encode() + b"}"
+
+    def decode(self, data):
+        """
+        Raises ValueError if the data is not valid JSON.
+
+        Type hints:
+          :type data: bytes
+          :rtype: dict | list of dict
+        """
+        try:
+            return json.loads(data.decode())
+        except RecursionError as error:
+            raise ValueError("JSON nested too deep: {}".format(error))
+
+
+class BinaryCodec(object):
+    """
+    Encodes messages in a compact binary format.
+
+    Method names are interned to small integer ids.  The ids used when encoding come from the method list of the
+    receiving end (see set_remote_methods) and the ids used when decoding come from our own method list (see
+    set_local_methods).  Any name that is not in a list is simply sent as a string.
+    """
+
+    name = "binary"
+
+    def __init__(self):
+        self.local_methods = []
+        self.remote_method_ids = {}
+        self.headers = {}  # Method name --> the encoded frame up to its payload (depends on remote_method_ids).
+
+    def set_local_methods(self, method_names):
+        """
+        Sets the method names that the other end may refer to by id when sending to us.
+
+        Type hints:
+          :type method_names: list of str
+        """
+        self.local_methods = list(method_names)
+
+    def set_remote_methods(self, method_names):
+        """
+        Sets the method names that the other end told us about, so we can send them by id.
+
+        Type hints:
+          :type method_names: list of str
+        """
+        self.remote_method_ids = {name: index for index, name in enumerate(method_names)}
+        self.headers = {}
+
+    def encode(self, message):
+        """
+        Type hints:
+          :type message: dict | list of dict
+          :rtype: bytes
+        """
+        out = bytearray([BINARY_MAGIC])
+        messages = message if isinstance(message, list) else [message]
+        out.append(0x01 if isinstance(message, list) else 0x00)
+        _write_uint(out, len(messages))
+        for message_dict in messages:
+            self._write_message(out, message_dict)
+        return bytes(out)
+
+    def encode_call(self, method_name, payload):
+        """
+        Same as encode({"type": method_name, "payload": payload}), but quicker.
+
+        Type hints:
+          :type method_name: str
+          :type payload: list
+          :rtype: bytes
+        """
+        headers = self.headers
+        header = headers.get(method_name)
+        if header is None:
+            header = bytearray([BINARY_MAGIC, 0x00, 0x01])  # A single message, not a batch.
+            method_id = self.remote_method_ids.get(method_name)
+            if method_id is None:
+                _write_uint(header, 0)
+                _write_value(header, method_name)
+            else:
+                _write_uint(header, method_id + 1)
+            if len(headers) < MAX_CACHED_HEADERS:
+                headers[method_name] = header
+        out = bytearray(header)
+        _write_value(out, payload)
+        out.append(0x80)  # No extra keys.
+        return bytes(out)
+
+    def decode(self, data):
+        """
+        Raises ValueError if the data is not a valid binary frame.
+
+        Type hints:
+          :type data: bytes
+          :rtype: dict | list of dict
+        """
+        try:
+            if data[0] != BINARY_MAGIC:
+                raise ValueError("Not a binary frame")
+            is_batch = data[1] == 0x01
+            count, index = _read_uint(data, 2)
+            if not is_batch and count != 1:
+                raise ValueError("A single message frame holds {} messages".format(count))
+            messages = []
+            for _ in range(count):
+                message_dict, index = self._read_message(data, index)
+                messages.append(message_dict)
+        except (IndexError, TypeError, struct.error, UnicodeDecodeError, RecursionError) as error:
+            # TypeError is a list or dict used as a map key, RecursionError lists nested far too deep.
+            raise ValueError("Truncated or corrupt binary frame: {}".format(error))
+        if index != len(data):
+            raise ValueError("Unexpected bytes after the end of a binary frame")
+        if is_batch:
+            return messages
+        return messages[0]
+
+    def _write_message(self, out, message_dict):
+        name = message_dict["type"]
+        method_id = self.remote_method_ids.get(name)
+        if method_id is None:
+            _write_uint(out, 0)
+            _write_value(out, name)
+        else:
+            _write_uint(out, method_id + 1)
+        payload = message_dict.get("payload")
+        _write_value(out, payload)
+        if len(message_dict) == (1 if payload is None else 2):
+            out.append(0x80)  # No extra keys, an empty map.
+        else:
+            _write_value(out, {key: value for key, value in message_dict.items()
+                               if key != "type" and key != "payload"})
+
+    def _read_message(self, data, index):
+        method_ref = data[index]
+        if method_ref < 0x80:
+            index += 1  # Fast path, a one byte method reference.
+        else:
+            method_ref, index = _read_uint(data, index)
+        if method_ref == 0:
+            name, index = _read_value(data, index)
+            if not isinstance(name, str):
+                raise ValueError("The method name is a {}, not a str".format(type(name).__name__))
+        elif method_ref <= len(self.local_methods):
+            name = self.local_methods[method_ref - 1]
+        else:
+            raise ValueError("Unknown method id {}".format(method_ref - 1))
+        payload, index = _read_value(data, index)
+        if data[index] == 0x80:
+            message_dict = {}  # Fast path, no extra keys.
+            index += 1
+        else:
+            message_dict, index = _read_value(data, index)
+            if not isinstance(message_dict, dict):
+                raise ValueError("The extra keys are a {}, not a map".format(type(message_dict).__name__))
+        message_dict["type"] = name
+        if payload is not None:
+            message_dict["payload"] = payload
+        return message_dict, index
+
+
+def create_codecs():
+    """
+    Returns a new dictionary of every available codec, keyed by name.
+
+    Type hints:
+      :rtype: dict
+    """
+    return {JsonCodec.name: JsonCodec(), BinaryCodec.name: BinaryCodec()}
+
+
+def codec_name_for_frame(data):
+    """
+    Returns the name of the codec that made the given frame.
+
+    Type hints:
+      :type data: bytes
+      :rtype: str
+    """
+    if data and data[0] == BINARY_MAGIC:
+        return BinaryCodec.name
+    return JsonCodec.name
+
+
+def compress_frame(frame, level=1):
+    """
+    Compresses an encoded frame with zlib (level 1 is fastest, 9 is smallest).
+
+    Type hints:
+      :type frame: bytes
+      :type level: int
+      :rtype: bytes
+    """
+    return bytes([COMPRESSED_MAGIC]) + zlib.compress(frame, level)
+
+
+def is_compressed(data):
+    """
+    Returns True if the frame was made by compress_frame.
+
+    Type hints:
+      :type data: bytes
+      :rtype: bool
+    """
+    return bool(data) and data[0] == COMPRESSED_MAGIC
+
+
+def decompress_frame(data, max_size=MAX_DECOMPRESSED_SIZE):
+    """
+    Undoes compress_frame.  Raises ValueError if the data is not a valid compressed frame, or if it would
+    decompress to more than max_size bytes (it stops decompressing at that point).
+
+    Type hints:
+      :type data: bytes
+      :type max_size: int
+      :rtype: bytes
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        frame = decompressor.decompress(data[1:], max_size)
+    except zlib.error as error:
+        raise ValueError("Corrupt compressed frame: {}".format(error))
+    if decompressor.unconsumed_tail:
+        raise ValueError("Compressed frame is larger than {} bytes".format(max_size))
+    if not decompressor.eof:
+        raise ValueError("Corrupt compressed frame: it ends too early")
+    return frame
+
+
+# ----------------------------------------------------------------------
+# Helpers for the binary format.  The value tags follow msgpack where it is convenient but lengths are varints.
+# ----------------------------------------------------------------------
+def _write_uint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_uint(data, index):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, index
+        shift += 7
+
+
+def _write_value(out, value):
+    value_type = type(value)
+    if value_type is int and 0 <= value < 0x80:
+        out.append(value)  # Fast path for the most common case (small ints).
+    elif value_type is str and len(value) < 32 and len(value.encode()) < 32:
+        encoded = value.encode()
+        out.append(0xA0 | len(encoded))
+        out += encoded
+    elif value_type is list and len(value) < 16:
+        out.append(0x90 | len(value))
+        for item in value:
+            _write_value(out, item)
+    elif value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xFF)
+        elif -0x80000000 <= value < 0x80000000:
+            out.append(0xD2)
+            out += _INT32.pack(value)
+        else:
+            out.append(0xD3)
+            out += _INT64.pack(value)
+    elif isinstance(value, float):
+        out.append(0xCB)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        encoded = value.encode()
+        if len(encoded) < 32:
+            out.append(0xA0 | len(encoded))
+        else:
+            out.append(0xD9)
+            _write_uint(out, len(encoded))
+        out += encoded
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(0xC4)
+        _write_uint(out, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        if len(value) < 16:
+            out.append(0x90 | len(value))
+        else:
+            out.append(0xDC)
+            _write_uint(out, len(value))
+        for item in value:
+            _write_value(out, item)
+    elif isinstance(value, dict):
+        if len(value) < 16:
+            out.append(0x80 | len(value))
+        else:
+            out.append(0xDE)
+            _write_uint(out, len(value))
+        for key, item in value.items():
+            _write_value(out, key)
+            _write_value(out, item)
+    else:
+        raise TypeError("Object of type {} can not be sent by the binary codec".format(type(value).__name__))
+
+
+def _read_value(data, index):
+    tag = data[index]
+    index += 1
+    if tag < 0x80:
+        return tag, index
+    if tag >= 0xE0:
+        return tag - 0x100, index
+    if 0xA0 <= tag <= 0xBF:
+        end = index + (tag & 0x1F)
+        return data[index:end].decode(), end
+    if 0x90 <= tag <= 0x9F:
+        return _read_list(data, index, tag & 0x0F)
+    if 0x80 <= tag <= 0x8F:
+        return _read_dict(data, index, tag & 0x0F)
+    if tag == 0xC0:
+        return None, index
+    if tag == 0xC2:
+        return False, index
+    if tag == 0xC3:
+        return True, index
+    if tag == 0xD2:
+        return _INT32.unpack_from(data, index)[0], index + 4
+    if tag == 0xD3:
+        return _INT64.unpack_from(data, index)[0], index + 8
+    if tag == 0xCB:
+        return _DOUBLE.unpack_from(data, index)[0], index + 8
+    if tag == 0xD9:
+        length, index = _read_uint(data, index)
+        return data[index:index + length].decode(), index + length
+    if tag == 0xC4:
+        length, index = _read_uint(data, index)
+        return bytes(data[index:index + length]), index + length
+    if tag == 0xDC:
+        length, index = _read_uint(data, index)
+        return _read_list(data, index, length)
+    if tag == 0xDE:
+        length, index = _read_uint(data, index)
+        return _read_dict(data, index, length)
+    raise ValueError("Unknown value tag 0x{:02X}".format(tag))
+
+
+def _read_list(data, index, length):
+    items = []
+    append = items.append
+    for _ in range(length):
+        tag = data[index]
+        if tag < 0x80:
+            append(tag)  # Small ints are most of every payload, so they skip the call to _read_value.
+            index += 1
+        elif tag == 0xD2:
+            append(_INT32.unpack_from(data, index + 1)[0])
+            index += 5
+        else:
+            item, index = _read_value(data, index)
+            append(item)
+    return items, index
+
+
+def _read_dict(data, index, length):
+    items = {}
+    for _ in range(length):
+        key, index = _read_value(data, index)
+        items[key], index = _read_value(data, index)
+    return items, index
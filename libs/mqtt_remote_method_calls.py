@@ -35,10 +35,242 @@
     It is the responsibility of the developer to implement the method being called. There
     is no magic drive_time method in the Snatch3r class unless you implement it.
 
+  Batching:
+    Programs that send many small messages quickly (like a key held down in a Tkinter remote or a telemetry
+    loop on the EV3) can ask the MqttClient to gather the calls into a single publish.  For example:
+
+    mqtt_client = com.MqttClient(batching=com.BatchOptions(window=0.05, size=20))
+
+    will send at most one MQTT message every 50 milliseconds (or sooner if 20 calls pile up).  The other end
+    does not need any changes; it unpacks the batch and calls each method in the order they were sent.
+    Call mqtt_client.flush() to send anything that is waiting right away (close() does that for you).
+
+  Codecs:
+    Messages are sent as JSON by default.  There is also a compact binary codec, whose messages are about a
+    quarter of the size on the wire and quicker to encode.  Decoding one is about as quick as JSON for a single
+    call but takes about twice as long for a big batch (Python's json module is written in C, see
+    benchmarks/bench_codecs.py), so it pays off most on a slow or busy network.  To ask for it:
+
+    mqtt_client = com.MqttClient(codec="binary")
+
+    When the client connects it tells the other end which codecs it wants, and the other end answers with the
+    codecs it understands (plus its list of method names, which the binary codec uses to send method names as
+    small numbers).  Until that answer arrives, and whenever the other end can't use binary, messages are
+    still sent as JSON.  Every client says hello each time it connects, whichever codec it prefers, so an end
+    that restarts (perhaps with different methods) hands out its new method numbers before they are needed.
+
+  Choosing which methods can be called:
+    By default the other end may call any public method of the delegate (any method whose name does not start
+    with an underscore).  To limit that, give the MqttClient a list of method names to allow, or to deny:
+
+    mqtt_client = com.MqttClient(robot, denied_methods=["shutdown", "arm_calibration"])
+    mqtt_client = com.MqttClient(robot, allowed_methods=["drive", "stop", "arm_up", "arm_down"])
+
+    The MqttClient looks up the delegate methods (and how many parameters each one takes) once, when the
+    delegate is set.  A message for a method that is not allowed, or with the wrong number of parameters, is
+    rejected with a printed message instead of being called.  If you add methods to the delegate object after
+    it was given to the MqttClient, call mqtt_client.refresh_dispatch_table() so they can be found.
+
+  Running delegate methods off the network thread:
+    Normally a delegate method runs on the thread that reads MQTT messages, so while a slow method (like
+    drive_inches or arm_calibration) is running no other messages are read, not even shutdown.  An executor
+    can run the delegate methods on other threads instead:
+
+    mqtt_client = com.MqttClient(robot, executor="serial")           # One worker thread, calls run in order.
+    mqtt_client = com.MqttClient(robot, executor="pool", workers=4)  # Up to 4 calls at the same time.
+
+    Different methods can also be given different lanes.  "inline" runs on the network thread, "default" uses
+    the executor above, and any other name creates a serial lane just for the methods that use that name:
+
+    mqtt_client = com.MqttClient(robot, executor="serial",
+                                 method_lanes={"shutdown": "inline",
+                                               "drive_inches": "motion", "turn_degrees": "motion",
+                                               "arm_up": "arm", "arm_down": "arm"})
+
+    mqtt_client.executor_stats() reports the queue depth and how long calls waited in each lane's queue.
+
+  Stopping right away:
+    With an executor, calls wait their turn, so a shutdown sent after several drive_inches calls would wait
+    for every drive to finish.  Give urgent methods a higher priority and they jump the queue.  With
+    preempt_priority set, a call at that priority (or higher) also cancels the waiting calls below it, and if
+    one of them is already running it calls the delegate's cancel_method (which should stop the motors):
+
+    mqtt_client = com.MqttClient(robot, executor="serial",
+                                 priorities=com.PriorityOptions({"shutdown": 10, "stop": 10},
+                                                                preempt_priority=10, cancel_method="stop"))
+
+    The sender can also give a priority per message, which wins over the priorities of the methods:
+
+    mqtt_client.send_message("stop", priority=10)
+
+    Cancelled calls made with call fail with a RemoteCallError.  mqtt_client.preempt_stats() counts them.
+
+  Getting a value back:
+    send_message does not wait for the method to run on the other end.  If you need to know when it finished,
+    or what it returned, use call instead.  It returns a Future right away (so you can send more calls) and
+    the Future gets the return value (or the exception) once the other end sends it back.
+
+    first = mqtt_client.call("drive_inches", [24, 500], timeout=10)
+    second = mqtt_client.call("turn_degrees", [90, 300], timeout=10)
+    first.result()   # Waits only until the drive is done, then returns what drive_inches returned.
+    second.result()  # Raises com.RemoteCallError if turn_degrees raised an exception on the EV3.
+
+    If no answer comes back within timeout seconds the Future fails with a TimeoutError.  The answers travel on
+    a separate reply topic, so they never get mixed up with the messages sent by send_message.
+
+  Calling methods by name:
+    Instead of spelling out method names as strings, ask for a proxy of the delegate class and call its methods
+    (made from the class, the delegate itself only exists on the EV3):
+
+    robot = mqtt_client.remote_proxy(robo.Snatch3r)
+    robot.drive_inches(24, 500)                      # Sends the message, like send_message.
+    robot.call.drive_inches(24, 500).result()        # Like call, returns a Future.
+
+    A misspelled method, or the wrong number of parameters, raises an error right away on the PC.  Without a
+    class, remote_proxy() asks the other end for its methods once, when it is first needed.
+
+  Keeping only the newest value:
+    Some methods only care about the latest value, for example on_rectangle_update in the Pixy display.  If
+    the receiving end falls behind, running every old update just makes it lag.  Those methods can be marked
+    to coalesce, which means only the newest pending call is kept and older pending calls are dropped:
+
+    class MyDelegate(object):
+        @com.coalesce
+        def on_rectangle_update(self, x, y, width, height):
+            ...
+
+    or by name (this also works on the sending end, where there is no delegate method to mark):
+
+    mqtt_client = com.MqttClient(my_delegate, executor="serial", coalesce_methods=["on_rectangle_update"])
+
+    Calls are only pending while they wait for something.  On the sending end that is a batch (see Batching).
+    On the receiving end it is a batch frame or an executor queue, so use executor="serial" (or a lane) for
+    coalescing to help there.  mqtt_client.coalesce_stats() counts how many stale calls were dropped.
+
+  Sending less often:
+    A key held down in a Tkinter remote repeats about 30 times a second, and a mouse handler can fire even
+    faster, which floods the broker and the EV3 with calls that say the same thing.  A RateLimit (a token
+    bucket) caps how often a method, or everything a client sends, goes out:
+
+    mqtt_client = com.MqttClient(rate_limits=com.RateLimitOptions(
+        {"drive": com.RateLimit(10, policy="coalesce"), "draw_circle": com.RateLimit(5, burst=3, policy="drop")},
+        topic=com.RateLimit(50, burst=10, policy="block")))
+
+    "drop" throws away what is over the limit, "coalesce" holds it and sends only the newest value once the
+    limit allows, and "block" makes send_message wait.  Don't use "block" from a delegate method that runs
+    inline, it would stall the network thread.  Messages are never sent out of order: when a message goes out
+    (a stop with no limit, say), any older message still held by a limit goes out just before it, ignoring the
+    limit.  mqtt_client.rate_limit_stats() counts how often each limit throttled.
+
+  Losing the connection:
+    If the connection to the broker drops (or the broker can't be reached yet), the MqttClient keeps trying
+    to reconnect, waiting a little longer after each failed try (with some randomness so a room full of
+    robots doesn't retry all at the same moment).  Messages sent while offline wait in a queue and are sent,
+    in order, once the connection is back.  Old motion commands are usually not wanted after an outage, so a
+    message can have a time to live (ttl) in seconds, after which it is thrown away instead of sent:
+
+    mqtt_client = com.MqttClient(offline=com.OfflineOptions(queue_size=500, ttl=2.0))  # Default for every message.
+    mqtt_client.send_message("drive", [600, 600], ttl=0.5)                              # Or per message.
+
+    Give the OfflineOptions a queue_path (a file name) to keep the queue on disk, so it survives the program
+    restarting.
+    mqtt_client.link_stats() reports the queue size, dropped messages and how long the outages lasted.
+
+  Stopping when the link is lost:
+    If the PC program hangs or loses its wifi while the robot is driving, the robot would keep driving.  Send
+    heartbeats from the PC and give the robot a watchdog, which calls a delegate method (and cancels the waiting
+    calls) once nothing has been heard from the PC for watchdog_timeout seconds:
+
+    mqtt_client = com.MqttClient(heartbeat=com.HeartbeatOptions(interval=0.5))                          # PC.
+    mqtt_client = com.MqttClient(robot, heartbeat=com.HeartbeatOptions(watchdog_timeout=1.5,
+                                                                       watchdog_method="stop"))           # EV3.
+
+    Any message counts, the heartbeats just make sure there is one.  Each heartbeat is echoed back, and
+    mqtt_client.heartbeat_stats() on the PC reports the round trip times of the link.
+
+    The heartbeat thread keeps going if the PC program's main loop freezes.  To catch that too, leave the
+    interval out and call mqtt_client.send_heartbeat() from the GUI loop (with root.after).
+
+  Keeping messages in order:
+    MQTT can deliver messages out of order or twice around a reconnect, which matters for pairs like a left and
+    a right motor speed.  Have the sender number its messages and the receiver put them back in order, waiting at
+    most reorder_wait seconds for a missing one before skipping it:
+
+    mqtt_client = com.MqttClient(ordering=com.OrderingOptions(sequence_numbers=True))         # On the PC.
+    mqtt_client = com.MqttClient(robot, ordering=com.OrderingOptions(reorder_wait=0.05))      # On the EV3.
+
+    mqtt_client.ordering_stats() counts the messages put back in order, the gaps, duplicates and late ones.
+    Each topic is numbered on its own, so this works with one sender per topic.  These numbers ("ord") are not
+    the sequence numbers of timing=True ("seq"), only they are put back in order.
+
+  Finding out where the time goes:
+    With timing=True the MqttClient adds the send time and a sequence number to every message it sends, and
+    keeps histograms of four times for every method it receives: transit (from send_message on the other
+    computer until it arrived, so the two clocks need to agree), decode, queue (waiting for the executor) and
+    execution (the delegate method itself).  Turn it on at both ends:
+
+    mqtt_client = com.MqttClient(my_delegate, timing=True)
+    ...
+    print(mqtt_client.stats())            # {"methods": {"drive": {"transit": {"p50": ...}, ...}}, ...}
+    mqtt_client.start_stats_dump(30)      # Or print a table of the times every 30 seconds.
+
+  Big messages:
+    Long parameter lists (waypoints, a recorded telemetry buffer, an LCD image) make big messages, which are
+    slow over the EV3's wifi dongle.  Give a compression threshold (in bytes) and any message at least that big
+    is compressed with zlib before it is sent.  The receiving end decompresses it automatically (it needs this
+    version of the library, but no option), and drops any message that would be more than 4 MB once
+    decompressed (mqtt_codecs.MAX_DECOMPRESSED_SIZE).  mqtt_client.compression_stats() reports the compression
+    ratio and time per message type.
+
+    mqtt_client = com.MqttClient(compression=com.CompressionOptions(threshold=512))
+
+  Streaming sensor values:
+    Sending every sensor reading with send_message costs a method call per sample.  A telemetry stream packs
+    samples into binary frames on a topic of their own, many times faster (see mqtt_telemetry for the details):
+
+    pixy_stream = mqtt_client.telemetry_stream("pixy", [("x", "h"), ("y", "h"), ("width", "h"), ("height", "h")])
+    pixy_stream.send(x, y, width, height)                                  # On the EV3.
+
+    mqtt_client.on_telemetry("pixy", [("x", "h"), ("y", "h"), ("width", "h"), ("height", "h")], on_pixy)  # PC.
+
+  Running a command at a set time:
+    A dance, or several robots moving together, needs commands to run at a chosen moment rather than whenever
+    MQTT delivers them.  First measure how far apart the two clocks are, then give execute_at (a time.time() on
+    this computer) and the other end waits until that moment, on its own clock, to run the method:
+
+    mqtt_client.sync_clock()                         # Or mqtt_client.start_clock_sync(30) to keep it up to date.
+    start = time.time() + 0.5
+    mqtt_client.send_message("arm_up", execute_at=start)
+    mqtt_client.send_message("spin", [360], execute_at=start + 1.5)
+
+    mqtt_client.clock_stats() reports the offset and jitter of the clocks, and how late the scheduled calls ran
+    (on the receiving end).  The wait happens before the call goes to the executor.
+
+  Recording the traffic:
+    To find out later why a delegate was slow, give record_path and every message sent and received is added to
+    that file.  It costs little enough to leave on.  mqtt_replay plays a recording back into a delegate, without
+    a robot or a broker, and reports how long each method took (see mqtt_replay for the details):
+
+    mqtt_client = com.MqttClient(game_master, record_path="game_master.mqrl")
+
+  Talking to many robots at once:
+    A PC program that watches a whole lab of robots doesn't need an MqttClient (a connection and a thread) for
+    each robot.  A MultiRobotClient uses one connection, subscribes to every robot's topic with a wildcard and
+    gives each robot its own RobotHandle (an MqttClient with its own delegate, codec and stats):
+
+    def make_delegate(robot):                      # Called the first time a robot is heard from (or asked for).
+        return RobotTracker(robot.lego_robot_number)
+
+    mqtt_client = com.MultiRobotClient(make_delegate)
+    mqtt_client.connect_to_ev3()                   # Or connect_to_ev3(lego_robot_numbers=[3, 7, 12]).
+    mqtt_client.robot(7).send_message("arm_up")
+    mqtt_client.send_message_to_all("stop")
+
   Limitations:
     This communication protocol is only meant for simple methods. It has various limitations.
     - Parameters passed must be simple variable types such as int, str, float
-    - The method called should not return anything (it won't get magically passed back)
+    - The method called with send_message should not return anything (it won't get magically passed back),
+      use call if you need the return value.
 
 
   Also note that messages can go the other way too. For example:
@@ -123,161 +355,2623 @@
 
 """
 
+import collections
+import concurrent.futures
+import functools
+import inspect
+import itertools
 import json
+import math
+import os
+import random
+import threading
+import time
+import traceback
+import uuid
 
-import collections
+import collections.abc
 import paho.mqtt.client as mqtt
 
+import mqtt_clock
+import mqtt_codecs
+import mqtt_replay
+import mqtt_stats
+import mqtt_telemetry
+
 LEGO_NUMBER = 99  # TODO: Set your LEGO_NUMBER
 
+# Control message sent when connecting to agree on a codec, handled by the MqttClient itself (never the delegate).
+HELLO_MESSAGE_TYPE = "__hello__"
 
-class MqttClient(object):
-    """Helper class to make it easier to work with MQTT subscriptions and publications."""
+# Call answered by the MqttClient itself with the names and parameter counts of its delegate's methods.
+DESCRIBE_MESSAGE_TYPE = "__describe__"
 
-    def __init__(self, delegate=None):
+# Sent every HeartbeatOptions.interval seconds as [send time, False] and echoed straight back as [send time, True],
+# so the sender can measure the round trip time.  Handled by the MqttClient itself.
+HEARTBEAT_MESSAGE_TYPE = "__heartbeat__"
+
+# Time request answered by the MqttClient itself with [t0, time it arrived, time it was answered] (see mqtt_clock).
+TIME_MESSAGE_TYPE = "__time__"
+
+# Message type of the answers to call, sent on the reply topic (the subscription topic plus REPLY_TOPIC_SUFFIX).
+REPLY_MESSAGE_TYPE = "__reply__"
+REPLY_TOPIC_SUFFIX = "/reply"
+
+# Batch window used when only batch_size is given, so a lone call (a stop, say) is never held for long.
+DEFAULT_BATCH_WINDOW = 0.05
+
+
+class RemoteCallError(Exception):
+    """The method run by call failed (or could not be run) on the other end."""
+
+
+class RateLimitError(Exception):
+    """A call was dropped by a rate limit with the "drop" policy, so it was never sent."""
+
+
+def coalesce(method):
+    """
+    Decorator that marks a delegate method so that only the newest pending call to it is kept (see the module
+    docstring).
+    """
+    method.mqtt_coalesce = True
+    return method
+
+
+class DispatchTable(object):
+    """
+    The delegate methods that messages are allowed to call, looked up once instead of on every message.
+
+    Each entry in the methods dictionary maps a method name to a tuple of
+      (bound method, minimum number of parameters, maximum number of parameters or None for *args, coalesce)
+    """
+
+    def __init__(self, delegate=None, allowed_methods=None, denied_methods=None, coalesce_methods=()):
         """
-        Constructs the MQTT client and optionally connects a delegate object for message Rx.
+        Builds the table from the public methods of the delegate.  A method coalesces if it was marked with the
+        coalesce decorator or its name is in coalesce_methods.
 
-        Notice that the delegate is optional.
+        Type hints:
+          :type allowed_methods: list of str | None
+          :type denied_methods: list of str | None
+          :type coalesce_methods: set of str | list of str
         """
-        self.client = mqtt.Client()
-        self.delegate = delegate
-        self.subscription_topic_name = None
-        self.publish_topic_name = None
+        self.methods = {}
+        if delegate is None:
+            return
+        denied_methods = set(denied_methods or [])
+        for name in dir(delegate):
+            if name.startswith("_") or name in denied_methods:
+                continue
+            if allowed_methods is not None and name not in allowed_methods:
+                continue
+            if inspect.isdatadescriptor(inspect.getattr_static(type(delegate), name, None)):
+                continue  # A property is no method, and reading it may do work (the Snatch3r's find devices).
+            method = getattr(delegate, name, None)
+            if callable(method):
+                min_args, max_args = self._arity(method)
+                coalesces = name in coalesce_methods or getattr(method, "mqtt_coalesce", False)
+                self.methods[name] = (method, min_args, max_args, coalesces)
+
+    @staticmethod
+    def _arity(method):
+        """Returns the (minimum, maximum) number of positional parameters of a method (maximum None for *args)."""
+        try:
+            parameters = inspect.signature(method).parameters.values()
+        except (TypeError, ValueError):
+            return 0, None  # Some built in callables have no signature, let anything through.
+        min_args = 0
+        max_args = 0
+        for parameter in parameters:
+            if parameter.kind == parameter.VAR_POSITIONAL:
+                max_args = None
+            elif parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD):
+                if max_args is not None:
+                    max_args += 1
+                if parameter.default is parameter.empty:
+                    min_args += 1
+        return min_args, max_args
+
+    def names(self):
+        """Returns the sorted names of the methods in the table."""
+        return sorted(self.methods)
+
+    def signatures(self):
+        """Returns {method name: [minimum, maximum (None for *args)] number of parameters} for every method."""
+        return {name: [min_args, max_args] for name, (_, min_args, max_args, _) in self.methods.items()}
 
-    def connect_to_ev3(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER):
+    @classmethod
+    def class_signatures(cls, delegate_class, allowed_methods=None, denied_methods=None):
         """
-        Code running on the PC should use this command to connect to the EV3 robot.
-        Connects to the MQTT broker and begins listening for messages from the EV3.
+        Like signatures, but read from a delegate class, so no delegate has to be made (a Snatch3r can only be
+        made on an EV3).
 
-        Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).
+        Type hints:
+          :type delegate_class: type
+          :type allowed_methods: list of str | None
+          :type denied_methods: list of str | None
+          :rtype: dict
+        """
+        signatures = {}
+        denied_methods = set(denied_methods or [])
+        for name in dir(delegate_class):
+            if name.startswith("_") or name in denied_methods:
+                continue
+            if allowed_methods is not None and name not in allowed_methods:
+                continue
+            attribute = inspect.getattr_static(delegate_class, name)
+            if isinstance(attribute, (staticmethod, classmethod)):
+                method = getattr(delegate_class, name)
+            elif inspect.isfunction(attribute):
+                method = functools.partial(attribute, None)  # Leaves out self.
+            else:
+                continue
+            signatures[name] = list(cls._arity(method))
+        return signatures
+
+
+class Invocation(object):
+    """A single delegate method call waiting to be run by an executor."""
+
+    def __init__(self, method_name, method, args, reply=None, coalesce=False, timings=None, priority=0,
+                 client=None):
+        """
+        The reply function is given for calls made with call, it is called with (succeeded, return value or
+        error message) once the method finishes.  If coalesce is True a newer call to the same method may replace
+        this one while it waits in a queue.  If timings is given the queue and execution times
+        are recorded in it.  Calls with a higher priority are run before waiting calls with a lower one.  The
+        client is the MqttClient that received the call (an executor may be shared by several).
 
         Type hints:
-          :type mqtt_broker_ip_address: str
-          :type lego_robot_number: int
+          :type method_name: str
+          :type args: list | tuple
+          :type reply: callable | None
+          :type coalesce: bool
+          :type timings: mqtt_stats.MessageTimings | None
+          :type priority: int
+          :type client: MqttClient | None
         """
-        self.connect("msg4pc", "msg4ev3", mqtt_broker_ip_address, lego_robot_number)
+        self.method_name = method_name
+        self.method = method
+        self.args = args
+        self.reply = reply
+        self.coalesce = coalesce and reply is None  # Never drop a call that someone is waiting on.
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.timings = timings
+        self.priority = priority
+        self.client = client
+
+    def run(self):
+        """Calls the delegate method, printing (rather than raising) any exception so a worker thread survives."""
+        self.started_at = time.monotonic()
+        try:
+            attempted_return = self.method(*self.args)
+        except Exception as error:
+            self.fail(error)
+            return
+        self.finish(attempted_return)
+
+    def fail(self, error):
+        """Reports an exception raised by the delegate method."""
+        self._record_times()
+        if self.reply:
+            self.reply(False, "{}: {}".format(type(error).__name__, error))
+            return
+        print("The method {} raised an exception:".format(self.method_name))
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def finish(self, attempted_return):
+        """Reports the value returned by the delegate method."""
+        self._record_times()
+        if self.reply:
+            self.reply(True, attempted_return)
+        elif attempted_return:
+            print(("The method {} returned a value. That's not really how this library works. " +
+                   "The value {} was not magically sent back over").format(self.method_name, attempted_return))
+
+    def cancel(self, reason):
+        """Reports a call that was taken out of the queue (or stopped) before it could finish."""
+        if self.reply:
+            self.reply(False, reason)
+
+    def _record_times(self):
+        if self.timings is None or self.started_at is None:
+            return
+        self.timings.record(self.method_name, (("queue", self.started_at - self.enqueued_at),
+                                               ("execution", time.monotonic() - self.started_at)))
+
+
+class InlineExecutor(object):
+    """Runs each call right away on the calling thread (the MQTT network thread).  The original behavior."""
+
+    def __init__(self, name="inline"):
+        self.name = name
+        self.completed = 0
 
-    def connect_to_pc(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER):
+    def submit(self, invocation):
         """
-        Code running on the EV3 should use this command to connect to the student PC.
-        Connects to the MQTT broker and begins listening for messages from the PC.
+        Type hints:
+          :type invocation: Invocation
+          :rtype: bool
+        """
+        invocation.run()
+        self.completed += 1
+        return True
+
+    def cancel_below(self, priority, client=None):
+        """Nothing ever waits in an inline executor, and a running call has the network thread to itself."""
+        return [], False
+
+    def stats(self):
+        return {"workers": 0, "queue_depth": 0, "max_queue_depth": 0, "submitted": self.completed,
+                "completed": self.completed, "rejected": 0, "coalesced": 0, "cancelled": 0, "mean_wait": 0.0,
+                "max_wait": 0.0}
+
+    def shutdown(self):
+        pass
 
-        Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).
 
+class QueueExecutor(object):
+    """
+    Runs calls on worker threads, highest priority first and otherwise in the order they were submitted.  With
+    one worker it is a serial queue, with more it is a bounded thread pool.  If max_queue calls are already
+    waiting, new calls are rejected (dropped with a printed message) since blocking would stall the MQTT network
+    thread.
+
+    A coalescing call that arrives while an older call to the same method is still waiting replaces it: the older
+    call is dropped and the new one is queued at the back like any other call, so it still runs after the calls
+    that arrived before it (drive, stop, drive runs as stop, drive rather than drive, stop).
+    """
+
+    def __init__(self, name, workers=1, max_queue=None):
+        """
         Type hints:
-          :type mqtt_broker_ip_address: str
-          :type lego_robot_number: int
+          :type name: str
+          :type workers: int
+          :type max_queue: int | None
         """
-        self.connect("msg4ev3", "msg4pc", mqtt_broker_ip_address, lego_robot_number)
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue = collections.deque()
+        self.waiting_coalesced = {}  # Method name --> the coalescing Invocation of that method in the queue.
+        self.condition = threading.Condition()
+        self.running = True
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.running_invocations = []
+        self.coalesced_by_method = collections.Counter()
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.threads = []
+        for k in range(workers):
+            thread = threading.Thread(target=self._worker, name="{}-{}".format(name, k), daemon=True)
+            thread.start()
+            self.threads.append(thread)
 
-    def connect(self, subscription_suffix, publish_suffix,
-                mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER):
+    def submit(self, invocation):
         """
-        Connect this MQTT client to the broker, note that connect_to_ev3 and connect_to_pc call this method.
-        This connect method is the most generic allowing callers to set the subscription and publish topics.
-        The lego_robot number is added to both the subscription and publish topics (as shown in the code below).
+        Queues a call.  Returns False if it was rejected because the queue is full or the executor has shut down.
 
-        Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).
+        Type hints:
+          :type invocation: Invocation
+          :rtype: bool
+        """
+        with self.condition:
+            replaced = None
+            if invocation.coalesce and self.running:
+                replaced = self.waiting_coalesced.pop(invocation.method_name, None)
+                if replaced is not None:
+                    self.queue.remove(replaced)
+                    self.coalesced_by_method[invocation.method_name] += 1
+            if not self.running or (self.max_queue is not None and len(self.queue) >= self.max_queue):
+                self.rejected += 1
+                print("The {} queue is full, dropped a call to {}.".format(self.name, invocation.method_name))
+                return False
+            if not self.queue or self.queue[-1].priority >= invocation.priority:
+                self.queue.append(invocation)
+            else:
+                # Goes after the waiting calls of the same or higher priority, ahead of the lower ones.
+                index = len(self.queue)
+                while index and self.queue[index - 1].priority < invocation.priority:
+                    index -= 1
+                self.queue.insert(index, invocation)
+            if invocation.coalesce:
+                self.waiting_coalesced[invocation.method_name] = invocation
+            if replaced is None:
+                self.submitted += 1  # A replacement takes the place of a call that was already counted.
+            self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+            self.condition.notify()
+        return True
+
+    def stats(self):
+        """
+        Returns a dictionary of the queue metrics (times are in seconds).
 
         Type hints:
-          :type subscription_suffix: str
-          :type publish_suffix: str
-          :type mqtt_broker_ip_address: str
-          :type lego_robot_number: int
+          :rtype: dict
         """
-        lego_name = "lego" + str(lego_robot_number).zfill(2)
-        self.subscription_topic_name = lego_name + "/" + subscription_suffix
-        self.publish_topic_name = lego_name + "/" + publish_suffix
+        with self.condition:
+            return {"workers": self.workers, "queue_depth": len(self.queue), "max_queue_depth": self.max_queue_depth,
+                    "submitted": self.submitted, "completed": self.completed, "rejected": self.rejected,
+                    "coalesced": sum(self.coalesced_by_method.values()), "cancelled": self.cancelled,
+                    "mean_wait": self.total_wait / self.completed if self.completed else 0.0,
+                    "max_wait": self.max_wait}
 
-        # Callback for when the connection to the broker is complete.
-        self.client.on_connect = self._on_connect
-        self.client.message_callback_add(self.subscription_topic_name, self._on_message)
+    def cancel_below(self, priority, client=None):
+        """
+        Takes the waiting calls with a lower priority out of the queue (only those received by client, if given).
+        Returns them, and whether a call with a lower priority is running right now.
 
-        self.client.connect(mqtt_broker_ip_address, 1883, 60)
-        print("Connecting to mqtt broker {}".format(mqtt_broker_ip_address), end="")
-        self.client.loop_start()
+        Type hints:
+          :type priority: int
+          :type client: MqttClient | None
+          :rtype: (list of Invocation, bool)
+        """
+        def lower(invocation):
+            return invocation.priority < priority and (client is None or invocation.client is client)
+
+        with self.condition:
+            cancelled = [invocation for invocation in self.queue if lower(invocation)]
+            if cancelled:
+                self.queue = collections.deque(invocation for invocation in self.queue if not lower(invocation))
+                for invocation in cancelled:
+                    if self.waiting_coalesced.get(invocation.method_name) is invocation:
+                        del self.waiting_coalesced[invocation.method_name]
+                self.cancelled += len(cancelled)
+            return cancelled, any(lower(invocation) for invocation in self.running_invocations)
+
+    def shutdown(self):
+        """Stops the worker threads once they finish the call they are running.  Waiting calls are dropped."""
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.waiting_coalesced.clear()
+            self.condition.notify_all()
 
-    def send_message(self, function_name, parameter_list=None):
+    def _worker(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                invocation = self.queue.popleft()
+                if invocation.coalesce:
+                    self.waiting_coalesced.pop(invocation.method_name, None)
+                self.running_invocations.append(invocation)
+            wait = time.monotonic() - invocation.enqueued_at
+            invocation.run()
+            with self.condition:
+                self.running_invocations.remove(invocation)
+                self.completed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+
+def create_executor(name, kind, workers=1, max_queue=None):
+    """
+    Makes an executor of the given kind ("inline", "serial" or "pool").
+
+    Type hints:
+      :type name: str
+      :type kind: str
+      :type workers: int
+      :type max_queue: int | None
+    """
+    if kind == "inline":
+        return InlineExecutor(name)
+    if kind == "serial":
+        return QueueExecutor(name, 1, max_queue)
+    if kind == "pool":
+        return QueueExecutor(name, workers, max_queue)
+    raise ValueError("Unknown executor {}, choose inline, serial or pool".format(kind))
+
+
+class OfflineQueue(object):
+    """
+    Messages waiting to be sent while the MqttClient is not connected.  Holds at most max_size messages (the
+    oldest is dropped when a new one arrives on a full queue), optionally mirrored to a file so they survive a
+    restart.  Each entry is (time queued, time it expires or None, topic, message).
+    """
+
+    def __init__(self, max_size=1000, path=None):
         """
-        Sends a message to the MQTT broker using the publish_topic_name that was set by the connect method.
+        Type hints:
+          :type max_size: int
+          :type path: str | None
+        """
+        self.max_size = max_size
+        self.path = path
+        self.entries = collections.deque()
+        self.dropped_overflow = 0
+        self.dropped_expired = 0
+        self.flushed = 0
+        self._file = None
+        self._lines_in_file = 0
+        if path:
+            self._load()
+            self._rewrite_file()
 
-        What comes in:
-          function_name: the name of the method that you want to call (as a string) on the other end's delegate
-          parameter_list: a List containing the arguments to that method call. Note: even single arguments should be
-                          placed into a list.  Also objects in the list will be transferred using json, so objects in
-                          the list must be serializable (int, float, string, etc all work fine but nothing fancy)
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, topic, message, expires_at=None):
+        """
         Type hints:
-          :type function_name:  str
-          :type parameter_list: list of object | None
+          :type topic: str
+          :type message: dict | list of dict
+          :type expires_at: float | None
         """
-        message_dict = {"type": function_name}
-        if parameter_list:
-            if isinstance(parameter_list, collections.Iterable):
-                message_dict["payload"] = parameter_list
+        entry = (time.time(), expires_at, topic, message)
+        if len(self.entries) >= self.max_size:
+            self.entries.popleft()
+            self.dropped_overflow += 1
+        self.entries.append(entry)
+        if self._file:
+            if self._lines_in_file >= 2 * self.max_size:
+                self._rewrite_file()  # Keep the file from growing forever during a long outage.
             else:
-                # Attempt to bail out users that pass a single item that was a non-list.
-                # CONSIDER: Make this a feature and print no message. Just make it work.
-                print("The parameter_list {} is not a list. Converting it to a list for you.".format(parameter_list))
-                message_dict["payload"] = [parameter_list]
-        message = json.dumps(message_dict)
-        self.client.publish(self.publish_topic_name, message)
-
-    # noinspection PyUnusedLocal
-    def _on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print(" ... Connected!")
-        else:
-            print(" ... Error!!!")
-            exit()
+                self._write_entry(entry)
+                self._file.flush()
 
-        print("Publishing to topic:", self.publish_topic_name)
-        self.client.on_subscribe = self._on_subscribe
+    def take_all(self):
+        """
+        Removes and returns every entry that has not expired yet, oldest first.
 
-        # Subscribe to topic(s)
-        self.client.subscribe(self.subscription_topic_name)
+        Type hints:
+          :rtype: list of tuple
+        """
+        now = time.time()
+        entries = [entry for entry in self.entries if entry[1] is None or entry[1] > now]
+        self.dropped_expired += len(self.entries) - len(entries)
+        self.flushed += len(entries)
+        self.entries.clear()
+        if self._file:
+            self._rewrite_file()
+        return entries
 
-    # noinspection PyUnusedLocal
-    def _on_subscribe(self, client, userdata, mid, granted_qos):
-        print("Subscribed to topic:", self.subscription_topic_name)
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
 
-    # noinspection PyUnusedLocal
-    def _on_message(self, client, userdata, msg):
-        message = msg.payload.decode()
-        # print("Received message:", message)
-        if not self.delegate:
-            print("Missing a delegate")
+    def _load(self):
+        if not os.path.exists(self.path):
             return
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    self.entries.append(tuple(json.loads(line)))
+                except ValueError:
+                    pass  # A half written line from a crash, skip it.
+        while len(self.entries) > self.max_size:
+            self.entries.popleft()
+            self.dropped_overflow += 1
 
-        # Attempt to parse the message and call the appropriate function.
+    def _rewrite_file(self):
+        if self._file:
+            self._file.close()
+        self._file = open(self.path, "w")
+        self._lines_in_file = 0
+        for entry in self.entries:
+            self._write_entry(entry)
+        self._file.flush()
+
+    def _write_entry(self, entry):
         try:
-            message_dict = json.loads(message)
-        except ValueError:
-            print("Unable to decode the received message as JSON")
+            self._file.write(json.dumps(entry) + "\n")
+            self._lines_in_file += 1
+        except TypeError:
+            print("A queued message could not be saved to {} (it is still queued in memory)".format(self.path))
+
+
+class ReorderBuffer(object):
+    """
+    Puts the sequence numbered messages of one topic back in order and drops the duplicates.  A message that
+    arrives ahead of its turn is held until the ones before it arrive, or for at most wait seconds, after which
+    the missing numbers are counted as a gap and skipped.  A skipped message that turns up afterwards is late,
+    and dropped like a duplicate, since the messages after it have already been run.  A number far from the
+    expected one means the sender restarted (its numbers start at a random place), so the buffer starts over.
+    """
+
+    RESTART_DISTANCE = 1 << 16
+
+    def __init__(self, wait, release, max_held=256, remembered=1024):
+        """
+        release is called with each message, in order, but never while the buffer's lock is held (so a slow
+        release doesn't hold up the thread adding the next message, and can't deadlock with it).  At most max_held
+        messages are held (the oldest gap is skipped right away when there are more), and the last remembered
+        skipped numbers are kept to tell late messages from duplicates.
+
+        Type hints:
+          :type wait: float
+          :type release: callable
+          :type max_held: int
+          :type remembered: int
+        """
+        self.wait = wait
+        self.release = release
+        self.max_held = max_held
+        self.lock = threading.RLock()
+        self.expected = None
+        self.held = {}  # Sequence number --> message (None for a message that was dropped before sending it on)
+        self.skipped = collections.deque(maxlen=remembered)
+        self.ready = collections.deque()  # Messages whose turn has come, waiting to be released.
+        self.draining = False  # True while a thread is releasing the ready messages.
+        self.timer = None
+        self.in_order = 0
+        self.reordered = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.late = 0
+        self.restarts = 0
+
+    def add(self, sequence, message):
+        """
+        Releases the message now if it is next, or holds it until its turn.
+
+        Type hints:
+          :type sequence: int
+          :type message: object
+        """
+        with self.lock:
+            self._add(sequence, message)
+        self._drain()
+
+    def _add(self, sequence, message):
+        # Caller must hold self.lock.
+        if self.expected is None or abs(sequence - self.expected) > self.RESTART_DISTANCE:
+            if self.expected is not None:
+                self.restarts += 1
+                self._release_held(skip_gaps=True)
+            self.expected = sequence
+            self.skipped.clear()
+        if sequence < self.expected or sequence in self.held:
+            if sequence in self.skipped:
+                self.late += 1
+            else:
+                self.duplicates += 1
             return
+        if sequence > self.expected:
+            self.held[sequence] = message
+            if len(self.held) > self.max_held:
+                self._skip_gap()
+            elif self.timer is None:
+                self._start_timer()
+            return
+        self.in_order += 1
+        self.expected += 1
+        if message is not None:
+            self.ready.append(message)
+        self._release_held()
+
+    def discard(self, sequence):
+        """Takes the number of a message that was dropped on arrival (coalesced), so it is not waited for."""
+        self.add(sequence, None)
+
+    def stats(self):
+        """
+        Returns the counts of messages that arrived in order, were put back in order, were skipped (gaps), were
+        duplicates or came too late, plus how many are held right now and how often the sender restarted.
+
+        Type hints:
+          :rtype: dict
+        """
+        with self.lock:
+            return {"in_order": self.in_order, "reordered": self.reordered, "gaps": self.gaps,
+                    "duplicates": self.duplicates, "late": self.late, "held": len(self.held),
+                    "restarts": self.restarts}
+
+    def flush(self):
+        """Releases everything held right away, skipping the gaps (for closing)."""
+        with self.lock:
+            self._release_held(skip_gaps=True)
+        self._drain()
+
+    def _release_held(self, skip_gaps=False):
+        # Caller must hold self.lock.
+        while self.held:
+            if self.expected not in self.held:
+                if not skip_gaps:
+                    break
+                self._skip_to(min(self.held))
+            message = self.held.pop(self.expected)
+            self.expected += 1
+            self.reordered += 1
+            if message is not None:
+                self.ready.append(message)
+        if self.timer is not None and not self.held:
+            self.timer.cancel()
+            self.timer = None
+
+    def _skip_to(self, sequence):
+        # Caller must hold self.lock.
+        self.gaps += sequence - self.expected
+        self.skipped.extend(range(max(self.expected, sequence - self.skipped.maxlen), sequence))
+        self.expected = sequence
+
+    def _skip_gap(self):
+        # Caller must hold self.lock.  Gives up on the missing messages in front of the oldest held one.
+        self._skip_to(min(self.held))
+        self._release_held()
+
+    def _start_timer(self):
+        self.timer = threading.Timer(self.wait, self._on_timer)
+        self.timer.daemon = True
+        self.timer.start()
 
-        if "type" not in message_dict:
-            print("Received a messages without a 'type' parameter.")
+    def _on_timer(self):
+        """Gives up on the gap the oldest held message has been waiting behind (runs on the timer thread)."""
+        with self.lock:
+            self.timer = None
+            if self.held:
+                self._skip_gap()
+            if self.held and self.timer is None:
+                self._start_timer()
+        self._drain()
+
+    def _drain(self):
+        """
+        Releases the ready messages, outside the lock.  Only one thread releases at a time (the others leave their
+        messages to it), which keeps them in order.
+        """
+        with self.lock:
+            if self.draining:
+                return
+            self.draining = True
+        while True:
+            with self.lock:
+                if not self.ready:
+                    self.draining = False
+                    return
+                message = self.ready.popleft()
+            try:
+                self.release(message)
+            except Exception as error:
+                print("Releasing a received message raised {}: {}".format(type(error).__name__, error))
+
+
+class RateLimit(object):
+    """
+    A token bucket limiting how quickly messages are sent: rate messages per second on average, with bursts of
+    up to burst messages.  The policy decides what happens to a message that arrives when the bucket is empty:
+      "drop"     - it is thrown away (a call's Future fails with a RateLimitError).
+      "coalesce" - it waits for the next token, and replaces any waiting message of the same method, so only the
+                   newest value gets through.  Calls are never replaced, they wait their turn.
+      "block"    - send_message (or call) sleeps until a token is free, so nothing is lost but the sender slows.
+    The same RateLimit can be given to many clients, each one uses its own copy.
+    """
+
+    POLICIES = ("drop", "coalesce", "block")
+
+    def __init__(self, rate, burst=1, policy="drop"):
+        """
+        Type hints:
+          :type rate: float
+          :type burst: int
+          :type policy: str
+        """
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown rate limit policy {}, choose one of {}".format(policy, self.POLICIES))
+        if rate <= 0 or burst < 1:
+            raise ValueError("A rate limit needs a rate above 0 and a burst of at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.policy = policy
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waiting = []  # (message_dict, send function, drop function) held by the coalesce policy, oldest first.
+        self.timer = None
+        self.passed = 0
+        self.throttled = 0  # Messages that found the bucket empty (whatever happened to them next).
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked_time = 0.0
+
+    def copy(self):
+        """Returns a new RateLimit with the same settings and a full bucket."""
+        return RateLimit(self.rate, self.burst, self.policy)
+
+    def submit(self, message_dict, send, drop):
+        """
+        Passes message_dict to send now, later, or (if the policy drops it) to drop instead.  A held message that
+        a newer one replaces (the coalesce policy) is passed to the drop function it was submitted with.
+
+        Type hints:
+          :type message_dict: dict
+          :type send: callable
+          :type drop: callable
+        """
+        if self.policy == "block":
+            self._submit_blocking(message_dict, send)
             return
-        message_type = message_dict["type"]
-        if hasattr(self.delegate, message_type):
-            method_to_call = getattr(self.delegate, message_type)
-            # Assumes that the user has the parameters correct.
-            if "payload" in message_dict:
-                message_payload = message_dict["payload"]
-                attempted_return = method_to_call(*message_payload)
+        replaced = None
+        with self.lock:
+            if not self.waiting and self._take_token() == 0:
+                self.passed += 1
+                sending = True
             else:
-                attempted_return = method_to_call()
-            if attempted_return:
-                print("The method {} returned a value. That's not really how this library works." +
-                      "The value {} was not magically sent back over".format(message_type, attempted_return))
-        else:
-            print("Attempt to call method {} which was not found.".format(message_type))
+                self.throttled += 1
+                sending = False
+                if self.policy == "drop":
+                    self.dropped += 1
+                else:
+                    replaced = self._hold(message_dict, send, drop)
+        if sending:
+            send(message_dict)
+        elif self.policy == "drop":
+            drop(message_dict)
+        elif replaced is not None:
+            replaced_message_dict, _, replaced_drop = replaced
+            replaced_drop(replaced_message_dict)
 
-    def close(self):
+    def discard(self, message_dict):
         """
-        Close the MQTT client (recommended of course, but does not seem to be required).
+        Takes a held message out of the queue without sending it (because it was sent some other way).  Returns
+        True if it was being held.
+
+        Type hints:
+          :type message_dict: dict
+          :rtype: bool
         """
-        self.delegate = None
-        self.client.loop_stop()
-        self.client.disconnect()
+        with self.lock:
+            for index, (waiting_message_dict, _, _) in enumerate(self.waiting):
+                if waiting_message_dict is message_dict:
+                    del self.waiting[index]
+                    return True
+        return False
+
+    def flush(self):
+        """Sends the messages held by the coalesce policy right away, ignoring the limit."""
+        with self.lock:
+            waiting = self.waiting
+            self.waiting = []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        for message_dict, send, _ in waiting:
+            send(message_dict)
+
+    def stats(self):
+        """
+        Type hints:
+          :rtype: dict
+        """
+        with self.lock:
+            return {"rate": self.rate, "burst": self.burst, "policy": self.policy, "passed": self.passed,
+                    "throttled": self.throttled, "dropped": self.dropped, "coalesced": self.coalesced,
+                    "blocked_time": self.blocked_time, "waiting": len(self.waiting)}
+
+    def _take_token(self):
+        """Takes a token if there is one and returns 0, otherwise returns the seconds until there will be one."""
+        # Caller must hold self.lock.
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def _submit_blocking(self, message_dict, send):
+        started = None
+        while True:
+            with self.lock:
+                wait = self._take_token()
+                if wait == 0:
+                    self.passed += 1
+                    if started is not None:
+                        self.blocked_time += time.monotonic() - started
+                    break
+                if started is None:
+                    self.throttled += 1
+                    started = time.monotonic()
+            time.sleep(wait)
+        send(message_dict)
+
+    def _hold(self, message_dict, send, drop):
+        # Caller must hold self.lock.  Returns the waiting entry that the message replaced, if any.
+        replaced = None
+        if "id" not in message_dict:
+            for index, waiting in enumerate(self.waiting):
+                if waiting[0]["type"] == message_dict["type"] and "id" not in waiting[0]:
+                    replaced = self.waiting.pop(index)
+                    self.coalesced += 1
+                    break
+        self.waiting.append((message_dict, send, drop))
+        if self.timer is None:
+            self._start_timer(self._take_token_wait())
+        return replaced
+
+    def _take_token_wait(self):
+        # Caller must hold self.lock.  The seconds until a token is free, without taking it.
+        now = time.monotonic()
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def _start_timer(self, wait):
+        self.timer = threading.Timer(wait, self._release)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _release(self):
+        """Sends the oldest held message once its token is free (runs on the timer thread)."""
+        with self.lock:
+            self.timer = None
+            if not self.waiting:
+                return
+            wait = self._take_token()
+            if wait == 0:
+                self.passed += 1
+                message_dict, send, _ = self.waiting.pop(0)
+                wait = self._take_token_wait()
+            else:
+                message_dict = send = None
+            if self.waiting:
+                self._start_timer(wait)
+        if send is not None:
+            send(message_dict)
+
+
+class BatchOptions(object):
+    """
+    Batching of sent messages, off by default.  Calls to send_message are held and published together as one
+    framed message once window seconds have passed since the first held call, or once size calls are held
+    (whichever comes first).  A size on its own uses a window of DEFAULT_BATCH_WINDOW.
+    """
+
+    def __init__(self, window=None, size=None):
+        """
+        Type hints:
+          :type window: float | None
+          :type size: int | None
+        """
+        if size is not None and window is None:
+            window = DEFAULT_BATCH_WINDOW
+        self.window = window
+        self.size = size
+
+
+class OfflineOptions(object):
+    """
+    What happens while the client is disconnected.  Up to queue_size messages are queued (in the file queue_path
+    too, if given) and messages older than ttl seconds are dropped instead of sent (None keeps them forever).
+    Reconnect attempts start reconnect_min_delay seconds apart and back off to reconnect_max_delay.
+    """
+
+    def __init__(self, queue_size=1000, queue_path=None, ttl=None, reconnect_min_delay=0.5,
+                 reconnect_max_delay=30.0):
+        """
+        Type hints:
+          :type queue_size: int
+          :type queue_path: str | None
+          :type ttl: float | None
+          :type reconnect_min_delay: float
+          :type reconnect_max_delay: float
+        """
+        self.queue_size = queue_size
+        self.queue_path = queue_path
+        self.ttl = ttl
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+
+
+class CompressionOptions(object):
+    """
+    Encoded messages of at least threshold bytes are compressed with zlib at level (1 is fastest, 9 smallest)
+    when that makes them smaller.  Received messages are always decompressed, whatever the options.
+    """
+
+    def __init__(self, threshold=512, level=1):
+        """
+        Type hints:
+          :type threshold: int
+          :type level: int
+        """
+        self.threshold = threshold
+        self.level = level
+
+
+class RateLimitOptions(object):
+    """
+    methods maps method names to the RateLimit for sending them, and topic limits everything the client sends
+    (after the method's own limit).  See RateLimit for the policies.
+    """
+
+    def __init__(self, methods=None, topic=None):
+        """
+        Type hints:
+          :type methods: dict | None
+          :type topic: RateLimit | None
+        """
+        self.methods = dict(methods or {})
+        self.topic = topic
+
+
+class PriorityOptions(object):
+    """
+    methods maps method names to the priority they run at when the sender did not give one (0 by default,
+    higher runs sooner).  A received call with a priority of at least preempt_priority cancels the waiting calls
+    with a lower priority, and if one of them is already running, calls the delegate method named cancel_method
+    (for example "stop") so it can finish early.  A preempt_priority of None turns preempting off.
+    """
+
+    def __init__(self, methods=None, preempt_priority=None, cancel_method=None):
+        """
+        Type hints:
+          :type methods: dict | None
+          :type preempt_priority: int | None
+          :type cancel_method: str | None
+        """
+        self.methods = dict(methods or {})
+        self.preempt_priority = preempt_priority
+        self.cancel_method = cancel_method
+
+
+class HeartbeatOptions(object):
+    """
+    With interval set, a heartbeat is sent every interval seconds and the other end echoes it back, which
+    measures the round trip time of the link (see MqttClient.heartbeat_stats).  With watchdog_timeout set,
+    hearing nothing from the other end (no heartbeat and no message) for watchdog_timeout seconds cancels the
+    waiting calls and calls the delegate method named watchdog_method (for example "stop"), once per silence.
+    """
+
+    def __init__(self, interval=None, watchdog_timeout=None, watchdog_method=None):
+        """
+        Type hints:
+          :type interval: float | None
+          :type watchdog_timeout: float | None
+          :type watchdog_method: str | None
+        """
+        self.interval = interval
+        self.watchdog_timeout = watchdog_timeout
+        self.watchdog_method = watchdog_method
+
+
+class OrderingOptions(object):
+    """
+    With sequence_numbers on, every message sent gets the next number of its topic ("ord").  With reorder_wait
+    set, received messages that carry one are run in order and without duplicates, a message that arrived early
+    waiting at most reorder_wait seconds for the ones before it (see ReorderBuffer).
+    """
+
+    def __init__(self, sequence_numbers=False, reorder_wait=None):
+        """
+        Type hints:
+          :type sequence_numbers: bool
+          :type reorder_wait: float | None
+        """
+        self.sequence_numbers = sequence_numbers
+        self.reorder_wait = reorder_wait
+
+
+def _is_str_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _is_hello_payload(payload):
+    """
+    Returns True if payload is a valid hello payload: [codec names, method names, reply requested].
+
+    Type hints:
+      :type payload: object
+      :rtype: bool
+    """
+    return (isinstance(payload, list) and len(payload) == 3 and _is_str_list(payload[0]) and
+            _is_str_list(payload[1]) and isinstance(payload[2], bool))
+
+
+def _is_heartbeat_payload(payload):
+    """
+    Returns True if payload is a valid heartbeat payload: [send time (a finite number), echoed].
+
+    Type hints:
+      :type payload: object
+      :rtype: bool
+    """
+    return (isinstance(payload, list) and len(payload) == 2 and not isinstance(payload[0], bool) and
+            isinstance(payload[0], (int, float)) and math.isfinite(payload[0]) and isinstance(payload[1], bool))
+
+
+class MqttClient(object):
+    """Helper class to make it easier to work with MQTT subscriptions and publications."""
+
+    def __init__(self, delegate=None, codec="json", allowed_methods=None, denied_methods=None,
+                 executor="inline", workers=4, max_queue=None, method_lanes=None, coalesce_methods=None,
+                 timing=False, record_path=None, clock=None, batching=None, offline=None, compression=None,
+                 rate_limits=None, priorities=None, heartbeat=None, ordering=None, paho_client=None):
+        """
+        Constructs the MQTT client and optionally connects a delegate object for message Rx.
+
+        Notice that the delegate is optional.
+
+        The codec is the name of the message format this client would like to send ("json" or "binary").
+        Anything other than json is only used once the other end agrees to it (see the module docstring).
+
+        The allowed_methods and denied_methods lists limit which delegate methods the other end may call
+        (None means all public methods are allowed and none are denied).
+
+        The executor decides which thread runs the delegate methods: "inline" (the MQTT network thread, the
+        default), "serial" (one worker thread) or "pool" (workers threads), or it can be an executor object.
+        max_queue limits how many calls may wait for it.  method_lanes maps method names to "inline", "default" or
+        the name of a serial lane.
+
+        coalesce_methods names the methods (sent or received) for which only the newest pending call is kept.
+
+        With timing on, sent messages carry their send time and a sequence number and the times of received
+        messages are recorded (see stats).
+
+        Every message sent and received is appended to the file record_path (if given), which mqtt_replay can
+        play back into a delegate later.
+
+        clock is the function giving the wall clock time used for clock synchronization and execute_at
+        (time.time if None).
+
+        The other features are set with option objects, None meaning the defaults of each: batching (BatchOptions,
+        off by default), offline (OfflineOptions, the offline queue and reconnecting), compression
+        (CompressionOptions, off by default), rate_limits (RateLimitOptions), priorities (PriorityOptions,
+        priorities and preempting), heartbeat (HeartbeatOptions, heartbeats and the watchdog) and ordering
+        (OrderingOptions, sequence numbers and reordering).  For example
+            com.MqttClient(robot, heartbeat=com.HeartbeatOptions(watchdog_timeout=1.5, watchdog_method="stop"))
+
+        paho_client is only for sharing one connection between clients (see MultiRobotClient), normally the
+        MqttClient makes its own.
+
+        Type hints:
+          :type codec: str
+          :type allowed_methods: list of str | None
+          :type denied_methods: list of str | None
+          :type executor: str | InlineExecutor | QueueExecutor
+          :type workers: int
+          :type max_queue: int | None
+          :type method_lanes: dict | None
+          :type coalesce_methods: list of str | None
+          :type timing: bool
+          :type record_path: str | None
+          :type clock: callable | None
+          :type batching: BatchOptions | None
+          :type offline: OfflineOptions | None
+          :type compression: CompressionOptions | None
+          :type rate_limits: RateLimitOptions | None
+          :type priorities: PriorityOptions | None
+          :type heartbeat: HeartbeatOptions | None
+          :type ordering: OrderingOptions | None
+          :type paho_client: mqtt.Client | None
+        """
+        batching = batching or BatchOptions()
+        offline = offline or OfflineOptions()
+        compression = compression or CompressionOptions(threshold=None)
+        rate_limits = rate_limits or RateLimitOptions()
+        priorities = priorities or PriorityOptions()
+        heartbeat = heartbeat or HeartbeatOptions()
+        ordering = ordering or OrderingOptions()
+        self.client = paho_client or mqtt.Client()
+        self.online = False
+        self.offline_queue = OfflineQueue(offline.queue_size, offline.queue_path)
+        self.offline_ttl = offline.ttl
+        self.reconnect_min_delay = offline.reconnect_min_delay
+        self.reconnect_max_delay = offline.reconnect_max_delay
+        self._reconnect_attempt = 0  # Failed attempts since the last connection, sets the backoff delay.
+        self.reconnect_attempts = 0
+        self._offline_lock = threading.RLock()
+        self._outage_started = None  # Not an outage until we have been connected once.
+        self.outages = 0
+        self.total_outage = 0.0
+        self.longest_outage = 0.0
+        self._owns_executor = isinstance(executor, str)  # An executor object passed in is shut down by its owner.
+        if isinstance(executor, str):
+            self.executor = create_executor("default", executor, workers, max_queue)
+        else:
+            self.executor = executor
+        self.lanes = {"inline": InlineExecutor(), "default": self.executor}
+        self.method_executors = {}
+        for method_name, lane_name in (method_lanes or {}).items():
+            if lane_name not in self.lanes:
+                self.lanes[lane_name] = create_executor(lane_name, "serial", max_queue=max_queue)
+            self.method_executors[method_name] = self.lanes[lane_name]
+        self.allowed_methods = allowed_methods
+        self.denied_methods = denied_methods
+        self.coalesce_methods = set(coalesce_methods or [])
+        self.coalesced_sends = collections.Counter()
+        self.coalesced_receives = collections.Counter()
+        self.dispatch_table = DispatchTable()
+        self._delegate = None
+        self.delegate = delegate
+        self.subscription_topic_name = None
+        self.publish_topic_name = None
+        self.batch_window = batching.window
+        self.batch_size = batching.size
+        self._batch = []
+        self._batch_lock = threading.Lock()
+        self._batch_timer = None
+        self._batch_expires_at = None
+        self.codecs = mqtt_codecs.create_codecs()
+        if codec not in self.codecs:
+            raise ValueError("Unknown codec {}, choose one of {}".format(codec, sorted(self.codecs)))
+        self.preferred_codec = codec
+        self.codec = self.codecs["json"]  # The codec used for sending, until the other end agrees to another.
+        self.remote_methods = None
+        self.remote_signatures = None  # Filled in once by describe_remote.
+        self._call_ids = itertools.count()
+        self._call_prefix = uuid.uuid4().hex[:8]  # Keeps our call ids apart from other clients on the same topic.
+        self._pending_calls = {}
+        self._pending_calls_lock = threading.Lock()
+        self.timing = timing
+        self.timings = mqtt_stats.MessageTimings()
+        self._sequence_numbers = itertools.count()
+        self._stats_dumper = None
+        self.compress_threshold = compression.threshold
+        self.compress_level = compression.level
+        self.compression = mqtt_stats.CompressionStats()
+        self.telemetry_streams = {}  # Stream name --> mqtt_telemetry.TelemetryStream
+        self.telemetry_receivers = {}  # Stream name --> mqtt_telemetry.TelemetryReceiver
+        self.rate_limits = {method_name: limit.copy() for method_name, limit in rate_limits.methods.items()}
+        self.topic_rate_limit = rate_limits.topic.copy() if rate_limits.topic is not None else None
+        self._limited = collections.OrderedDict()  # Number --> (message_dict, expires_at) inside a rate limit.
+        self._limited_order = itertools.count()
+        self._limited_lock = threading.Lock()
+        self.method_priorities = dict(priorities.methods)
+        self.preempt_priority = priorities.preempt_priority
+        self.cancel_method = priorities.cancel_method
+        self.preemptions = 0
+        self.preempted_calls = collections.Counter()  # Method name --> waiting calls cancelled by a preemption.
+        self.interruptions = 0
+        self.recorder = mqtt_replay.ReplayRecorder(record_path) if record_path else None
+        self.clock = clock or time.time
+        self.clock_sync = mqtt_clock.ClockSync()
+        self.scheduled_calls = mqtt_clock.ScheduledCalls(self.clock)
+        self._clock_sync_stop = None
+        self.heartbeat_interval = heartbeat.interval
+        self.heartbeats_sent = 0
+        self.heartbeats_echoed = 0
+        self.round_trip_times = mqtt_stats.Histogram()
+        self.last_round_trip_time = None
+        self.watchdog_timeout = heartbeat.watchdog_timeout
+        self.watchdog_method = heartbeat.watchdog_method
+        self.watchdog_trips = 0
+        self._last_heard = None  # time.monotonic() of the last message from the other end, None until the first.
+        self._heartbeat_stop = threading.Event()
+        self.sequence_numbers = ordering.sequence_numbers
+        self._topic_sequence_numbers = {}  # Topic --> itertools.count, starting at a random number.
+        self.reorder_wait = ordering.reorder_wait
+        self.reorder_buffers = {}  # Topic --> ReorderBuffer
+        if heartbeat.interval is not None:
+            threading.Thread(target=self._heartbeat_loop, args=(heartbeat.interval,), name="mqtt-heartbeat",
+                             daemon=True).start()
+        if heartbeat.watchdog_timeout is not None:
+            threading.Thread(target=self._watchdog_loop, args=(heartbeat.watchdog_timeout,),
+                             name="mqtt-watchdog", daemon=True).start()
+
+    @property
+    def delegate(self):
+        """The object whose methods are called when messages arrive (None if this client only sends)."""
+        return self._delegate
+
+    @delegate.setter
+    def delegate(self, delegate):
+        self._delegate = delegate
+        self.refresh_dispatch_table()
+
+    def refresh_dispatch_table(self):
+        """
+        Looks up the delegate methods again.  This happens automatically when the delegate is set, so it is only
+        needed if methods were added to the delegate object afterwards.
+        """
+        self.dispatch_table = DispatchTable(self._delegate, self.allowed_methods, self.denied_methods,
+                                            self.coalesce_methods)
+
+    def connect_to_ev3(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER,
+                       mqtt_broker_port=1883):
+        """
+        Code running on the PC should use this command to connect to the EV3 robot.
+        Connects to the MQTT broker and begins listening for messages from the EV3.
+
+        Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_number: int
+          :type mqtt_broker_port: int
+        """
+        self.connect("msg4pc", "msg4ev3", mqtt_broker_ip_address, lego_robot_number, mqtt_broker_port)
+
+    def connect_to_pc(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER,
+                      mqtt_broker_port=1883):
+        """
+        Code running on the EV3 should use this command to connect to the student PC.
+        Connects to the MQTT broker and begins listening for messages from the PC.
+
+        Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_number: int
+          :type mqtt_broker_port: int
+        """
+        self.connect("msg4ev3", "msg4pc", mqtt_broker_ip_address, lego_robot_number, mqtt_broker_port)
+
+    def connect(self, subscription_suffix, publish_suffix,
+                mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER,
+                mqtt_broker_port=1883):
+        """
+        Connect this MQTT client to the broker, note that connect_to_ev3 and connect_to_pc call this method.
+        This connect method is the most generic allowing callers to set the subscription and publish topics.
+        The lego_robot number is added to both the subscription and publish topics (as shown in the code below).
+
+        Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).  To test
+        without the Rose-Hulman broker, run the broker in mqtt_broker.py and connect to "localhost" (using
+        mqtt_broker_port if it is not on the usual port 1883).
+
+        Type hints:
+          :type subscription_suffix: str
+          :type publish_suffix: str
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_number: int
+          :type mqtt_broker_port: int
+        """
+        self._set_topics(subscription_suffix, publish_suffix, lego_robot_number)
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_connect_fail = self._on_connect_fail
+        self._schedule_reconnect()
+
+        # paho's network thread makes the first connection attempt and reconnects whenever the connection drops.
+        self.client.connect_async(mqtt_broker_ip_address, mqtt_broker_port, 60)
+        print("Connecting to mqtt broker {}".format(mqtt_broker_ip_address), end="")
+        self.client.loop_start()
+
+    def _set_topics(self, subscription_suffix, publish_suffix, lego_robot_number):
+        """Sets the topic names and the paho callbacks that go with them (the first part of connect)."""
+        lego_name = "lego" + str(lego_robot_number).zfill(2)
+        self.subscription_topic_name = lego_name + "/" + subscription_suffix
+        self.publish_topic_name = lego_name + "/" + publish_suffix
+
+        # Callback for when the connection to the broker is complete.
+        self.client.on_connect = self._on_connect
+        self.client.message_callback_add(self.subscription_topic_name, self._on_message)
+        self.client.message_callback_add(self.subscription_topic_name + REPLY_TOPIC_SUFFIX, self._on_reply)
+        for name, receiver in self.telemetry_receivers.items():
+            self.client.message_callback_add(self._telemetry_topic(name), receiver.on_message)
+
+    def send_message(self, function_name, parameter_list=None, ttl=None, priority=None, execute_at=None):
+        """
+        Sends a message to the MQTT broker using the publish_topic_name that was set by the connect method.
+
+        What comes in:
+          function_name: the name of the method that you want to call (as a string) on the other end's delegate
+          parameter_list: a List containing the arguments to that method call. Note: even single arguments should be
+                          placed into a list.  Also objects in the list will be transferred using json (or the binary
+                          codec), so objects in the list must be serializable (int, float, string, lists, etc all
+                          work fine but nothing fancy)
+          ttl: seconds after which the message is dropped if it could not be sent yet (None uses the ttl of the
+               OfflineOptions given to the constructor)
+          priority: how urgent the call is on the other end (higher runs sooner, see PriorityOptions).  None
+                    leaves it to the other end.  A priority above 0 also sends any batch right away.
+          execute_at: the time (on this computer's clock, like time.time()) the method should run on the other
+                      end, which needs the clocks synchronized first (see sync_clock).  None runs it on arrival.
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list of object | None
+          :type ttl: float | None
+          :type priority: int | None
+          :type execute_at: float | None
+        """
+        message_dict = {"type": function_name}
+        if parameter_list:
+            if isinstance(parameter_list, collections.abc.Iterable):
+                message_dict["payload"] = parameter_list
+            else:
+                # Attempt to bail out users that pass a single item that was a non-list.
+                # CONSIDER: Make this a feature and print no message. Just make it work.
+                print("The parameter_list {} is not a list. Converting it to a list for you.".format(parameter_list))
+                message_dict["payload"] = [parameter_list]
+        if priority is not None:
+            message_dict["pri"] = priority
+        if execute_at is not None:
+            message_dict["at"] = self._remote_time(execute_at)
+        if self.timing:
+            self._stamp(message_dict)
+        if ttl is None:
+            ttl = self.offline_ttl
+        self._send_limited(message_dict, None if ttl is None else time.time() + ttl)
+
+    def call(self, function_name, parameter_list=None, timeout=None, priority=None, execute_at=None):
+        """
+        Like send_message, but returns a Future that gets the return value of the method on the other end (or
+        a RemoteCallError if it raised an exception, or a TimeoutError if no answer came within timeout seconds).
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list of object | None
+          :type timeout: float | None
+          :type priority: int | None
+          :type execute_at: float | None
+          :rtype: concurrent.futures.Future
+        """
+        call_id, future = self._start_call(function_name, timeout)
+        message_dict = {"type": function_name, "id": call_id}
+        if parameter_list is not None:
+            message_dict["payload"] = list(parameter_list)
+        if priority is not None:
+            message_dict["pri"] = priority
+        if execute_at is not None:
+            message_dict["at"] = self._remote_time(execute_at)
+        if self.timing:
+            self._stamp(message_dict)
+        self._send_limited(message_dict, None if timeout is None else time.time() + timeout)
+        return future
+
+    def _start_call(self, function_name, timeout):
+        """Returns the id and Future of a new pending call, which fails with a TimeoutError after timeout seconds."""
+        call_id = "{}:{}".format(self._call_prefix, next(self._call_ids))
+        future = concurrent.futures.Future()
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._fail_call, [call_id, concurrent.futures.TimeoutError(
+                "No reply to {} within {} seconds".format(function_name, timeout))])
+            timer.daemon = True
+        with self._pending_calls_lock:
+            self._pending_calls[call_id] = (future, timer)
+        if timer:
+            timer.start()
+        return call_id, future
+
+    def _send_limited(self, message_dict, expires_at):
+        """
+        Sends a message dictionary through its method's rate limit and the topic rate limit (if any).  Each
+        message that goes into a limit is numbered, so _deliver can keep them in order.
+        """
+        method_limit = self.rate_limits.get(message_dict["type"])
+        if method_limit is None and self.topic_rate_limit is None:
+            if self.rate_limits:
+                self._deliver(None, message_dict, expires_at)
+            else:
+                self._send(message_dict, expires_at)
+            return
+        with self._limited_lock:
+            order = next(self._limited_order)
+            self._limited[order] = (message_dict, expires_at)
+
+        def send(limited_message_dict):
+            self._deliver(order, limited_message_dict, expires_at)
+
+        def drop(limited_message_dict):
+            with self._limited_lock:
+                held = self._limited.pop(order, None)
+            if held is not None:  # Otherwise it was already sent ahead of a newer message.
+                self._drop_limited(limited_message_dict)
+
+        def send_through_topic_limit(limited_message_dict):
+            self.topic_rate_limit.submit(limited_message_dict, send, drop)
+
+        if method_limit is None:
+            send_through_topic_limit(message_dict)
+        else:
+            method_limit.submit(message_dict, send if self.topic_rate_limit is None else send_through_topic_limit,
+                                drop)
+
+    def _deliver(self, order, message_dict, expires_at):
+        """
+        Sends a message that got through its rate limits (order is the number _send_limited gave it, None for a
+        message with no limit, which is newer than all of them).  The older messages that a limit still holds
+        are taken out of their limits and sent first, so for example a drive waiting for a token can't go out
+        after a later stop.
+        """
+        with self._limited_lock:
+            if order is not None and self._limited.pop(order, None) is None:
+                return  # Already sent, ahead of a newer message.
+            older = []
+            while self._limited:
+                held_order = next(iter(self._limited))
+                if order is not None and held_order > order:
+                    break
+                older.append(self._limited.pop(held_order))
+            limits = list(self.rate_limits.values()) + [self.topic_rate_limit]
+            for held_message_dict, held_expires_at in older:
+                for limit in limits:
+                    if limit is not None and limit.discard(held_message_dict):
+                        break
+                self._send(held_message_dict, held_expires_at)
+            self._send(message_dict, expires_at)
+
+    def _drop_limited(self, message_dict):
+        if "id" in message_dict:
+            self._fail_call(message_dict["id"], RateLimitError(
+                "The call to {} was dropped by a rate limit".format(message_dict["type"])))
+
+    def rate_limit_stats(self):
+        """
+        Returns the counts of each rate limit: {"methods": {method name: counts}, "topic": counts or None}.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {"methods": {method_name: limit.stats() for method_name, limit in self.rate_limits.items()},
+                "topic": self.topic_rate_limit.stats() if self.topic_rate_limit is not None else None}
+
+    def sync_clock(self, samples=8, timeout=2.0):
+        """
+        Measures the offset to the other end's clock with samples time requests, one after another, and returns
+        the estimate (seconds the other clock is ahead of ours).  Raises a TimeoutError if a request got no answer
+        within timeout seconds, or a RemoteCallError while offline.  Don't call it from a delegate method running
+        inline.
+
+        Type hints:
+          :type samples: int
+          :type timeout: float
+          :rtype: float
+        """
+        for _ in range(samples):
+            answered = []
+            t0 = self.clock()
+            future = self._request_time(t0, timeout)
+            future.add_done_callback(lambda done: answered.append(self.clock()))  # t3, on the network thread.
+            _, t1, t2 = future.result()
+            self.clock_sync.add_sample(t0, t1, t2, answered[0] if answered else self.clock())
+        return self.clock_sync.offset
+
+    def _request_time(self, t0, timeout):
+        """
+        Sends a time request and returns the Future of its answer.  Like a heartbeat it is published right away,
+        past any batch window or rate limit: those would only delay the request's half of the round trip, which
+        skews the offset estimate.  While offline the Future fails with a RemoteCallError at once.
+        """
+        call_id, future = self._start_call(TIME_MESSAGE_TYPE, timeout)
+        request = {"type": TIME_MESSAGE_TYPE, "id": call_id, "payload": [t0]}
+        if not self.online or self.client.publish(self.publish_topic_name, self._encode_frame(request)).rc != \
+                mqtt.MQTT_ERR_SUCCESS:
+            self._fail_call(call_id, RemoteCallError("Offline, the time request was not sent"))
+        return future
+
+    def start_clock_sync(self, interval=30.0, samples=4, timeout=2.0):
+        """
+        Keeps the clock offset up to date by calling sync_clock every interval seconds on a background thread
+        (the first time right away).  Failed requests (while offline, say) are skipped.
+
+        Type hints:
+          :type interval: float
+          :type samples: int
+          :type timeout: float
+        """
+        if self._clock_sync_stop is not None:
+            self._clock_sync_stop.set()
+        stop = self._clock_sync_stop = threading.Event()
+
+        def keep_in_sync():
+            while not stop.is_set():
+                try:
+                    self.sync_clock(samples, timeout)
+                except (concurrent.futures.TimeoutError, RemoteCallError, RateLimitError):
+                    pass
+                stop.wait(interval)
+
+        threading.Thread(target=keep_in_sync, name="mqtt-clock-sync", daemon=True).start()
+
+    @property
+    def clock_offset(self):
+        """Seconds the other end's clock is ahead of ours (None until sync_clock has run)."""
+        return self.clock_sync.offset
+
+    def clock_stats(self):
+        """
+        Returns {"sync": the offset, delay and jitter of the clock synchronization (see mqtt_clock.ClockSync),
+        "scheduled": how many received calls were scheduled with execute_at, and how late they ran}.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {"sync": self.clock_sync.stats(), "scheduled": self.scheduled_calls.stats()}
+
+    def _remote_time(self, local_time):
+        """Converts a time on our clock to the other end's clock."""
+        offset = self.clock_sync.offset
+        if offset is None:
+            raise RuntimeError("execute_at needs the clocks synchronized first, call sync_clock or start_clock_sync")
+        return local_time + offset
+
+    def describe_remote(self, timeout=5.0):
+        """
+        Asks the other end for the names and parameter counts of its delegate's methods, the first time only.
+        Returns {method name: [minimum, maximum (None for *args)]}.  Raises a TimeoutError if no answer came
+        within timeout seconds, or a RemoteCallError if the other end is too old to answer.  Don't call it from
+        a delegate method running inline, the answer could never arrive.
+
+        Type hints:
+          :type timeout: float
+          :rtype: dict
+        """
+        if self.remote_signatures is None:
+            self.remote_signatures = self.call(DESCRIBE_MESSAGE_TYPE, timeout=timeout).result()
+        return self.remote_signatures
+
+    def remote_proxy(self, delegate_class=None, timeout=5.0):
+        """
+        Returns a RemoteProxy whose methods send messages to the other end.  The methods come from delegate_class
+        if it is given, otherwise they are fetched from the other end (see describe_remote).
+
+        Type hints:
+          :type delegate_class: type | None
+          :type timeout: float
+          :rtype: RemoteProxy
+        """
+        if delegate_class is not None:
+            return RemoteProxy(self, DispatchTable.class_signatures(delegate_class))
+        return RemoteProxy(self, self.describe_remote(timeout))
+
+    def _stamp(self, message_dict):
+        """Adds the send time ("ts", time.time()) and the next sequence number ("seq") to a message dictionary."""
+        message_dict["ts"] = time.time()
+        if not self.sequence_numbers:
+            # Otherwise the timing stats use the "ord" numbers given when published, which have no gaps for the
+            # coalesced messages.  "seq" itself is never reordered: it starts at 0 again when we restart.
+            message_dict["seq"] = next(self._sequence_numbers)
+
+    def _fail_call(self, call_id, error):
+        """Fails the Future of a pending call (if it is still pending)."""
+        with self._pending_calls_lock:
+            future, timer = self._pending_calls.pop(call_id, (None, None))
+        if future is None:
+            return
+        if timer:
+            timer.cancel()
+        future.set_exception(error)
+
+    def _send(self, message_dict, expires_at=None):
+        """
+        Publishes a message dictionary right away, or holds it for the next batch if batching is on.
+        expires_at is the time.time() after which the message should be dropped rather than sent late.
+
+        Type hints:
+          :type message_dict: dict
+          :type expires_at: float | None
+        """
+        if self.batch_window is None:
+            self._publish(message_dict, expires_at)
+            return
+
+        with self._batch_lock:
+            if message_dict["type"] in self.coalesce_methods and "id" not in message_dict:
+                for index, batched_message_dict in enumerate(self._batch):
+                    if batched_message_dict["type"] == message_dict["type"] and "id" not in batched_message_dict:
+                        del self._batch[index]
+                        self.coalesced_sends[message_dict["type"]] += 1
+                        break
+            if not self._batch:
+                self._batch_expires_at = expires_at
+            elif self._batch_expires_at is not None:
+                # A batch is sent (or dropped) as a whole, so it lives as long as its longest lived message.
+                self._batch_expires_at = None if expires_at is None else max(self._batch_expires_at, expires_at)
+            self._batch.append(message_dict)
+            if (self.batch_size is not None and len(self._batch) >= self.batch_size) or message_dict.get("pri", 0) > 0:
+                batch, batch_expires_at = self._take_batch()
+            else:
+                batch = None
+                if self._batch_timer is None:
+                    self._batch_timer = threading.Timer(self.batch_window, self.flush)
+                    self._batch_timer.daemon = True
+                    self._batch_timer.start()
+        if batch:
+            self._publish(batch, batch_expires_at)
+
+    def flush(self):
+        """
+        Publishes any calls that are being held for batching right now (does nothing if there are none).
+        """
+        with self._batch_lock:
+            batch, batch_expires_at = self._take_batch()
+        if batch:
+            self._publish(batch, batch_expires_at)
+
+    def _take_batch(self):
+        # Caller must hold self._batch_lock.
+        batch = self._batch
+        self._batch = []
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        if len(batch) == 1:
+            return batch[0], self._batch_expires_at  # A batch of one goes out as a plain message.
+        return batch, self._batch_expires_at
+
+    def _publish(self, message, expires_at=None, topic=None):
+        """
+        Publishes a message dictionary, or a list of them (a batch frame), using the current codec.  If the
+        client is offline the message goes into the offline queue instead.  The topic defaults to the
+        publish_topic_name.
+
+        Type hints:
+          :type message: dict | list of dict
+          :type expires_at: float | None
+          :type topic: str | None
+        """
+        if self.sequence_numbers and topic is None:
+            self._number(message)
+        frame = self._encode_frame(message)  # Encode even when offline, so bad parameters are reported right away.
+        topic = topic or self.publish_topic_name
+        if self.recorder is not None:
+            self.recorder.record_sent(topic, frame)
+        with self._offline_lock:
+            if self.online and self.client.publish(topic, frame).rc == mqtt.MQTT_ERR_SUCCESS:
+                return
+            self.offline_queue.put(topic, message, expires_at)
+
+    def _number(self, message):
+        """
+        Gives a message (or each message of a batch) the next sequence number of the publish topic.  Numbering
+        when publishing, rather than in send_message, leaves no gaps for the messages coalesced or dropped before.
+        """
+        numbers = self._topic_sequence_numbers.get(self.publish_topic_name)
+        if numbers is None:
+            numbers = itertools.count(random.randrange(1 << 30))
+            self._topic_sequence_numbers[self.publish_topic_name] = numbers
+        for message_dict in (message if isinstance(message, list) else [message]):
+            message_dict["ord"] = next(numbers)
+
+    def _flush_offline_queue(self):
+        """Sends the messages queued while offline, in order, then goes back online."""
+        with self._offline_lock:
+            for _, _, topic, message in self.offline_queue.take_all():
+                self.client.publish(topic, self._encode_frame(message))
+            self.online = True
+
+    def _encode_frame(self, message):
+        """
+        Encodes a message (or batch) with the current codec, compressing it if it is at least compress_threshold
+        bytes long and compression makes it smaller.
+
+        Type hints:
+          :type message: dict | list of dict
+          :rtype: bytes
+        """
+        if type(message) is dict and len(message) == 2 and "payload" in message:
+            frame = self.codec.encode_call(message["type"], message["payload"])
+        else:
+            frame = self.codec.encode(message)
+        if self.compress_threshold is None or len(frame) < self.compress_threshold:
+            return frame
+        started = time.perf_counter()
+        compressed = mqtt_codecs.compress_frame(frame, self.compress_level)
+        seconds = time.perf_counter() - started
+        message_type = message.get("type") if isinstance(message, dict) else "(batch)"
+        if len(compressed) >= len(frame):
+            self.compression.record(message_type, "skipped", len(frame), len(frame), seconds)
+            return frame
+        self.compression.record(message_type, "compressed", len(frame), len(compressed), seconds)
+        return compressed
+
+    def _decode_frame(self, data):
+        """
+        Decodes a received frame made by any codec, decompressing it first if needed.  Raises ValueError if it
+        can't be decoded.
+
+        Type hints:
+          :type data: bytes
+          :rtype: dict | list of dict
+        """
+        if not mqtt_codecs.is_compressed(data):
+            return self.codecs[mqtt_codecs.codec_name_for_frame(data)].decode(data)
+        started = time.perf_counter()
+        frame = mqtt_codecs.decompress_frame(data)
+        seconds = time.perf_counter() - started
+        message = self.codecs[mqtt_codecs.codec_name_for_frame(frame)].decode(frame)
+        message_type = message.get("type") if isinstance(message, dict) else "(batch)"
+        self.compression.record(message_type, "decompressed", len(frame), len(data), seconds)
+        return message
+
+    def compression_stats(self):
+        """
+        Returns the compression ratio and the time spent compressing (and decompressing) per message type, see
+        mqtt_stats.CompressionStats.
+
+        Type hints:
+          :rtype: dict
+        """
+        return self.compression.stats()
+
+    def link_stats(self):
+        """
+        Returns metrics about the connection: the offline queue (size and dropped messages) and the outages
+        (count, current, total and longest duration in seconds).
+
+        Type hints:
+          :rtype: dict
+        """
+        with self._offline_lock:
+            current_outage = 0.0
+            if not self.online and self._outage_started is not None:
+                current_outage = time.monotonic() - self._outage_started
+            return {"online": self.online, "queued": len(self.offline_queue),
+                    "max_queued": self.offline_queue.max_size,
+                    "dropped_overflow": self.offline_queue.dropped_overflow,
+                    "dropped_expired": self.offline_queue.dropped_expired,
+                    "flushed": self.offline_queue.flushed, "outages": self.outages,
+                    "current_outage": current_outage, "total_outage": self.total_outage + current_outage,
+                    "longest_outage": max(self.longest_outage, current_outage),
+                    "reconnect_attempts": self.reconnect_attempts}
+
+    def send_heartbeat(self):
+        """
+        Sends one heartbeat right away.  With a HeartbeatOptions interval set this happens on a background thread,
+        which keeps going even if the program's main loop hangs.  To have the other end's watchdog notice a frozen
+        GUI too, leave the interval as None and call this from the GUI loop instead (for example with
+        root.after).  Heartbeats are never queued while offline, a late one would only hide the outage.
+        """
+        if not self.online or self.publish_topic_name is None:
+            return
+        heartbeat = {"type": HEARTBEAT_MESSAGE_TYPE, "payload": [time.perf_counter(), False]}
+        if self.client.publish(self.publish_topic_name, self.codecs["json"].encode(heartbeat)).rc == \
+                mqtt.MQTT_ERR_SUCCESS:
+            self.heartbeats_sent += 1
+
+    def heartbeat_stats(self):
+        """
+        Returns {"sent", "echoed", "round_trip", "last_round_trip", "watchdog_trips", "silent_for"}: how many
+        heartbeats were sent and came back, the Histogram summary of their round trip times (in seconds), the
+        latest one, how many times the watchdog went off, and how long it has been since the other end was last
+        heard from (None before the first message).
+
+        Type hints:
+          :rtype: dict
+        """
+        last_heard = self._last_heard
+        return {"sent": self.heartbeats_sent, "echoed": self.heartbeats_echoed,
+                "round_trip": self.round_trip_times.summary(), "last_round_trip": self.last_round_trip_time,
+                "watchdog_trips": self.watchdog_trips,
+                "silent_for": None if last_heard is None else time.monotonic() - last_heard}
+
+    def _on_heartbeat(self, sent_at, echoed):
+        """Echoes a heartbeat from the other end straight back, or records the round trip of one of ours."""
+        if echoed:
+            self.last_round_trip_time = time.perf_counter() - sent_at
+            self.round_trip_times.add(self.last_round_trip_time)
+            self.heartbeats_echoed += 1
+        elif self.online:
+            echo = {"type": HEARTBEAT_MESSAGE_TYPE, "payload": [sent_at, True]}
+            self.client.publish(self.publish_topic_name, self.codecs["json"].encode(echo))
+
+    def _heartbeat_loop(self, interval):
+        while not self._heartbeat_stop.wait(interval):
+            self.send_heartbeat()
+
+    def _watchdog_loop(self, timeout):
+        tripped = False
+        while not self._heartbeat_stop.wait(min(timeout / 4, 0.1)):
+            last_heard = self._last_heard
+            if last_heard is None:
+                continue  # Not armed until the other end has been heard from once.
+            silent = time.monotonic() - last_heard >= timeout
+            if silent and not tripped:
+                self._on_link_lost(timeout)
+            tripped = silent
+
+    def _on_link_lost(self, timeout):
+        """Called by the watchdog: cancels the waiting calls and calls the watchdog_method of the delegate."""
+        self.watchdog_trips += 1
+        print("Nothing heard from the other end for {} seconds".format(timeout))
+        for lane in list(self.lanes.values()):
+            cancel_below = getattr(lane, "cancel_below", None)
+            if cancel_below is not None:
+                cancelled, _ = cancel_below(float("inf"), self)
+                for invocation in cancelled:
+                    invocation.cancel("Cancelled by the watchdog, the link was lost")
+        if self.watchdog_method is None:
+            return
+        method = getattr(self.delegate, self.watchdog_method, None)
+        if method is None:
+            print("The delegate has no {} method for the watchdog".format(self.watchdog_method))
+            return
+        try:
+            method()
+        except Exception as error:
+            print("The {} method raised {}: {}".format(self.watchdog_method, type(error).__name__, error))
+
+    def _schedule_reconnect(self):
+        """
+        Sets how long paho waits before its next reconnect attempt: doubling with each failed attempt (up to
+        reconnect_max_delay) and randomly shortened by up to half so many robots don't retry in lock step.
+        """
+        delay = min(self.reconnect_max_delay, self.reconnect_min_delay * 2 ** min(self._reconnect_attempt, 30))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.client.reconnect_delay_set(delay, delay)
+        return delay
+
+    # noinspection PyUnusedLocal
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print(" ... Connected!")
+        else:
+            print(" ... Error!!! The broker refused the connection ({})".format(mqtt.connack_string(rc)))
+            self._reconnect_attempt += 1
+            self.reconnect_attempts += 1
+            self._schedule_reconnect()
+            return
+        self._reconnect_attempt = 0
+        self._schedule_reconnect()
+        self._subscribe()
+        self._link_up()
+
+    def _subscribe(self):
+        """Subscribes to our topics, every time the connection is made (the broker forgets them when it drops)."""
+        print("Publishing to topic:", self.publish_topic_name)
+        self.client.on_subscribe = self._on_subscribe
+
+        # Subscribe to topic(s)
+        self.client.subscribe([(self.subscription_topic_name, 0),
+                               (self.subscription_topic_name + REPLY_TOPIC_SUFFIX, 0)] +
+                              [(topic, 0) for topic in self._telemetry_topics()])
+
+    def telemetry_stream(self, name, fields, samples_per_frame=64, max_delay=0.05):
+        """
+        Returns a stream for sending samples quickly (see mqtt_telemetry).  Each field is a (name, struct type
+        code) pair.  Samples are sent samples_per_frame at a time, or max_delay seconds after the first one.
+
+        Type hints:
+          :type name: str
+          :type fields: list of (str, str)
+          :type samples_per_frame: int
+          :type max_delay: float | None
+          :rtype: mqtt_telemetry.TelemetryStream
+        """
+        stream = mqtt_telemetry.TelemetryStream(self, name, fields, samples_per_frame, max_delay)
+        self.telemetry_streams[name] = stream
+        return stream
+
+    def on_telemetry(self, name, fields, callback):
+        """
+        Calls callback with each mqtt_telemetry.TelemetryFrame received on the named stream (the fields must match
+        the sending end).  The callback runs on the MQTT network thread, like an inline delegate method.
+
+        Type hints:
+          :type name: str
+          :type fields: list of (str, str)
+          :type callback: callable
+          :rtype: mqtt_telemetry.TelemetryReceiver
+        """
+        receiver = mqtt_telemetry.TelemetryReceiver(name, fields, callback)
+        self.telemetry_receivers[name] = receiver
+        if self.subscription_topic_name is not None:
+            topic = self._telemetry_topic(name)
+            self.client.message_callback_add(topic, receiver.on_message)
+            if self.online:
+                self.client.subscribe(topic)
+        return receiver
+
+    def telemetry_stats(self):
+        """
+        Returns the counts of every telemetry stream, sent ("sent") and received ("received"), keyed by name.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {"sent": {name: stream.stats() for name, stream in self.telemetry_streams.items()},
+                "received": {name: receiver.stats() for name, receiver in self.telemetry_receivers.items()}}
+
+    def _telemetry_topic(self, name):
+        return self.subscription_topic_name + mqtt_telemetry.TELEMETRY_TOPIC_PART + name
+
+    def _telemetry_topics(self):
+        return [self._telemetry_topic(name) for name in self.telemetry_receivers]
+
+    def _link_up(self):
+        """Called once connected: offers our codec to the other end and sends what was queued while offline."""
+        # Always say hello, even when we only want JSON: after a restart our method ids may have changed and a
+        # binary speaking other end must not keep using the ones of our last session.  Only ask for an answer
+        # when we still need the other end's method ids.
+        self._send_hello(self.preferred_codec != self.codec.name)
+
+        with self._offline_lock:
+            if not self.online and self._outage_started is not None:
+                outage = time.monotonic() - self._outage_started
+                self.total_outage += outage
+                self.longest_outage = max(self.longest_outage, outage)
+        self._flush_offline_queue()
+
+    def _link_down(self):
+        """Called when the connection drops, from here on messages go to the offline queue."""
+        with self._offline_lock:
+            if self.online:
+                self.online = False
+                self._outage_started = time.monotonic()
+                self.outages += 1
+
+    # noinspection PyUnusedLocal
+    def _on_disconnect(self, client, userdata, rc):
+        self._link_down()
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            print("Lost the connection to the mqtt broker, reconnecting in {:.1f} seconds".format(
+                self._schedule_reconnect()))
+
+    # noinspection PyUnusedLocal
+    def _on_connect_fail(self, client, userdata):
+        self._reconnect_attempt += 1
+        self.reconnect_attempts += 1
+        print("Unable to reach the mqtt broker, trying again in {:.1f} seconds".format(self._schedule_reconnect()))
+
+    def _send_hello(self, reply_requested):
+        """
+        Tells the other end which codecs we can use (most preferred first) and our delegate's method names.
+        Hello messages are always sent as JSON since every client understands that.
+
+        Type hints:
+          :type reply_requested: bool
+        """
+        codec_names = [self.preferred_codec] + sorted(name for name in self.codecs if name != self.preferred_codec)
+        local_methods = self.dispatch_table.names()
+        self.codecs["binary"].set_local_methods(local_methods)
+        hello = {"type": HELLO_MESSAGE_TYPE, "payload": [codec_names, local_methods, reply_requested]}
+        self.client.publish(self.publish_topic_name, self.codecs["json"].encode(hello))
+
+    def _on_hello(self, codec_names, remote_methods, reply_requested):
+        """Handles the hello control message sent by the other end when it connected."""
+        self.remote_methods = remote_methods
+        self.codecs["binary"].set_remote_methods(remote_methods)
+        if reply_requested:
+            self._send_hello(False)
+        if self.preferred_codec in codec_names:
+            self.codec = self.codecs[self.preferred_codec]
+        else:
+            self.codec = self.codecs["json"]
+        if self.codec.name == "json":
+            # The method ids are only good while both ends use binary, the other end may have new methods by then.
+            self.codecs["binary"].set_remote_methods([])
+
+    # noinspection PyUnusedLocal
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        print("Subscribed to topic:", self.subscription_topic_name)
+
+    # noinspection PyUnusedLocal
+    def _on_message(self, client, userdata, msg):
+        # print("Received message:", msg.payload)
+        # Attempt to parse the message and call the appropriate function.
+        self._last_heard = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.record_received(msg.topic, msg.payload)
+        if self.timing:
+            received_at = time.time()
+            decode_started = time.perf_counter()
+        try:
+            message_dict = self._decode_frame(msg.payload)
+        except ValueError as error:
+            print("Unable to decode the received message: {}".format(error))
+            return
+
+        try:
+            if isinstance(message_dict, dict) and message_dict.get("type") == HELLO_MESSAGE_TYPE:
+                payload = message_dict.get("payload")
+                if not _is_hello_payload(payload):
+                    print("Ignoring a malformed hello message: {}".format(payload))
+                    return
+                self._on_hello(*payload)
+                return
+            if isinstance(message_dict, dict) and message_dict.get("type") == HEARTBEAT_MESSAGE_TYPE:
+                payload = message_dict.get("payload")
+                if not _is_heartbeat_payload(payload):
+                    print("Ignoring a malformed heartbeat message: {}".format(payload))
+                    return
+                self._on_heartbeat(*payload)
+                return
+
+            if self.timing:
+                self._record_arrival(message_dict, received_at, time.perf_counter() - decode_started)
+
+            if self.reorder_wait is not None:
+                self._reorder(msg.topic, message_dict)
+            elif isinstance(message_dict, list):
+                # A batch frame, call each method in the order it was sent.
+                for batched_message_dict in self._coalesce_batch(message_dict):
+                    self._dispatch_safely(batched_message_dict)
+            else:
+                self._dispatch(message_dict)
+        except Exception as error:
+            # This runs on paho's network thread, where an exception would stop every message after this one.
+            print("Dropped a received message that could not be handled ({}): {}".format(error, message_dict))
+
+    def _reorder(self, topic, message):
+        """
+        Passes the messages of a received message or batch frame that carry a sequence number through the
+        topic's ReorderBuffer (the others run right away).
+
+        Type hints:
+          :type topic: str
+          :type message: dict | list of dict
+        """
+        buffer = self.reorder_buffers.get(topic)
+        if buffer is None:
+            buffer = self.reorder_buffers[topic] = ReorderBuffer(self.reorder_wait, self._dispatch_safely)
+        messages = message if isinstance(message, list) else [message]
+        kept = set(map(id, self._coalesce_batch(messages))) if isinstance(message, list) else None
+        for message_dict in messages:
+            sequence = message_dict.get("ord") if isinstance(message_dict, dict) else None
+            if kept is not None and id(message_dict) not in kept:
+                if isinstance(sequence, int):
+                    buffer.discard(sequence)
+            elif isinstance(sequence, int):
+                buffer.add(sequence, message_dict)
+            else:
+                self._dispatch_safely(message_dict)
+
+    def ordering_stats(self):
+        """
+        Returns the ReorderBuffer counts (in order, reordered, gaps, duplicates, late, ...) of every topic.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {topic: buffer.stats() for topic, buffer in self.reorder_buffers.items()}
+
+    def _record_arrival(self, message, received_at, decode_time):
+        """
+        Records the transit and decode times and the sequence numbers of a received message or batch frame.
+
+        Type hints:
+          :type message: dict | list of dict
+          :type received_at: float
+          :type decode_time: float
+        """
+        messages = message if isinstance(message, list) else [message]
+        decode_time /= max(len(messages), 1)
+        for message_dict in messages:
+            if not isinstance(message_dict, dict) or not isinstance(message_dict.get("type"), str):
+                continue
+            times = [("decode", decode_time)]
+            sent_at = message_dict.get("ts")
+            if isinstance(sent_at, (int, float)):
+                times.append(("transit", max(0.0, received_at - sent_at)))
+            self.timings.record(message_dict.get("type"), times)
+            sequence = message_dict.get("ord", message_dict.get("seq"))
+            if isinstance(sequence, int):
+                self.timings.record_sequence(sequence)
+
+    def stats(self):
+        """
+        Returns the timing histograms of the received methods (transit, decode, queue and execution times, see
+        mqtt_stats) and the sequence number counts.  Only filled in when the client was made with timing=True.
+
+        Type hints:
+          :rtype: dict
+        """
+        return self.timings.stats()
+
+    def start_stats_dump(self, interval=60.0, output=print):
+        """
+        Prints (or passes to the output function) a table of the timing stats every interval seconds until the
+        client is closed.
+
+        Type hints:
+          :type interval: float
+          :type output: callable
+        """
+        if self._stats_dumper is not None:
+            self._stats_dumper.stop()
+        self._stats_dumper = mqtt_stats.StatsDumper(self.stats, interval, output)
+
+    def _coalesce_batch(self, batch):
+        """
+        Returns the messages of a received batch frame, minus the older calls to coalescing methods.
+
+        Type hints:
+          :type batch: list of dict
+          :rtype: list of dict
+        """
+        newest = {}
+        for index, message_dict in enumerate(batch):
+            method_name = message_dict.get("type") if isinstance(message_dict, dict) else None
+            if isinstance(method_name, str) and "id" not in message_dict:
+                entry = self.dispatch_table.methods.get(method_name)
+                if entry is not None and entry[3]:
+                    newest[method_name] = index
+        if not newest:
+            return batch
+        kept = []
+        for index, message_dict in enumerate(batch):
+            method_name = message_dict.get("type") if isinstance(message_dict, dict) else None
+            if isinstance(method_name, str) and method_name in newest and "id" not in message_dict and \
+                    newest[method_name] != index:
+                self.coalesced_receives[method_name] += 1
+            else:
+                kept.append(message_dict)
+        return kept
+
+    def coalesce_stats(self):
+        """
+        Returns how many stale calls to coalescing methods were dropped, per method name, before sending
+        ("sent") and after receiving ("received", counting both batch frames and executor queues).
+
+        Type hints:
+          :rtype: dict
+        """
+        received = collections.Counter(self.coalesced_receives)
+        for lane in self.lanes.values():
+            if isinstance(lane, QueueExecutor):
+                received.update(lane.coalesced_by_method)
+        return {"sent": dict(self.coalesced_sends), "received": dict(received)}
+
+    def _dispatch_safely(self, message_dict):
+        """
+        Same as _dispatch, but a message that raises is reported and dropped, so one bad message in a batch (or in
+        a reorder buffer) doesn't stop the ones after it.
+
+        Type hints:
+          :type message_dict: dict
+        """
+        try:
+            self._dispatch(message_dict)
+        except Exception as error:
+            print("Dropped a received message that could not be handled ({}): {}".format(error, message_dict))
+
+    def _dispatch(self, message_dict):
+        """
+        Calls the delegate method described by a single message dictionary.
+
+        Type hints:
+          :type message_dict: dict
+        """
+        if isinstance(message_dict, dict) and message_dict.get("type") == TIME_MESSAGE_TYPE:
+            received_at = self.clock()
+            if "id" in message_dict and isinstance(message_dict.get("payload"), list) and message_dict["payload"]:
+                self._reply_function(message_dict["id"])(True, [message_dict["payload"][0], received_at,
+                                                                self.clock()])
+            return
+        if isinstance(message_dict, dict) and message_dict.get("type") == DESCRIBE_MESSAGE_TYPE:
+            if "id" in message_dict:
+                self._reply_function(message_dict["id"])(True, self.dispatch_table.signatures())
+            return
+        if not self.delegate:
+            print("Missing a delegate")
+            return
+        if not isinstance(message_dict, dict) or not isinstance(message_dict.get("type"), str):
+            print("Received a message without a 'type' parameter (or whose type is not a str).")
+            return
+        message_type = message_dict["type"]
+        reply = None
+        if "id" in message_dict:
+            reply = self._reply_function(message_dict["id"])
+        entry = self.dispatch_table.methods.get(message_type)
+        if entry is None:
+            self._reject(reply, "Attempt to call method {} which was not found.".format(message_type))
+            return
+        method_to_call, min_args, max_args, coalesces = entry
+        message_payload = message_dict.get("payload", ())
+        if not isinstance(message_payload, (list, tuple)):
+            self._reject(reply, "The payload for method {} was not a list.".format(message_type))
+            return
+        if len(message_payload) < min_args or (max_args is not None and len(message_payload) > max_args):
+            self._reject(reply, "Method {} was sent {} parameters but needs {}.".format(
+                message_type, len(message_payload), min_args if min_args == max_args else
+                "{} to {}".format(min_args, "any" if max_args is None else max_args)))
+            return
+        priority = message_dict.get("pri")
+        if isinstance(priority, bool) or not isinstance(priority, (int, float)) or priority != priority:
+            priority = self.method_priorities.get(message_type, 0)  # Missing, or not a number (priority != NaN).
+        if self.preempt_priority is not None and priority >= self.preempt_priority:
+            self._preempt(message_type, priority)
+        executor = self.method_executors.get(message_type, self.executor)
+        invocation = Invocation(message_type, method_to_call, message_payload, reply, coalesces,
+                                self.timings if self.timing else None, priority, self)
+        if "at" in message_dict:
+            if not self.scheduled_calls.schedule(message_dict["at"],
+                                                 functools.partial(self._submit, executor, invocation)):
+                self._reject(reply, "The execution time for method {} was not a number.".format(message_type))
+        else:
+            self._submit(executor, invocation)
+
+    @staticmethod
+    def _submit(executor, invocation):
+        if not executor.submit(invocation) and invocation.reply:
+            invocation.reply(False, "The {} queue was full".format(executor.name))
+
+    def _preempt(self, method_name, priority):
+        """
+        Cancels the waiting calls with a lower priority than a call to method_name, and asks the delegate to stop
+        a lower priority call that is already running (see cancel_method).
+        """
+        self.preemptions += 1
+        running = False
+        for lane in list(self.lanes.values()):
+            cancel_below = getattr(lane, "cancel_below", None)
+            if cancel_below is None:
+                continue  # An executor object without priorities.
+            cancelled, lane_running = cancel_below(priority, self)
+            for invocation in cancelled:
+                self.preempted_calls[invocation.method_name] += 1
+                invocation.cancel("Cancelled by {}".format(method_name))
+            running = running or lane_running
+        if running and self.cancel_method is not None:
+            cancel = getattr(self.delegate, self.cancel_method, None)
+            if cancel is None:
+                print("The delegate has no {} method to stop the running call for {}".format(
+                    self.cancel_method, method_name))
+                return
+            self.interruptions += 1
+            try:
+                cancel()
+            except Exception as error:
+                print("The {} method raised {}: {}".format(self.cancel_method, type(error).__name__, error))
+
+    def preempt_stats(self):
+        """
+        Returns how many calls preempted lower priority work, how many waiting calls that cancelled (per method)
+        and how many times cancel_method was called to stop a running call.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {"preemptions": self.preemptions, "cancelled": dict(self.preempted_calls),
+                "interruptions": self.interruptions}
+
+    @staticmethod
+    def _reject(reply, error_message):
+        """Reports a message that could not be run, back to the caller too if it was sent with call."""
+        print(error_message)
+        if reply:
+            reply(False, error_message)
+
+    def _reply_function(self, call_id):
+        """Returns a function that sends the result of the call with the given id back on the reply topic."""
+        def reply(succeeded, value):
+            reply_dict = {"type": REPLY_MESSAGE_TYPE, "payload": [call_id, succeeded, value]}
+            reply_topic = self.publish_topic_name + REPLY_TOPIC_SUFFIX
+            try:
+                self._publish(reply_dict, topic=reply_topic)
+            except (TypeError, ValueError):
+                reply_dict["payload"] = [call_id, False, "The return value {!r} could not be sent".format(value)]
+                self._publish(reply_dict, topic=reply_topic)
+        return reply
+
+    # noinspection PyUnusedLocal
+    def _on_reply(self, client, userdata, msg):
+        self._last_heard = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.record_received(msg.topic, msg.payload)
+        try:
+            reply_dict = self._decode_frame(msg.payload)
+            call_id, succeeded, value = reply_dict["payload"]
+        except (ValueError, KeyError, TypeError):
+            print("Unable to decode a reply message")
+            return
+        with self._pending_calls_lock:
+            future, timer = self._pending_calls.pop(call_id, (None, None))
+        if future is None:
+            return  # Not our call, or it already timed out.
+        if timer:
+            timer.cancel()
+        if succeeded:
+            future.set_result(value)
+        else:
+            future.set_exception(RemoteCallError(value))
+
+    def executor_stats(self):
+        """
+        Returns the metrics of every executor lane (queue depth, time spent waiting in the queue, etc), keyed by
+        lane name.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def close(self):
+        """
+        Close the MQTT client (recommended of course, but does not seem to be required).
+        Any calls held for batching (or by a coalescing rate limit) are sent before the connection closes.
+        """
+        for limit in self.rate_limits.values():
+            limit.flush()
+        if self.topic_rate_limit is not None:
+            self.topic_rate_limit.flush()
+        self.flush()
+        for stream in self.telemetry_streams.values():
+            stream.flush()
+        self.delegate = None
+        if self._stats_dumper is not None:
+            self._stats_dumper.stop()
+        if self._clock_sync_stop is not None:
+            self._clock_sync_stop.set()
+        self._heartbeat_stop.set()
+        for buffer in list(self.reorder_buffers.values()):
+            buffer.flush()
+        self.scheduled_calls.shutdown()
+        with self._pending_calls_lock:
+            pending_call_ids = list(self._pending_calls)
+        for call_id in pending_call_ids:
+            self._fail_call(call_id, RemoteCallError("The MqttClient was closed before a reply arrived"))
+        for lane in self.lanes.values():
+            if lane is not self.executor or self._owns_executor:
+                lane.shutdown()
+        with self._offline_lock:
+            if len(self.offline_queue):
+                print("Closing with {} messages still waiting to be sent{}".format(
+                    len(self.offline_queue), " (saved in {})".format(self.offline_queue.path)
+                    if self.offline_queue.path else ""))
+            self.online = False
+            self.offline_queue.close()
+        self._close_connection()
+
+    def _close_connection(self):
+        """Stops the paho network thread, disconnects and ends the recording (the last step of close)."""
+        self.client.loop_stop()
+        self.client.disconnect()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+class RemoteProxy(object):
+    """
+    Stands in for the delegate on the other end: calling one of its methods sends the message, so
+        robot.drive_inches(24, 500)
+    does the same as mqtt_client.send_message("drive_inches", [24, 500]), except that a misspelled name (an
+    AttributeError) or the wrong number of parameters (a TypeError) is found right away instead of on the robot.
+    The same methods on robot.call send with MqttClient.call and return a Future.  Made by
+    MqttClient.remote_proxy.
+    """
+
+    def __init__(self, mqtt_client, signatures, timeout=None):
+        """
+        signatures maps method names to their [minimum, maximum] number of parameters (maximum None for *args).
+        timeout is used for the calls made through the call attribute.
+
+        Type hints:
+          :type mqtt_client: MqttClient
+          :type signatures: dict
+          :type timeout: float | None
+        """
+        self.mqtt_client = mqtt_client
+        self.signatures = signatures
+        self.call = _RemoteCalls()
+        for method_name, (min_args, max_args) in signatures.items():
+            if method_name not in vars(self):  # A method called call (or mqtt_client) is only on robot.call.
+                setattr(self, method_name, self._sender(mqtt_client.send_message, method_name, min_args, max_args))
+            setattr(self.call, method_name, self._sender(
+                functools.partial(mqtt_client.call, timeout=timeout), method_name, min_args, max_args))
+
+    @staticmethod
+    def _sender(send, method_name, min_args, max_args):
+        def send_method(*args):
+            if len(args) < min_args or (max_args is not None and len(args) > max_args):
+                raise TypeError("{} takes {} parameters but was given {}".format(
+                    method_name, min_args if min_args == max_args else "{} to {}".format(
+                        min_args, "any" if max_args is None else max_args), len(args)))
+            return send(method_name, list(args))
+        send_method.__name__ = method_name
+        return send_method
+
+
+class _RemoteCalls(object):
+    """The call attribute of a RemoteProxy (its methods return Futures)."""
+
+
+class RobotHandle(MqttClient):
+    """
+    One robot of a MultiRobotClient.  It is a full MqttClient (send_message, call, its own delegate, codec and
+    stats) except that it uses the connection of the MultiRobotClient, so it is never connected on its own.
+    """
+
+    def __init__(self, owner, lego_robot_number, **client_options):
+        """
+        Type hints:
+          :type owner: MultiRobotClient
+          :type lego_robot_number: int
+        """
+        super().__init__(paho_client=owner.client, **client_options)
+        self.owner = owner
+        self.recorder = owner.recorder  # One recording for the whole connection.
+        self.lego_robot_number = lego_robot_number
+        self.set_robot_topics(owner.subscription_suffix, owner.publish_suffix)
+
+    def set_robot_topics(self, subscription_suffix, publish_suffix):
+        lego_name = "lego" + str(self.lego_robot_number).zfill(2)
+        self.subscription_topic_name = lego_name + "/" + subscription_suffix
+        self.publish_topic_name = lego_name + "/" + publish_suffix
+        for name, receiver in self.telemetry_receivers.items():
+            self.client.message_callback_add(self._telemetry_topic(name), receiver.on_message)
+
+    def connect(self, *args, **kwargs):
+        raise RuntimeError("A RobotHandle uses the connection of its MultiRobotClient, connect that instead")
+
+    def _close_connection(self):
+        pass  # The connection belongs to the MultiRobotClient.
+
+
+class MultiRobotClient(MqttClient):
+    """
+    One connection to the broker for many robots (see the module docstring).  Messages are routed to the
+    RobotHandle of the robot whose topic they arrived on, a handle is made the first time a robot is heard from.
+    """
+
+    def __init__(self, delegate_factory=None, executor="inline", workers=4, max_queue=None, offline=None,
+                 record_path=None, **robot_options):
+        """
+        delegate_factory is called with each new RobotHandle and returns the delegate for that robot (or None).
+        The executor is shared by every robot (so "pool" means one pool for the whole lab, not one per robot).
+        Any other keyword arguments (codec, timing, coalesce_methods, ...) are passed on to every RobotHandle.
+        offline sets the reconnect delays of the shared connection (see OfflineOptions), and record_path records
+        the traffic of every robot in one file.
+
+        Type hints:
+          :type delegate_factory: callable | None
+          :type executor: str | InlineExecutor | QueueExecutor
+          :type workers: int
+          :type max_queue: int | None
+          :type offline: OfflineOptions | None
+          :type record_path: str | None
+        """
+        super().__init__(offline=offline, record_path=record_path)
+        self._owns_robot_executor = isinstance(executor, str)
+        if isinstance(executor, str):
+            executor = create_executor("robots", executor, workers, max_queue)
+        self.robot_executor = executor
+        self.delegate_factory = delegate_factory
+        self.robot_options = robot_options
+        self.robots = {}  # Lego robot number --> RobotHandle
+        self._robots_lock = threading.Lock()
+        self._routes = {}  # Topic --> the RobotHandle method that handles it
+        self.lego_robot_numbers = None
+        self.subscription_suffix = "msg4pc"
+        self.publish_suffix = "msg4ev3"
+        self.unrouted = 0
+
+    def connect_to_ev3(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_numbers=None,
+                       mqtt_broker_port=1883):
+        """
+        Connects to the broker and listens to every robot (or only the robots in lego_robot_numbers).
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_numbers: list of int | None
+          :type mqtt_broker_port: int
+        """
+        self.connect("msg4pc", "msg4ev3", mqtt_broker_ip_address, lego_robot_numbers, mqtt_broker_port)
+
+    def connect_to_pc(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_numbers=None,
+                      mqtt_broker_port=1883):
+        """
+        The EV3 end of connect_to_ev3, for a program that pretends to be many robots (a simulator, for example).
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_numbers: list of int | None
+          :type mqtt_broker_port: int
+        """
+        self.connect("msg4ev3", "msg4pc", mqtt_broker_ip_address, lego_robot_numbers, mqtt_broker_port)
+
+    def connect(self, subscription_suffix, publish_suffix,
+                mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_numbers=None,
+                mqtt_broker_port=1883):
+        """
+        Like MqttClient.connect, but for a list of robot numbers (None means every robot, using a wildcard).
+
+        Type hints:
+          :type subscription_suffix: str
+          :type publish_suffix: str
+          :type mqtt_broker_ip_address: str
+          :type lego_robot_numbers: list of int | None
+          :type mqtt_broker_port: int
+        """
+        super().connect(subscription_suffix, publish_suffix, mqtt_broker_ip_address, lego_robot_numbers,
+                        mqtt_broker_port)
+
+    def robot(self, lego_robot_number):
+        """
+        Returns the RobotHandle for a robot, making it (and its delegate) if this is the first time.
+
+        Type hints:
+          :type lego_robot_number: int
+          :rtype: RobotHandle
+        """
+        with self._robots_lock:
+            robot = self.robots.get(lego_robot_number)
+            if robot is not None:
+                return robot
+            robot = RobotHandle(self, lego_robot_number, executor=self.robot_executor, **self.robot_options)
+            self.robots[lego_robot_number] = robot
+        if self.delegate_factory is not None:
+            robot.delegate = self.delegate_factory(robot)
+        if self.online:
+            robot._link_up()
+        return robot
+
+    def send_message(self, function_name, parameter_list=None, ttl=None):
+        raise RuntimeError("Send to one robot with robot(number).send_message, or to all with send_message_to_all")
+
+    def call(self, function_name, parameter_list=None, timeout=None):
+        raise RuntimeError("Call a method on one robot with robot(number).call")
+
+    def send_message_to_all(self, function_name, parameter_list=None, ttl=None):
+        """
+        Sends the message to every robot that has a RobotHandle (see send_message).
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list of object | None
+          :type ttl: float | None
+        """
+        with self._robots_lock:
+            robots = list(self.robots.values())
+        for robot in robots:
+            robot.send_message(function_name, parameter_list, ttl)
+
+    def _set_topics(self, subscription_suffix, publish_suffix, lego_robot_numbers):
+        self.subscription_suffix = subscription_suffix
+        self.publish_suffix = publish_suffix
+        self.lego_robot_numbers = lego_robot_numbers
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._route
+        with self._robots_lock:
+            for robot in self.robots.values():
+                robot.set_robot_topics(subscription_suffix, publish_suffix)
+        for lego_robot_number in lego_robot_numbers or []:
+            self.robot(lego_robot_number)
+
+    def _subscription_topics(self):
+        if self.lego_robot_numbers is None:
+            # MQTT wildcards match whole levels only ("lego+" is not allowed), _route checks for the lego prefix.
+            return ["+/" + self.subscription_suffix]
+        return ["lego{}/{}".format(str(number).zfill(2), self.subscription_suffix)
+                for number in self.lego_robot_numbers]
+
+    def _subscribe(self):
+        self.client.on_subscribe = self._on_subscribe
+        topics = self._subscription_topics()
+        with self._robots_lock:
+            telemetry_topics = [topic for robot in self.robots.values() for topic in robot._telemetry_topics()]
+        self.client.subscribe([(topic, 0) for topic in topics] +
+                              [(topic + REPLY_TOPIC_SUFFIX, 0) for topic in topics] +
+                              [(topic, 0) for topic in telemetry_topics])
+
+    # noinspection PyUnusedLocal
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        print("Subscribed to topic:", ", ".join(self._subscription_topics()))
+
+    def _link_up(self):
+        super()._link_up()
+        with self._robots_lock:
+            robots = list(self.robots.values())
+        for robot in robots:
+            robot._link_up()
+
+    def _link_down(self):
+        super()._link_down()
+        with self._robots_lock:
+            robots = list(self.robots.values())
+        for robot in robots:
+            robot._link_down()
+
+    def _route(self, client, userdata, msg):
+        """Passes a received message to the RobotHandle of the robot it came from."""
+        handler = self._routes.get(msg.topic)
+        if handler is None:
+            handler = self._add_route(msg.topic)
+            if handler is None:
+                self.unrouted += 1
+                return
+        handler(client, userdata, msg)
+
+    def _add_route(self, topic):
+        """Works out (once per topic) which robot and which RobotHandle method a topic belongs to."""
+        lego_name, _, suffix = topic.partition("/")
+        if not lego_name.startswith("lego") or not lego_name[4:].isdigit():
+            return None
+        robot = self.robot(int(lego_name[4:]))
+        if suffix == self.subscription_suffix:
+            handler = robot._on_message
+        elif suffix == self.subscription_suffix + REPLY_TOPIC_SUFFIX:
+            handler = robot._on_reply
+        else:
+            return None
+        self._routes[topic] = handler
+        return handler
+
+    def close(self):
+        """Closes every RobotHandle, then the connection."""
+        with self._robots_lock:
+            robots = list(self.robots.values())
+        for robot in robots:
+            robot.close()
+        if self._owns_robot_executor:
+            self.robot_executor.shutdown()
+        super().close()
@@ -0,0 +1,261 @@
+"""
+  Recording and replaying MqttClient traffic, to find out why a delegate is slow without a robot or a broker.
+
+  Give an MqttClient a record_path and every message it sends or receives is appended to that file, exactly as
+  it went over the network (so recording costs almost nothing and can be left on):
+
+    mqtt_client = com.MqttClient(game_master, record_path="/home/robot/game_master.mqrl")
+
+  Later, on any computer, the received messages can be fed into the delegate again, at the speed they arrived
+  (1), N times faster, or as fast as the delegate can take them (max), and the time each method took is
+  reported:
+
+    python3 mqtt_replay.py game_master.mqrl m4_ev3_petals_on_a_rose:GameMaster --speed max
+
+  The delegate runs on a replay MqttClient that is never connected, so anything it sends is just dropped.
+
+  The file is a short header followed by records.  Each record is a type byte (a topic name, a received frame or
+  a sent frame), the time.time() it happened, a topic id, the length of the data and then the data.  Topic names
+  are written once, the first time they are used, and frames refer to them by id.  Records are only ever
+  appended, and a record cut short by a crash is ignored when reading.
+"""
+
+import argparse
+import collections
+import importlib
+import os
+import struct
+import sys
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+
+FILE_MAGIC = b"MQRL\x01"
+TOPIC_RECORD = 0
+RECEIVED_RECORD = 1
+SENT_RECORD = 2
+
+# Record type, time.time(), topic id, data length.
+_RECORD_HEADER = struct.Struct("<BdHI")
+
+Record = collections.namedtuple("Record", ["direction", "time", "topic", "frame"])
+
+
+class ReplayRecorder(object):
+    """Appends the frames sent and received by an MqttClient to a recording file."""
+
+    def __init__(self, path, flush_interval=1.0):
+        """
+        Adds to the end of the file if it is already a recording.  The file is flushed at most every
+        flush_interval seconds (and on close), so little is lost if the program crashes.
+
+        Type hints:
+          :type path: str
+          :type flush_interval: float
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as file:
+                if file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                    raise ValueError("{} is not a recording, refusing to add to it".format(path))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "ab")
+            self.file.write(FILE_MAGIC)
+        self.lock = threading.Lock()
+        self.topic_ids = {}  # Ids are per session, a new session (appending to the file) writes its topics again.
+        self.flushed_at = time.time()
+        self.records = 0
+        self.bytes_written = 0
+
+    def record_received(self, topic, frame):
+        """
+        Type hints:
+          :type topic: str
+          :type frame: bytes
+        """
+        self._record(RECEIVED_RECORD, topic, frame)
+
+    def record_sent(self, topic, frame):
+        """
+        Type hints:
+          :type topic: str
+          :type frame: bytes
+        """
+        self._record(SENT_RECORD, topic, frame)
+
+    def stats(self):
+        return {"path": self.path, "records": self.records, "bytes": self.bytes_written}
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _record(self, record_type, topic, frame):
+        # This runs for every message, so it skips our lock: a single write to the buffered file is already safe
+        # from other threads, and only a new topic needs the lock (its name must be written before it is used).
+        file = self.file
+        topic_id = self.topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = self._add_topic(topic)
+        now = time.time()
+        try:
+            file.write(_RECORD_HEADER.pack(record_type, now, topic_id, len(frame)) + frame)
+            if now - self.flushed_at >= self.flush_interval:
+                self.flushed_at = now
+                file.flush()
+        except (AttributeError, ValueError):
+            return  # Closed (file is None, or closed by another thread).
+        self.records += 1
+        self.bytes_written += _RECORD_HEADER.size + len(frame)
+
+    def _add_topic(self, topic):
+        with self.lock:
+            topic_id = self.topic_ids.get(topic)
+            if topic_id is None and self.file is not None:
+                topic_id = len(self.topic_ids)
+                name = topic.encode()
+                self.file.write(_RECORD_HEADER.pack(TOPIC_RECORD, 0.0, topic_id, len(name)) + name)
+                self.topic_ids[topic] = topic_id
+            return topic_id
+
+
+def read_recording(path):
+    """
+    Yields a Record (direction "received" or "sent", time, topic, frame) for every frame in a recording file.
+
+    Type hints:
+      :type path: str
+      :rtype: collections.Iterable[Record]
+    """
+    with open(path, "rb") as file:
+        if file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError("{} is not a recording".format(path))
+        topics = {}
+        while True:
+            header = file.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            record_type, timestamp, topic_id, length = _RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return  # Cut short by a crash.
+            if record_type == TOPIC_RECORD:
+                topics[topic_id] = data.decode()
+            elif record_type in (RECEIVED_RECORD, SENT_RECORD):
+                yield Record("received" if record_type == RECEIVED_RECORD else "sent", timestamp,
+                             topics.get(topic_id), data)
+
+
+class ReplayedMessage(object):
+    """Looks enough like a paho MQTTMessage for MqttClient._on_message."""
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def replay(path, delegate, speed=1.0, direction="received", topic=None, **client_options):
+    """
+    Feeds the frames of a recording into a delegate, through a replay MqttClient that is never connected, and
+    returns what happened: {"messages", "recorded_time", "replay_time", "max_lag", "methods"} where methods maps
+    each method name to the Histogram summaries of its "queue" and "execution" times, and max_lag is how far (in
+    seconds) the replay fell behind the recording's timing.
+
+    speed is how many times faster than recorded to go (None for as fast as possible).  direction picks the
+    received frames (the usual choice, replaying into the same delegate) or the sent ones (replaying what a PC
+    sent into the robot's delegate).  topic limits the replay to one topic.  Reply frames are skipped.
+
+    Type hints:
+      :type path: str
+      :type speed: float | None
+      :type direction: str
+      :type topic: str | None
+      :rtype: dict
+    """
+    client_options["timing"] = True
+    client = com.MqttClient(delegate, **client_options)
+    client.subscription_topic_name = client.publish_topic_name = "replay"
+    # Binary frames name the methods by their index in the delegate's method list, which a connected client sets
+    # up when it sends its hello.  The replay client never connects, so set it up here.
+    client.codecs["binary"].set_local_methods(client.dispatch_table.names())
+    if getattr(delegate, "mqtt_client", False) is None:
+        delegate.mqtt_client = client  # Delegates that send messages back get the replay client to send to.
+
+    messages = 0
+    max_lag = 0.0
+    first_time = last_time = None
+    started = time.monotonic()
+    for record in read_recording(path):
+        if record.direction != direction or (topic is not None and record.topic != topic):
+            continue
+        if record.topic is not None and record.topic.endswith(com.REPLY_TOPIC_SUFFIX):
+            continue
+        if first_time is None:
+            first_time = record.time
+        last_time = record.time
+        if speed is not None:
+            lag = time.monotonic() - (started + (record.time - first_time) / speed)
+            if lag < 0:
+                time.sleep(-lag)
+            else:
+                max_lag = max(max_lag, lag)
+        client._on_message(None, None, ReplayedMessage(record.topic, record.frame))
+        messages += 1
+    replay_time = time.monotonic() - started
+
+    methods = {method_name: {kind: summary for kind, summary in kinds.items() if kind in ("queue", "execution")}
+               for method_name, kinds in client.stats()["methods"].items()}
+    return {"messages": messages, "recorded_time": (last_time - first_time) if messages else 0.0,
+            "replay_time": replay_time, "max_lag": max_lag, "methods": methods}
+
+
+def format_replay(result):
+    """
+    Formats the result of replay as a table of execution times in milliseconds.
+
+    Type hints:
+      :type result: dict
+      :rtype: str
+    """
+    lines = ["{} messages recorded over {:.2f} s, replayed in {:.2f} s (at most {:.0f} ms behind)".format(
+        result["messages"], result["recorded_time"], result["replay_time"], result["max_lag"] * 1000),
+        "{:<28}{:>8}{:>10}{:>10}{:>10}{:>10}{:>12}".format("Method", "count", "mean", "p50", "p99", "max",
+                                                         "total (s)")]
+    methods = result["methods"]
+    for method_name in sorted(methods, key=lambda name: -methods[name]["execution"]["count"] *
+                              (methods[name]["execution"]["mean"] or 0)):
+        summary = methods[method_name]["execution"]
+        if not summary["count"]:
+            continue
+        lines.append("{:<28}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.3f}".format(
+            method_name, summary["count"], summary["mean"] * 1000, summary["p50"] * 1000, summary["p99"] * 1000,
+            summary["max"] * 1000, summary["mean"] * summary["count"]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a recording made with the MqttClient record_path option "
+                                                 "into a delegate and reports how long each method took.")
+    parser.add_argument("recording", help="the recording file")
+    parser.add_argument("delegate", help="module:Class of the delegate, made with no arguments "
+                                         "(for example m4_ev3_petals_on_a_rose:GameMaster)")
+    parser.add_argument("--speed", default="1", help="how many times faster than recorded, or max (default 1)")
+    parser.add_argument("--direction", default="received", choices=["received", "sent"],
+                        help="replay the frames the recording client received (default) or sent")
+    parser.add_argument("--topic", help="only replay the frames of this topic")
+    args = parser.parse_args()
+
+    module_name, _, class_name = args.delegate.partition(":")
+    sys.path.insert(0, os.getcwd())
+    delegate = getattr(importlib.import_module(module_name), class_name)()
+    speed = None if args.speed == "max" else float(args.speed)
+    print(format_replay(replay(args.recording, delegate, speed, args.direction, args.topic)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+  Timing statistics for the MqttClient (see the timing option in mqtt_remote_method_calls).
+
+  For every method that arrives, four times are kept:
+    transit   - from send_message on the other computer until the message arrived here.  This uses the clocks of
+                both computers, so it is only as good as their clocks agree.
+    decode    - turning the received bytes back into a message (a batch frame's time is split between its messages).
+    queue     - waiting for the executor to start the delegate method.
+    execution - running the delegate method.
+  Each is a Histogram, so a slow robot reaction can be pinned on the network, decoding, a busy queue or the delegate.
+
+  CompressionStats keeps the sizes and times of compressed messages (see the compress_threshold option).
+"""
+
+import math
+import threading
+
+# Bucket i holds the times from 2 ** (i - 1) to 2 ** i microseconds, bucket 0 is everything under a microsecond.
+BUCKET_COUNT = 40
+TIMING_KINDS = ("transit", "decode", "queue", "execution")
+
+
+class Histogram(object):
+    """Counts times (in seconds) in power of two buckets, cheap enough to add to on every message."""
+
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        """
+        Type hints:
+          :type seconds: float
+        """
+        index = int(seconds * 1e6).bit_length()  # Same as floor(log2(microseconds)) + 1, but much quicker.
+        self.buckets[index if index < BUCKET_COUNT else BUCKET_COUNT - 1] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """
+        Returns the time (in seconds) that the given fraction of the times are at or under.  It is estimated by
+        assuming the times are spread evenly through their bucket, and kept between the smallest and largest time
+        seen.  Returns None if nothing was added.
+
+        Type hints:
+          :type fraction: float
+          :rtype: float | None
+        """
+        if not self.count:
+            return None
+        target = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            if seen + bucket_count >= target:
+                low = 2 ** (index - 1) if index else 0
+                estimate = (low + (2 ** index - low) * (target - seen) / bucket_count) / 1e6
+                return min(self.max, max(self.min, estimate))
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        """
+        Returns the count and the mean, min, p50, p90, p99 and max times in seconds.
+
+        Type hints:
+          :rtype: dict
+        """
+        return {"count": self.count, "mean": self.total / self.count if self.count else None,
+                "min": self.min, "p50": self.percentile(0.5), "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99), "max": self.max}
+
+
+class MessageTimings(object):
+    """The timing histograms of every received method, plus a count of gaps in the sequence numbers."""
+
+    def __init__(self):
+        self.histograms = {}  # Method name --> {kind: Histogram}
+        self.lock = threading.Lock()
+        self.last_sequence = None
+        self.received = 0
+        self.sequence_gaps = 0
+        self.out_of_order = 0
+
+    def record(self, method_name, times):
+        """
+        Adds times to the histograms of a method, times is a list of (kind, seconds) where kind is one of
+        TIMING_KINDS.
+
+        Type hints:
+          :type method_name: str
+          :type times: list of tuple
+        """
+        with self.lock:
+            histograms = self.histograms.get(method_name)
+            if histograms is None:
+                histograms = self.histograms[method_name] = {name: Histogram() for name in TIMING_KINDS}
+            for kind, seconds in times:
+                histograms[kind].add(seconds)
+
+    def record_sequence(self, sequence):
+        """
+        Notes the sequence number of a received message, counting the numbers that were skipped (lost or
+        coalesced messages) and the ones that arrived after a higher number.
+
+        Type hints:
+          :type sequence: int
+        """
+        with self.lock:
+            self._record_sequence(sequence)
+
+    def _record_sequence(self, sequence):
+        self.received += 1
+        if self.last_sequence is not None:
+            if sequence > self.last_sequence + 1:
+                self.sequence_gaps += sequence - self.last_sequence - 1
+            elif sequence <= self.last_sequence:
+                self.out_of_order += 1
+                return
+        self.last_sequence = sequence
+
+    def stats(self):
+        """
+        Returns {"methods": {method name: {kind: Histogram summary}}, "sequence": {...counts...}}.
+
+        Type hints:
+          :rtype: dict
+        """
+        with self.lock:
+            methods = {method_name: {kind: histogram.summary() for kind, histogram in histograms.items()}
+                       for method_name, histograms in self.histograms.items()}
+            sequence = {"received": self.received, "gaps": self.sequence_gaps, "out_of_order": self.out_of_order}
+        return {"methods": methods, "sequence": sequence}
+
+
+class CompressionStats(object):
+    """
+    Sizes and times of compressing (sent) and decompressing (received) frames, per message type.  A batch frame
+    is counted under "(batch)".  Frames that were over the threshold but did not get smaller are counted as
+    "skipped" and sent as they were.
+    """
+
+    def __init__(self):
+        self.totals = {}  # (Message type, "compressed" / "skipped" / "decompressed") --> [count, raw, wire, time]
+        self.lock = threading.Lock()
+
+    def record(self, message_type, direction, raw_size, wire_size, seconds):
+        """
+        Records one frame: its size before compression, its size on the wire and the time taken.
+
+        Type hints:
+          :type message_type: str
+          :type direction: str
+          :type raw_size: int
+          :type wire_size: int
+          :type seconds: float
+        """
+        with self.lock:
+            totals = self.totals.get((message_type, direction))
+            if totals is None:
+                totals = self.totals[(message_type, direction)] = [0, 0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += raw_size
+            totals[2] += wire_size
+            totals[3] += seconds
+
+    def stats(self):
+        """
+        Returns {message type: {direction: {"count", "raw_bytes", "wire_bytes", "ratio", "mean_time"}}}
+        where ratio is raw_bytes / wire_bytes (how many times smaller compression made the frames).
+
+        Type hints:
+          :rtype: dict
+        """
+        result = {}
+        with self.lock:
+            for (message_type, direction), (count, raw, wire, seconds) in self.totals.items():
+                result.setdefault(message_type, {})[direction] = {
+                    "count": count, "raw_bytes": raw, "wire_bytes": wire,
+                    "ratio": raw / wire if wire else None, "mean_time": seconds / count}
+        return result
+
+
+def format_stats(stats):
+    """
+    Formats the result of MessageTimings.stats (or MqttClient.stats) as a table in milliseconds, for logs.
+
+    Type hints:
+      :type stats: dict
+      :rtype: str
+    """
+    lines = ["{:<28}{:<11}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+        "Method", "Time (ms)", "count", "mean", "p50", "p99", "max")]
+    for method_name in sorted(stats["methods"]):
+        label = method_name  # Only on the first line of each method.
+        for kind in TIMING_KINDS:
+            summary = stats["methods"][method_name][kind]
+            if not summary["count"]:
+                continue
+            lines.append("{:<28}{:<11}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+                label, kind, summary["count"], summary["mean"] * 1000, summary["p50"] * 1000,
+                summary["p99"] * 1000, summary["max"] * 1000))
+            label = ""
+    sequence = stats["sequence"]
+    lines.append("Sequence numbers: {received} received, {gaps} missing, {out_of_order} out of order".format(
+        **sequence))
+    return "\n".join(lines)
+
+
+class StatsDumper(object):
+    """Calls a function with the formatted stats every interval seconds, on a background thread."""
+
+    def __init__(self, get_stats, interval, output=print):
+        """
+        Type hints:
+          :type get_stats: callable
+          :type interval: float
+          :type output: callable
+        """
+        self.get_stats = get_stats
+        self.interval = interval
+        self.output = output
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="mqtt-stats", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.output(format_stats(self.get_stats()))
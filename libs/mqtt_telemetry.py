@@ -0,0 +1,232 @@
+"""
+  Telemetry streams for the MqttClient: a fast way to send a steady flow of sensor samples (Pixy blocks, beacon
+  heading and distance, encoder positions, ...) instead of one send_message call per sample.
+
+  A stream has a name and a fixed list of fields, each with a struct type code (for example "h" is a 2 byte
+  int, "i" a 4 byte int and "f" a 4 byte float).  Samples are packed into binary frames, several samples per
+  frame, and published on their own topic (the publish topic + "/telemetry/" + the stream name), so they never
+  get in the way of the method calls.  Every frame starts with a sequence number and the time it was sent.
+
+  Code running on the EV3:
+    pixy_stream = mqtt_client.telemetry_stream("pixy", [("x", "h"), ("y", "h"), ("width", "h"), ("height", "h")])
+    while True:
+        block = robot.pixy.value(1), ...
+        pixy_stream.send(x, y, width, height)
+
+  Code running on the PC:
+    def on_pixy(frame):
+        print(frame.columns["x"])      # An array of the x values of the samples in this frame.
+
+    mqtt_client.on_telemetry("pixy", [("x", "h"), ("y", "h"), ("width", "h"), ("height", "h")], on_pixy)
+
+  Telemetry is for values that are quickly out of date, so frames are not queued while offline (they are
+  counted as dropped instead) and a lost frame is never sent again (the receiver counts the gaps).
+"""
+
+import array
+import struct
+import sys
+import threading
+import time
+
+TELEMETRY_TOPIC_PART = "/telemetry/"
+FRAME_VERSION = 1
+
+# Version, sequence number, time sent (time.time()), sample count.  Little endian, like the EV3 and most PCs.
+_HEADER = struct.Struct("<BIdH")
+
+
+class TelemetryFormat(object):
+    """The fields of a telemetry stream and how one sample is packed."""
+
+    def __init__(self, fields):
+        """
+        Type hints:
+          :type fields: list of (str, str)
+        """
+        self.fields = list(fields)
+        self.names = [name for name, _ in self.fields]
+        type_codes = "".join(type_code for _, type_code in self.fields)
+        self.sample_struct = struct.Struct("<" + type_codes)
+        # When every field has the same type a frame can be read straight into an array, which is much quicker.
+        self.single_type = type_codes[0] if len(set(type_codes)) == 1 else None
+        if self.single_type is not None and array.array(self.single_type).itemsize != struct.calcsize(
+                "<" + self.single_type):
+            self.single_type = None
+
+    def decode_columns(self, data, count):
+        """
+        Unpacks count samples into one array (or list) per field.
+
+        Type hints:
+          :type data: bytes
+          :type count: int
+          :rtype: dict
+        """
+        if self.single_type is not None:
+            values = array.array(self.single_type)
+            values.frombytes(data)
+            if sys.byteorder == "big":
+                values.byteswap()
+            field_count = len(self.fields)
+            return {name: values[index::field_count] for index, name in enumerate(self.names)}
+        columns = list(zip(*self.sample_struct.iter_unpack(data))) or [()] * len(self.fields)
+        return {name: array.array(type_code, column) if type_code not in "?cs" else list(column)
+                for (name, type_code), column in zip(self.fields, columns)}
+
+
+class TelemetryFrame(object):
+    """The samples of one received frame, given to on_telemetry callbacks."""
+
+    def __init__(self, stream_name, sequence, sent_at, columns, count, missed):
+        self.stream_name = stream_name
+        self.sequence = sequence
+        self.sent_at = sent_at  # time.time() on the sending computer when the frame was sent.
+        self.columns = columns  # Field name --> array of the values, one per sample.
+        self.count = count
+        self.missed = missed  # Frames lost between the previous frame of this stream and this one.
+
+    def samples(self):
+        """Returns the samples as a list of tuples (one tuple of field values per sample), slower than columns."""
+        return list(zip(*self.columns.values()))
+
+
+class TelemetryStream(object):
+    """The sending end of a telemetry stream, made by MqttClient.telemetry_stream."""
+
+    def __init__(self, mqtt_client, name, fields, samples_per_frame=64, max_delay=0.05):
+        """
+        Samples are sent once samples_per_frame are waiting, or max_delay seconds after the first one waited.
+
+        Type hints:
+          :type name: str
+          :type fields: list of (str, str)
+          :type samples_per_frame: int
+          :type max_delay: float
+        """
+        self.mqtt_client = mqtt_client
+        self.name = name
+        self.format = TelemetryFormat(fields)
+        self.samples_per_frame = samples_per_frame
+        self.max_delay = max_delay
+        self.buffer = bytearray()
+        self.count = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.timer = None
+        self.frames_sent = 0
+        self.samples_sent = 0
+        self.frames_dropped = 0
+
+    def send(self, *values):
+        """
+        Adds one sample (a value for each field, in order).
+
+        Type hints:
+          :type values: int | float
+        """
+        with self.lock:
+            self.buffer += self.format.sample_struct.pack(*values)
+            self.count += 1
+            if self.count >= self.samples_per_frame:
+                frame, count = self._take_frame()
+            else:
+                frame = None
+                if self.count == 1 and self.max_delay is not None:
+                    self.timer = threading.Timer(self.max_delay, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if frame:
+            self._publish(frame, count)
+
+    def send_many(self, samples):
+        """
+        Adds several samples, each a tuple of field values.
+
+        Type hints:
+          :type samples: list of tuple
+        """
+        for sample in samples:
+            self.send(*sample)
+
+    def flush(self):
+        """Sends the waiting samples now."""
+        with self.lock:
+            frame, count = self._take_frame()
+        if frame:
+            self._publish(frame, count)
+
+    def stats(self):
+        return {"frames_sent": self.frames_sent, "samples_sent": self.samples_sent,
+                "frames_dropped": self.frames_dropped}
+
+    def _take_frame(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.count:
+            return None, 0
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        count = self.count
+        frame = _HEADER.pack(FRAME_VERSION, self.sequence, time.time(), count) + self.buffer
+        self.buffer = bytearray()
+        self.count = 0
+        return frame, count
+
+    def _publish(self, frame, count):
+        topic = self.mqtt_client.publish_topic_name + TELEMETRY_TOPIC_PART + self.name
+        if self.mqtt_client.online and self.mqtt_client.client.publish(topic, frame).rc == 0:  # MQTT_ERR_SUCCESS
+            self.frames_sent += 1
+            self.samples_sent += count
+        else:
+            self.frames_dropped += 1
+
+
+class TelemetryReceiver(object):
+    """The receiving end of a telemetry stream, made by MqttClient.on_telemetry."""
+
+    def __init__(self, name, fields, callback):
+        """
+        Type hints:
+          :type name: str
+          :type fields: list of (str, str)
+          :type callback: callable
+        """
+        self.name = name
+        self.format = TelemetryFormat(fields)
+        self.callback = callback
+        self.last_sequence = None
+        self.frames = 0
+        self.samples = 0
+        self.missed_frames = 0
+        self.bad_frames = 0
+
+    # noinspection PyUnusedLocal
+    def on_message(self, client, userdata, msg):
+        data = msg.payload
+        try:
+            version, sequence, sent_at, count = _HEADER.unpack_from(data)
+        except struct.error:
+            version = None
+        if version != FRAME_VERSION or len(data) != _HEADER.size + count * self.format.sample_struct.size:
+            self.bad_frames += 1
+            print("Received a telemetry frame for {} that does not match its fields".format(self.name))
+            return
+        missed = 0
+        if self.last_sequence is not None:
+            missed = (sequence - self.last_sequence - 1) & 0xFFFFFFFF
+            if missed > 0x7FFFFFFF:
+                missed = 0  # An old frame arriving late, not a gap.
+        self.last_sequence = sequence
+        self.frames += 1
+        self.samples += count
+        self.missed_frames += missed
+        columns = self.format.decode_columns(data[_HEADER.size:], count)
+        try:
+            self.callback(TelemetryFrame(self.name, sequence, sent_at, columns, count, missed))
+        except Exception as error:
+            print("The telemetry callback for {} raised {}: {}".format(self.name, type(error).__name__, error))
+
+    def stats(self):
+        return {"frames": self.frames, "samples": self.samples, "missed_frames": self.missed_frames,
+                "bad_frames": self.bad_frames}
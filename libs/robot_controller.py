@@ -11,61 +11,762 @@
   could be called.  That way it's a generic action that could be used in any task.
 """
 
+import collections
+import device_waits
 import ev3dev.ev3 as ev3
 import math
+import threading
 import time
 
+# Drive geometry: drive_inches turns the wheels 90 degrees per inch, and with the wheels TRACK_WIDTH inches apart
+# it takes 5 degrees of each wheel (in opposite directions) to turn the robot by 1 degree.
+DEGREES_PER_INCH = 90
+TRACK_WIDTH = 20 / math.pi
+
+# Where the robot is, from Odometry: x and y in inches from where it started, heading in radians (0 is the way it
+# faced at the start, positive is to the left), and the time.time() the encoders were read.
+Pose = collections.namedtuple("Pose", ["time", "x", "y", "heading"])
+
+# A piece of a path for run_path, made with straight, arc or turn.
+PathSegment = collections.namedtuple("PathSegment", ["kind", "inches", "degrees", "radius"])
+
+
+def straight(inches):
+    """A path segment driving straight ahead (backwards if inches is negative)."""
+    return PathSegment("straight", inches, 0, None)
+
+
+def arc(radius, degrees):
+    """
+    A path segment driving along a circle of radius inches (measured to the middle of the robot), turning the
+    robot by degrees on the way (positive turns left).
+    """
+    return PathSegment("arc", abs(radius) * math.radians(abs(degrees)), degrees, abs(radius))
+
+
+def turn(degrees):
+    """A path segment turning the robot in place by degrees (positive turns left)."""
+    return PathSegment("turn", 0, degrees, 0)
+
+
+def polygon(sides, side_inches):
+    """
+    The path segments of a regular polygon, turning left at each corner.
+
+    Type hints:
+      :type sides: int
+      :type side_inches: float
+      :rtype: list of PathSegment
+    """
+    segments = []
+    for _ in range(sides):
+        segments.extend([straight(side_inches), turn(360 / sides)])
+    return segments
+
+
+def wheel_degrees(segment):
+    """
+    Returns how far (left, right) the wheel motors turn, in degrees, for a path segment.
+
+    Type hints:
+      :type segment: PathSegment
+      :rtype: (float, float)
+    """
+    if segment.kind == "straight":
+        return segment.inches * DEGREES_PER_INCH, segment.inches * DEGREES_PER_INCH
+    angle = math.radians(segment.degrees)
+    left_inches = (segment.radius - TRACK_WIDTH / 2) * angle
+    right_inches = (segment.radius + TRACK_WIDTH / 2) * angle
+    return left_inches * DEGREES_PER_INCH, right_inches * DEGREES_PER_INCH
+
+
+def blend_corners(segments, blend_radius):
+    """
+    Returns the path with each turn in place between two straight segments replaced by an arc of blend_radius
+    inches, cutting the corner so the robot never stops.  The straights are shortened to make room (by at most
+    half their length each, using a tighter arc if the corner needs it).
+
+    Type hints:
+      :type segments: list of PathSegment
+      :type blend_radius: float
+      :rtype: list of PathSegment
+    """
+    blended = list(segments)
+    for index in range(1, len(segments) - 1):
+        before, corner, after = segments[index - 1], segments[index], segments[index + 1]
+        if corner.kind != "turn" or before.kind != "straight" or after.kind != "straight":
+            continue
+        half_angle = math.radians(abs(corner.degrees)) / 2
+        if not 0 < half_angle < math.pi / 2 or before.inches <= 0 or after.inches <= 0:
+            continue  # Turning around, or backing into the corner, stays a turn in place.
+        cut = min(blend_radius * math.tan(half_angle), before.inches / 2, after.inches / 2)
+        blended[index - 1] = straight(blended[index - 1].inches - cut)
+        blended[index] = arc(cut / math.tan(half_angle), corner.degrees)
+        blended[index + 1] = straight(after.inches - cut)
+    return blended
+
+
+_locked_device_classes = {}  # ev3dev device class --> its subclass made by _locked_device_class
+_locked_device_classes_lock = threading.Lock()
+
+
+def _locked_device_class(device_class):
+    """
+    Returns a subclass of an ev3dev device class whose attribute reads and writes each hold a lock of the device.
+    ev3dev keeps each attribute file open and reads it with a seek and a read, so two threads using one kept
+    device (the motion monitor and odometry, say) could otherwise read each other's position or a half value.
+
+    Type hints:
+      :type device_class: type
+      :rtype: type
+    """
+    with _locked_device_classes_lock:
+        locked_class = _locked_device_classes.get(device_class)
+        if locked_class is None:
+            def __init__(self, *args, **kwargs):
+                self._io_lock = threading.Lock()
+                device_class.__init__(self, *args, **kwargs)
+
+            def _get_attribute(self, attribute, name):
+                with self._io_lock:
+                    return device_class._get_attribute(self, attribute, name)
+
+            def _set_attribute(self, attribute, name, value):
+                with self._io_lock:
+                    return device_class._set_attribute(self, attribute, name, value)
+
+            locked_class = type(device_class.__name__, (device_class,), {
+                "__slots__": ("_io_lock",), "__module__": device_class.__module__, "__init__": __init__,
+                "_get_attribute": _get_attribute, "_set_attribute": _set_attribute})
+            _locked_device_classes[device_class] = locked_class
+        return locked_class
+
+
+class DeviceRegistry(object):
+    """
+    Finds each EV3 device the first time it is used and keeps the handle.  Making a new ev3dev object searches
+    sysfs for the device and opens its attribute files again, a kept one reuses the files it already has open.
+    A device that was not plugged in stays not connected until rescan is called (after plugging it in).  The kept
+    devices are shared by threads, so each one reads and writes its attributes one at a time.
+    """
+
+    def __init__(self):
+        self.devices = {}  # (device class, port) --> ev3dev device
+        self.lock = threading.Lock()
+        self.scans = 0
+
+    def get(self, device_class, port=None):
+        """
+        Returns the device of the given ev3dev class on port (the first one found if port is None).
+
+        Type hints:
+          :type device_class: type
+          :type port: str | None
+        """
+        key = (device_class, port)
+        device = self.devices.get(key)
+        if device is None:
+            with self.lock:
+                device = self.devices.get(key)
+                if device is None:
+                    locked_class = _locked_device_class(device_class)
+                    device = locked_class(port) if port is not None else locked_class()
+                    self.devices[key] = device
+                    self.scans += 1
+        return device
+
+    def rescan(self, port=None):
+        """
+        Forgets the kept devices (only the one on port, if given), so the next use searches for them again.
+
+        Type hints:
+          :type port: str | None
+        """
+        with self.lock:
+            for key in list(self.devices):
+                if port is None or key[1] == port:
+                    del self.devices[key]
+
+
+class MotionHandle(object):
+    """
+    A motion started by one of the Snatch3r's *_async methods.  poll and wait tell when the motors are done,
+    cancel stops them early.  A new motion started on the same motors replaces this one (it finishes as
+    "replaced").  If reading or driving the motors raised (a cable came out, say), it finishes as "failed" and
+    error is the exception.
+    """
+
+    def __init__(self, name, motors, monitor, finishes_itself=False):
+        """
+        A handle that finishes_itself is only finished by the code running the motion (see MotionQueue), the
+        monitor doesn't watch its motors' state.
+
+        Type hints:
+          :type name: str
+          :type motors: list of ev3.Motor
+          :type monitor: MotionMonitor
+          :type finishes_itself: bool
+        """
+        self.name = name
+        self.motors = motors
+        self.monitor = monitor
+        self.finishes_itself = finishes_itself
+        self.started_at = time.time()
+        self.finished_at = None
+        self.outcome = None  # "done", "cancelled", "replaced" or "failed" once finished.
+        self.error = None  # The exception, if the motion failed.
+        self.finished = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def poll(self):
+        """Returns True if the motion has finished (without waiting)."""
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the motion has finished, or for at most timeout seconds.  Returns True if it finished.
+
+        Type hints:
+          :type timeout: float | None
+          :rtype: bool
+        """
+        return self.finished.wait(timeout)
+
+    def cancel(self):
+        """
+        Stops the motors (braking) if the motion is still going.  Returns True if it was.
+
+        Type hints:
+          :rtype: bool
+        """
+        if not self.monitor.forget(self):
+            return False
+        for motor in self.motors:
+            motor.stop(stop_action=ev3.Motor.STOP_ACTION_BRAKE)
+        self._finish("cancelled")
+        return True
+
+    def add_done_callback(self, callback):
+        """
+        Calls callback(handle) once the motion has finished (right away if it already has).  The callback runs on
+        the monitor's thread, so it should be quick, starting the next motion is fine.
+
+        Type hints:
+          :type callback: callable
+        """
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    @property
+    def elapsed(self):
+        """Seconds from the start to the end of the motion (or to now if it is still going)."""
+        return (self.finished_at or time.time()) - self.started_at
+
+    def _fail(self, error):
+        self.error = error
+        self._finish("failed")
+
+    def _finish(self, outcome):
+        with self.lock:
+            if self.finished.is_set():
+                return
+            self.outcome = outcome
+            self.finished_at = time.time()
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as error:
+                print("A motion callback raised {}: {}".format(type(error).__name__, error))
+
+
+class MotionMonitor(object):
+    """
+    One background thread that watches the motors of every motion started with a *_async method, instead of one
+    waiting loop per motion, and finishes a motion's handle once none of its motors is running any more.  The
+    thread is started the first time it is needed and sleeps while there is nothing to watch.  A motion whose motors
+    can't be read any more fails, the thread carries on with the others.
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        Type hints:
+          :type interval: float
+        """
+        self.interval = interval
+        self.handles = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.checks = 0
+
+    def watch(self, handle):
+        """
+        Starts watching the motors of a motion that was just started, and returns its handle.
+
+        Type hints:
+          :type handle: MotionHandle
+          :rtype: MotionHandle
+        """
+        with self.condition:
+            replaced = [other for other in self.handles
+                        if any(motor is other_motor for motor in handle.motors for other_motor in other.motors)]
+            for other in replaced:
+                self.handles.remove(other)
+            self.handles.append(handle)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="motion-monitor", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        for other in replaced:
+            other._finish("replaced")
+        return handle
+
+    def forget(self, handle):
+        """Stops watching a motion, returns False if it was not being watched (it had already finished)."""
+        with self.condition:
+            if handle not in self.handles:
+                return False
+            self.handles.remove(handle)
+            return True
+
+    def cancel_all(self):
+        """Cancels every motion being watched."""
+        with self.condition:
+            handles = list(self.handles)
+        for handle in handles:
+            handle.cancel()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.handles:
+                    self.condition.wait()
+                handles = list(self.handles)
+            self.checks += 1
+            for handle in handles:
+                if handle.finishes_itself:
+                    continue
+                try:
+                    running = any(ev3.Motor.STATE_RUNNING in motor.state for motor in handle.motors)
+                except Exception as error:
+                    if self.forget(handle):
+                        handle._fail(error)
+                    continue
+                if not running and self.forget(handle):
+                    handle._finish("done")
+            time.sleep(self.interval)
+
+
+class MotionQueue(object):
+    """
+    Runs path segments on the drive motors back to back on a background thread.  Each segment is sent to the
+    motors as absolute positions (so small errors don't add up) a little before the one before it ends, so the
+    robot doesn't stop in between.  Segments added while it runs are driven after the ones already queued.  If a
+    motor can't be read or driven, the run fails (see MotionHandle), and if the run is cancelled (by cancel, or
+    by anything that cancels its handle, like Snatch3r.stop), the segments still queued are dropped too.
+    """
+
+    def __init__(self, robot, speed_sp=600, blend_radius=None, lead_time=0.01):
+        """
+        speed_sp is the speed of the faster wheel.  With blend_radius, the corners of each batch of segments
+        added are cut with arcs (see blend_corners).  lead_time is how many seconds before a segment ends the
+        next one is sent: long enough to cover the time it takes to send it, since what is left of a segment
+        when the next one starts gets mixed into that one (so the robot ends up a little off the path).
+
+        Type hints:
+          :type robot: Snatch3r
+          :type speed_sp: int
+          :type blend_radius: float | None
+          :type lead_time: float
+        """
+        self.robot = robot
+        self.speed_sp = speed_sp
+        self.blend_radius = blend_radius
+        self.lead_time = lead_time
+        self.segments = collections.deque()
+        self.lock = threading.Lock()
+        self.handle = None
+        self.thread = None
+        self.segments_run = 0
+        self.ideal_time = 0.0
+
+    def extend(self, segments):
+        """
+        Adds segments to the end of the queue and starts driving if the robot isn't already.  Returns the
+        MotionHandle of the run, which finishes when the queue is empty and the robot has stopped.
+
+        Type hints:
+          :type segments: list of PathSegment
+          :rtype: MotionHandle
+        """
+        if self.blend_radius:
+            segments = blend_corners(segments, self.blend_radius)
+        with self.lock:
+            self.segments.extend(segments)
+            if self.thread is None:
+                left_motor, right_motor = self.robot.left_motor, self.robot.right_motor
+                assert left_motor.connected
+                assert right_motor.connected
+                monitor = self.robot.motion_monitor
+                self.handle = monitor.watch(MotionHandle("path", [left_motor, right_motor], monitor, True))
+                self.thread = threading.Thread(target=self._run, args=(self.handle,), name="motion-queue",
+                                               daemon=True)
+                self.thread.start()
+            return self.handle
+
+    def wait(self, timeout=None):
+        """Blocks until the queue has been driven (or for at most timeout seconds), returns True if it was."""
+        with self.lock:
+            handle = self.handle
+        return handle is None or handle.wait(timeout)
+
+    def cancel(self):
+        """Stops the robot and drops the segments still queued."""
+        with self.lock:
+            self.segments.clear()
+            handle = self.handle
+        if handle is not None:
+            handle.cancel()
+
+    def stats(self):
+        """
+        Returns {"segments", "elapsed", "ideal"}: the segments driven, the seconds the run took, and the seconds it
+        would take with no time lost between segments (the wheels at full speed the whole way).
+
+        Type hints:
+          :rtype: dict
+        """
+        with self.lock:
+            return {"segments": self.segments_run, "ideal": self.ideal_time,
+                    "elapsed": self.handle.elapsed if self.handle else 0.0}
+
+    def _run(self, handle):
+        try:
+            self._drive(handle)
+        except Exception as error:
+            # A motor that can't be read or driven any more: give up on the run, stop what still can be stopped.
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.segments.clear()
+            if handle.monitor.forget(handle):
+                handle._fail(error)
+            for motor in handle.motors:
+                try:
+                    motor.stop(stop_action=ev3.Motor.STOP_ACTION_BRAKE)
+                except Exception:
+                    pass
+        with self.lock:
+            if self.thread is threading.current_thread():
+                self.thread = None
+
+    def _drive(self, handle):
+        left_motor, right_motor = handle.motors
+        left_target, right_target = left_motor.position, right_motor.position
+        while not handle.poll():
+            with self.lock:
+                if not self.segments:
+                    self.thread = None  # Segments added from here on start a new run.
+                    break
+                segment = self.segments.popleft()
+            left_degrees, right_degrees = wheel_degrees(segment)
+            longest = max(abs(left_degrees), abs(right_degrees))
+            if longest < 1:
+                continue
+            left_target += left_degrees
+            right_target += right_degrees
+            left_speed = max(1, int(round(self.speed_sp * abs(left_degrees) / longest)))
+            right_speed = max(1, int(round(self.speed_sp * abs(right_degrees) / longest)))
+            left_motor.run_to_abs_pos(position_sp=int(round(left_target)), speed_sp=left_speed)
+            right_motor.run_to_abs_pos(position_sp=int(round(right_target)), speed_sp=right_speed)
+            with self.lock:
+                self.segments_run += 1
+                self.ideal_time += longest / self.speed_sp
+            while not handle.poll():
+                time_left = max(abs(left_target - left_motor.position) / left_speed,
+                                abs(right_target - right_motor.position) / right_speed)
+                if time_left <= self.lead_time:
+                    break
+                time.sleep(min(time_left - self.lead_time, 0.05))
+        while not handle.poll() and (ev3.Motor.STATE_RUNNING in left_motor.state or
+                                     ev3.Motor.STATE_RUNNING in right_motor.state):
+            time.sleep(0.005)
+        if handle.monitor.forget(handle):
+            handle._finish("done")
+        elif handle.outcome == "cancelled":
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.segments.clear()  # Also when cancelled by Snatch3r.stop rather than cancel.
+            # The last segment may have been sent just after the motors were stopped.
+            left_motor.stop(stop_action=ev3.Motor.STOP_ACTION_BRAKE)
+            right_motor.stop(stop_action=ev3.Motor.STOP_ACTION_BRAKE)
+
+
+class Odometry(object):
+    """
+    Keeps track of where the robot is from the left (B) and right (C) wheel encoders.  A background thread reads
+    both motor positions rate times a second and adds up the arcs the robot drove in between, so it works however
+    the motors were told to move.  The latest pose and the last history_size poses are kept.
+
+    It only knows what the wheels did: slipping tracks, or a turn_degrees that was tuned to make up for them, put
+    it off by as much as they slip.  A sample whose encoders can't be read is skipped (counted in errors, with the
+    exception in last_error) and the thread keeps sampling.
+    """
+
+    def __init__(self, robot, rate=50, history_size=500, degrees_per_inch=DEGREES_PER_INCH, track_width=TRACK_WIDTH):
+        """
+        Type hints:
+          :type robot: Snatch3r
+          :type rate: float
+          :type history_size: int
+          :type degrees_per_inch: float
+          :type track_width: float
+        """
+        self.robot = robot
+        self.interval = 1 / rate
+        self.degrees_per_inch = degrees_per_inch
+        self.track_width = track_width
+        self.history = collections.deque(maxlen=history_size)
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.thread = None
+        self.samples = 0
+        self.late = 0  # Samples taken more than a whole interval late (the robot was busy).
+        self.errors = 0  # Samples that raised (the encoders could not be read).
+        self.last_error = None
+        self.last_positions = None
+        self.current = Pose(time.time(), 0.0, 0.0, 0.0)
+
+    def start(self):
+        """Starts sampling (the pose carries on from where it was)."""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.last_positions = None
+            self.running.set()
+            self.thread = threading.Thread(target=self._run, name="odometry", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stops sampling, after one last sample."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+            self.running.clear()
+        if thread is not None:
+            thread.join()
+
+    def pose(self):
+        """
+        Returns the latest Pose (at most one interval old).
+
+        Type hints:
+          :rtype: Pose
+        """
+        with self.lock:
+            return self.current
+
+    def recent_poses(self, seconds=None):
+        """
+        Returns the kept poses, oldest first, or only those from the last seconds.
+
+        Type hints:
+          :type seconds: float | None
+          :rtype: list of Pose
+        """
+        with self.lock:
+            poses = list(self.history)
+        if seconds is not None:
+            since = time.time() - seconds
+            poses = [pose for pose in poses if pose.time >= since]
+        return poses
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        """Sets where the robot is now (heading in radians), and forgets the kept poses."""
+        with self.lock:
+            self.current = Pose(time.time(), x, y, heading)
+            self.history.clear()
+
+    def sample(self):
+        """Reads the encoders and moves the pose on by the arc driven since the last sample."""
+        positions = (self.robot.left_motor.position, self.robot.right_motor.position)
+        now = time.time()
+        with self.lock:
+            last_positions, self.last_positions = self.last_positions, positions
+            if last_positions is None:
+                return  # First sample, nothing to compare with yet.
+            _, x, y, heading = self.current
+            left_inches = (positions[0] - last_positions[0]) / self.degrees_per_inch
+            right_inches = (positions[1] - last_positions[1]) / self.degrees_per_inch
+            distance = (left_inches + right_inches) / 2
+            turn = (right_inches - left_inches) / self.track_width
+            if turn:
+                # Straight from the start to the end of the arc, which is a little shorter than the arc.
+                distance *= math.sin(turn / 2) / (turn / 2)
+            x += distance * math.cos(heading + turn / 2)
+            y += distance * math.sin(heading + turn / 2)
+            self.current = Pose(now, x, y, heading + turn)
+            self.history.append(self.current)
+            self.samples += 1
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while self.running.is_set():
+            self._sample_safely()
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay < -self.interval:
+                self.late += 1
+                next_sample = time.monotonic()  # Give up on the missed samples instead of rushing to catch up.
+            elif delay > 0:
+                time.sleep(delay)
+        self._sample_safely()
+
+    def _sample_safely(self):
+        try:
+            self.sample()
+        except Exception as error:
+            with self.lock:
+                self.errors += 1
+                self.last_error = error
+
 
 class Snatch3r(object):
     """Commands for the Snatch3r robot that might be useful in many different programs."""
 
     # DONE: Implement the Snatch3r class as needed when working the sandox exercises
     # (and delete these comments)
-    color_sensor = ev3.ColorSensor()
-    left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
-    right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
-    assert color_sensor
-    assert left_motor
-    assert right_motor
+    def __init__(self, devices=None):
+        # devices can be a robot_simulator.SimulatedDevices, to run without a robot.
+        self.devices = devices or DeviceRegistry()
+        self.motion_monitor = MotionMonitor()
+        self.odometry = None
 
-    def drive_inches(self, inches_to_drive, drive_speed_sp):
-        left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
-        right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
+    @property
+    def left_motor(self):
+        return self.devices.get(ev3.LargeMotor, ev3.OUTPUT_B)
 
-        # Check that the motors are actually connected
-        assert left_motor.connected
-        assert right_motor.connected
+    @property
+    def right_motor(self):
+        return self.devices.get(ev3.LargeMotor, ev3.OUTPUT_C)
+
+    @property
+    def arm_motor(self):
+        return self.devices.get(ev3.MediumMotor, ev3.OUTPUT_A)
+
+    @property
+    def touch_sensor(self):
+        return self.devices.get(ev3.TouchSensor)
+
+    @property
+    def color_sensor(self):
+        return self.devices.get(ev3.ColorSensor)
 
-        left_motor.run_to_rel_pos(position_sp=inches_to_drive * 90, speed_sp=drive_speed_sp)
-        right_motor.run_to_rel_pos(position_sp=inches_to_drive * 90, speed_sp=drive_speed_sp)
+    def rescan_devices(self, port=None):
+        """Call after plugging a motor or sensor in (or out), so it is searched for again."""
+        self.devices.rescan(port)
+
+    def drive_inches(self, inches_to_drive, drive_speed_sp):
+        left_motor, right_motor = self._run_drive_motors(inches_to_drive * 90, inches_to_drive * 90, drive_speed_sp)
         left_motor.wait_while(ev3.Motor.STATE_RUNNING)
         right_motor.wait_while(ev3.Motor.STATE_RUNNING)
         ev3.Sound.beep().wait()
 
     def turn_degrees(self, degrees_to_turn, turn_speed_sp):
-        left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
-        right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
+        left_motor, right_motor = self._run_drive_motors(degrees_to_turn, -1 * degrees_to_turn, turn_speed_sp)
+        left_motor.wait_while(ev3.Motor.STATE_RUNNING)
+        right_motor.wait_while(ev3.Motor.STATE_RUNNING)
+        ev3.Sound.beep().wait()
+
+    def drive_inches_async(self, inches_to_drive, drive_speed_sp):
+        """
+        Like drive_inches, but returns a MotionHandle right away (and doesn't beep), so the program can steer,
+        read sensors or move the arm while the robot drives.
+
+        Type hints:
+          :type inches_to_drive: float
+          :type drive_speed_sp: int
+          :rtype: MotionHandle
+        """
+        motors = self._run_drive_motors(inches_to_drive * 90, inches_to_drive * 90, drive_speed_sp)
+        return self.motion_monitor.watch(MotionHandle("drive_inches", motors, self.motion_monitor))
+
+    def turn_degrees_async(self, degrees_to_turn, turn_speed_sp):
+        """
+        Like turn_degrees, but returns a MotionHandle right away (and doesn't beep).
+
+        Type hints:
+          :type degrees_to_turn: float
+          :type turn_speed_sp: int
+          :rtype: MotionHandle
+        """
+        motors = self._run_drive_motors(degrees_to_turn, -1 * degrees_to_turn, turn_speed_sp)
+        return self.motion_monitor.watch(MotionHandle("turn_degrees", motors, self.motion_monitor))
+
+    def run_path(self, segments, speed_sp, blend_radius=None):
+        """
+        Drives a path of segments (made with straight, arc, turn or polygon) without stopping in between, and
+        returns the MotionQueue running it (wait on it, or add more segments with extend).  With blend_radius the
+        corners are cut with arcs so the robot keeps moving the whole way.
+
+        Example:
+          robot.run_path(robo.polygon(6, 25), 900).wait()
+
+        Type hints:
+          :type segments: list of PathSegment
+          :type speed_sp: int
+          :type blend_radius: float | None
+          :rtype: MotionQueue
+        """
+        queue = MotionQueue(self, speed_sp, blend_radius)
+        queue.extend(segments)
+        return queue
+
+    def start_odometry(self, rate=50, history_size=500):
+        """
+        Starts keeping track of where the robot is (see Odometry) and returns the Odometry, also kept as
+        self.odometry.  The robot's position now is (0, 0) facing along x.
+
+        Example:
+          odometry = robot.start_odometry()
+          robot.drive_inches(12, 600)
+          print(odometry.pose())    # About Pose(time=..., x=12.0, y=0.0, heading=0.0)
+
+        Type hints:
+          :type rate: float
+          :type history_size: int
+          :rtype: Odometry
+        """
+        if self.odometry is None:
+            self.odometry = Odometry(self, rate, history_size)
+        self.odometry.start()
+        return self.odometry
+
+    def _run_drive_motors(self, left_degrees, right_degrees, speed_sp):
+        """Starts both drive motors towards positions relative to where they are, returns the two motors."""
+        left_motor = self.left_motor
+        right_motor = self.right_motor
 
         # Check that the motors are actually connected
         assert left_motor.connected
         assert right_motor.connected
 
-        left_motor.run_to_rel_pos(position_sp=degrees_to_turn, speed_sp=turn_speed_sp)
-        right_motor.run_to_rel_pos(position_sp=(-1 * degrees_to_turn), speed_sp=turn_speed_sp)
-        left_motor.wait_while(ev3.Motor.STATE_RUNNING)
-        right_motor.wait_while(ev3.Motor.STATE_RUNNING)
-        ev3.Sound.beep().wait()
+        left_motor.run_to_rel_pos(position_sp=left_degrees, speed_sp=speed_sp)
+        right_motor.run_to_rel_pos(position_sp=right_degrees, speed_sp=speed_sp)
+        return [left_motor, right_motor]
 
     def arm_calibration(self):
-        arm_motor = ev3.MediumMotor(ev3.OUTPUT_A)
+        arm_motor = self.arm_motor
         assert arm_motor.connected
 
-        touch_sensor = ev3.TouchSensor()
+        touch_sensor = self.touch_sensor
         assert touch_sensor
 
         arm_motor.run_forever(speed_sp=900)
-        while not touch_sensor.is_pressed:
-            time.sleep(0.01)
+        device_waits.wait_until((touch_sensor, "is_pressed"))
 
         arm_revolutions_for_full_range = 14.2
         if touch_sensor.is_pressed:
@@ -83,26 +784,31 @@ class Snatch3r(object):
             arm_motor.position = 0
 
     def arm_up(self):
-        arm_motor = ev3.MediumMotor(ev3.OUTPUT_A)
+        arm_motor = self.arm_motor
         assert arm_motor.connected
 
-        touch_sensor = ev3.TouchSensor()
+        touch_sensor = self.touch_sensor
         assert touch_sensor
         arm_motor.run_forever(speed_sp=900)
-        while not touch_sensor.is_pressed:
-            time.sleep(0.01)
+        device_waits.wait_until((touch_sensor, "is_pressed"))
         arm_motor.stop()
         ev3.Sound.beep().wait()
 
     def arm_down(self):
-        arm_motor = ev3.MediumMotor(ev3.OUTPUT_A)
+        arm_motor = self.arm_motor
         assert arm_motor.connected
 
-        touch_sensor = ev3.TouchSensor()
+        touch_sensor = self.touch_sensor
         assert touch_sensor
         arm_motor.run_to_abs_pos(position_sp=0, speed_sp=900)
         arm_motor.wait_while(ev3.Motor.STATE_STALLED)  # Blocks until the motor finishes running
         ev3.Sound.beep().wait()
 
+    def stop(self):
+        """Stops the drive motors, which also ends a drive_inches or turn_degrees that is running."""
+        self.motion_monitor.cancel_all()
+        self.left_motor.stop(stop_action=ev3.Motor.STOP_ACTION_BRAKE)
+        self.right_motor.stop(stop_action=ev3.Motor.STOP_ACTION_BRAKE)
+
     def shutdown(self):
         print('Press Ctrl C to end the program')
@@ -0,0 +1,261 @@
+"""
+  A simulated Snatch3r, for trying robot_controller code on a PC without a robot.
+
+  The simulated motors and sensors stand in for the ev3dev objects the Snatch3r uses (only the parts the
+  Snatch3r uses).  Motors move at their speed_sp from the moment a run command is given (no acceleration), and
+  their positions (and the robot's pose) are worked out from the clock whenever one is read, so nothing runs in
+  the background.  The touch sensor is pressed once the arm motor has gone up ARM_TOP degrees.  The robot keeps
+  its true pose (x and y in inches, heading in radians) from the wheel motors, to check odometry against.
+
+  Example:
+    import robot_controller as robo
+    import robot_simulator
+
+    robot = robo.Snatch3r(robot_simulator.SimulatedDevices())
+    robot.drive_inches_async(12, 600).wait()
+    print(robot.devices.pose())        # About (12.0, 0.0, 0.0)
+
+  (drive_inches itself would beep when done, which needs the EV3's beep program.)
+
+  Running robot_controller still needs the ev3dev library installed (pip install python-ev3dev) since it is
+  imported, but no EV3 is used.
+"""
+
+import math
+import threading
+import time
+
+# The Snatch3r's drive geometry: 90 motor degrees per inch driven (a 4 inch wheel circumference) and the distance
+# between the wheels (about 6.37 inches), which makes 5 motor degrees of each wheel turn the robot 1 degree.
+DEGREES_PER_INCH = 90
+TRACK_WIDTH = 20 / math.pi
+ARM_TOP = 14.2 * 360  # Arm motor degrees from the bottom to the touch sensor.
+
+STATE_RUNNING = "running"
+
+
+class SimulatedMotor(object):
+    """Looks enough like an ev3dev LargeMotor or MediumMotor for the Snatch3r.  Made by SimulatedDevices."""
+
+    STATE_RUNNING = STATE_RUNNING
+    STOP_ACTION_BRAKE = "brake"
+
+    def __init__(self, address, devices, max_speed=1050):
+        """
+        Type hints:
+          :type address: str
+          :type devices: SimulatedDevices
+          :type max_speed: int
+        """
+        self.address = address
+        self.devices = devices
+        self.max_speed = max_speed
+        self.connected = True
+        self.count_per_rot = 360
+        self.speed_sp = 0
+        self.position_sp = 0
+        self.stop_action = "coast"
+        self.commands = 0  # Run and stop commands given, to see how busy a program keeps the motor.
+        self.exact_position = 0.0
+        self.velocity = 0.0  # Degrees per second while running.
+        self.target = None  # Position a run_to command stops at.
+
+    def run_forever(self, **kwargs):
+        with self.devices.lock:
+            self._set(kwargs)
+            self._start(None)
+
+    def run_to_rel_pos(self, **kwargs):
+        with self.devices.lock:
+            self._set(kwargs)
+            self._start(self.exact_position + self.position_sp)
+
+    def run_to_abs_pos(self, **kwargs):
+        with self.devices.lock:
+            self._set(kwargs)
+            self._start(float(self.position_sp))
+
+    def stop(self, **kwargs):
+        with self.devices.lock:
+            self.devices.advance()
+            self._set(kwargs)
+            self.velocity = 0.0
+            self.target = None
+            self.commands += 1
+
+    @property
+    def position(self):
+        with self.devices.lock:
+            self.devices.advance()
+            return int(round(self.exact_position))
+
+    @position.setter
+    def position(self, value):
+        with self.devices.lock:
+            self.devices.advance()
+            if self.target is not None:
+                self.target += value - self.exact_position
+            self.exact_position = float(value)
+
+    @property
+    def speed(self):
+        with self.devices.lock:
+            self.devices.advance()
+            return int(self.velocity)
+
+    @property
+    def state(self):
+        with self.devices.lock:
+            self.devices.advance()
+            return [STATE_RUNNING] if self.velocity else []
+
+    @property
+    def is_running(self):
+        return STATE_RUNNING in self.state
+
+    def wait_while(self, s, timeout=None):
+        """Blocks until s is not in the state (timeout in milliseconds, like ev3dev)."""
+        deadline = None if timeout is None else self.devices.clock() + timeout / 1000
+        while s in self.state:
+            if deadline is not None and self.devices.clock() >= deadline:
+                return False
+            time.sleep(min(self.time_left() or 0.001, 0.01))
+        return True
+
+    def time_left(self):
+        """Seconds until a run_to command gets to its position (None if not running to a position)."""
+        with self.devices.lock:
+            if self.target is None or not self.velocity:
+                return None
+            return max(0.0, (self.target - self.exact_position) / self.velocity)
+
+    def _set(self, kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def _start(self, target):
+        # Caller must hold self.devices.lock.
+        self.devices.advance()
+        speed = max(-self.max_speed, min(self.max_speed, self.speed_sp))
+        if target is None:
+            self.velocity = float(speed)
+        elif target == self.exact_position:
+            self.velocity = 0.0
+            target = None
+        else:
+            self.velocity = math.copysign(abs(speed), target - self.exact_position)
+        self.target = target if self.velocity else None
+        self.commands += 1
+
+
+class SimulatedTouchSensor(object):
+    """A touch sensor that is pressed while the arm is up (or while pressed is set to True)."""
+
+    def __init__(self, arm_motor=None):
+        self.connected = True
+        self.arm_motor = arm_motor
+        self.pressed = False
+
+    @property
+    def is_pressed(self):
+        return self.pressed or (self.arm_motor is not None and self.arm_motor.position >= ARM_TOP)
+
+
+class SimulatedColorSensor(object):
+    def __init__(self):
+        self.connected = True
+        self.color = 0
+        self.reflected_light_intensity = 50
+        self.ambient_light_intensity = 10
+
+
+class SimulatedDevices(object):
+    """
+    Hands out the simulated devices in place of a robot_controller.DeviceRegistry, and keeps the robot's true
+    pose from the left (B) and right (C) motors.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        """
+        Type hints:
+          :type clock: callable
+        """
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.updated = clock()
+        self.motors = {port: SimulatedMotor(port, self) for port in ("outA", "outB", "outC", "outD")}
+        self.touch_sensor = SimulatedTouchSensor(self.motors["outA"])
+        self.color_sensor = SimulatedColorSensor()
+        self.scans = 0
+        self._pose = (0.0, 0.0, 0.0)
+
+    def get(self, device_class, port=None):
+        """
+        Returns the simulated device for an ev3dev class (LargeMotor, MediumMotor, TouchSensor or ColorSensor).
+
+        Type hints:
+          :type device_class: type
+          :type port: str | None
+        """
+        name = device_class.__name__
+        if name.endswith("Motor"):
+            return self.motors[port or "outA"]
+        if name == "TouchSensor":
+            return self.touch_sensor
+        if name == "ColorSensor":
+            return self.color_sensor
+        raise ValueError("No simulated {}".format(name))
+
+    def rescan(self, port=None):
+        pass  # Simulated devices never come and go.
+
+    def pose(self):
+        """
+        Returns the robot's true (x, y, heading) now, in inches and radians, starting from (0, 0, 0) facing x.
+
+        Type hints:
+          :rtype: (float, float, float)
+        """
+        with self.lock:
+            self.advance()
+            return self._pose
+
+    def advance(self):
+        """
+        Moves every motor (and the pose) on to now.  Between two commands the motors keep a constant speed
+        except when one gets to its position and stops, so the time is split there and each piece is exact.
+        """
+        with self.lock:
+            now = self.clock()
+            while self.updated < now:
+                arrivals = {}
+                for motor in self.motors.values():
+                    time_left = motor.time_left()
+                    if time_left is not None:
+                        arrivals[motor] = self.updated + time_left
+                piece_end = min([now] + list(arrivals.values()))
+                elapsed = piece_end - self.updated
+                left, right = self.motors["outB"], self.motors["outC"]
+                self._drive(left.velocity * elapsed / DEGREES_PER_INCH, right.velocity * elapsed / DEGREES_PER_INCH)
+                for motor in self.motors.values():
+                    if motor in arrivals and arrivals[motor] <= piece_end:
+                        motor.exact_position = motor.target
+                        motor.velocity = 0.0
+                        motor.target = None
+                    elif motor.velocity:
+                        motor.exact_position += motor.velocity * elapsed
+                self.updated = piece_end
+
+    def _drive(self, left_inches, right_inches):
+        # Caller must hold self.lock.  Follows the arc driven with the wheels turning at constant speeds.
+        x, y, heading = self._pose
+        distance = (left_inches + right_inches) / 2
+        turn = (right_inches - left_inches) / TRACK_WIDTH
+        if abs(turn) < 1e-12:
+            x += distance * math.cos(heading)
+            y += distance * math.sin(heading)
+        else:
+            radius = distance / turn
+            x += radius * (math.sin(heading + turn) - math.sin(heading))
+            y -= radius * (math.cos(heading + turn) - math.cos(heading))
+        self._pose = (x, y, heading + turn)
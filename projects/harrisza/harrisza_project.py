@@ -79,7 +79,6 @@ class DataContainer(object):
 
 
 def handle_move_left_forward(button_state, robot):
-    robot.left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
     if button_state:
         robot.left_motor.run_forever(speed_sp=900)
     else:
@@ -87,7 +86,6 @@ def handle_move_left_forward(button_state, robot):
 
 
 def handle_move_left_back(button_state, robot):
-    robot.left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
     if button_state:
         robot.left_motor.run_forever(speed_sp=-900)
     else:
@@ -95,7 +93,6 @@ def handle_move_left_back(button_state, robot):
 
 
 def handle_move_right_forward(button_state, robot):
-    robot.right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
     if button_state:
         robot.right_motor.run_forever(speed_sp=900)
     else:
@@ -103,7 +100,6 @@ def handle_move_right_forward(button_state, robot):
 
 
 def handle_move_right_back(button_state, robot):
-    robot.right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
     if button_state:
         robot.right_motor.run_forever(speed_sp=-900)
     else:
@@ -161,37 +157,42 @@ def handle_shutdown(button_state, dc):
 def draw_triangle(button_state, robot):
     if button_state:
         ev3.Sound.speak("Drawing triangle").wait()
-        turn_amount1 = 120 * 5
-        for k in range(3):
-            robot.drive_inches(25, 900)
-            robot.turn_degrees(turn_amount1, 900)
+        draw_shape(robot, 3, 120)
 
 
 def draw_square(button_state, robot):
     if button_state:
         ev3.Sound.speak("Drawing square").wait()
-        turn_amount2 = 90 * 5
-        for k in range(4):
-            robot.drive_inches(25, 900)
-            robot.turn_degrees(turn_amount2, 900)
+        draw_shape(robot, 4, 90)
 
 
 def draw_pentagon(button_state, robot):
     if button_state:
         ev3.Sound.speak("Drawing pentagon").wait()
-        turn_amount3 = 72 * 4.75
-        for k in range(5):
-            robot.drive_inches(25, 900)
-            robot.turn_degrees(turn_amount3, 900)
+        draw_shape(robot, 5, 72 * 4.75 / 5)
 
 
 def draw_hexagon(button_state, robot):
     if button_state:
         ev3.Sound.speak("Drawing hexagon").wait()
-        turn_amount4 = 60 * 4.5
-        for k in range(6):
-            robot.drive_inches(25, 900)
-            robot.turn_degrees(turn_amount4, 900)
+        draw_shape(robot, 6, 60 * 4.5 / 5)
+
+
+def draw_shape(robot, sides, turn_amount):
+    """
+    Drives the sides of a shape as one path, so the robot doesn't stop (or beep) at every corner.  turn_amount is
+    in robot degrees to the right, like the turn_degrees corners it replaces (the turns were tuned on the robot,
+    so they aren't always 360 / sides).
+
+    Type hints:
+      :type robot: robo.Snatch3r
+      :type sides: int
+      :type turn_amount: float
+    """
+    path = []
+    for k in range(sides):
+        path.extend([robo.straight(25), robo.turn(-turn_amount)])  # robo.turn turns left for positive degrees.
+    robot.run_path(path, 900).wait()
 
 
 def dance_1(button_state, robot):
@@ -87,10 +87,6 @@ def drive_to_color(button_state, robot, color_to_seek):
       :type robot: robo.Snatch3r
       :type color_to_seek: int
     """
-    robot.left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
-    robot.right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
-    robot.color_sensor = ev3.ColorSensor()
-
     assert robot.color_sensor
     assert robot.left_motor.connected
     assert robot.right_motor.connected
@@ -109,7 +109,6 @@ def main():
 
 
 def handle_move_left_forward(button_state, robot):
-    robot.left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
     if button_state:
         robot.left_motor.run_forever(speed_sp=300)
     else:
@@ -117,7 +116,6 @@ def handle_move_left_forward(button_state, robot):
 
 
 def handle_move_left_back(button_state, robot):
-    robot.left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
     if button_state:
         robot.left_motor.run_forever(speed_sp=-300)
     else:
@@ -125,7 +123,6 @@ def handle_move_left_back(button_state, robot):
 
 
 def handle_move_right_forward(button_state, robot):
-    robot.right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
     if button_state:
         robot.right_motor.run_forever(speed_sp=300)
     else:
@@ -133,7 +130,6 @@ def handle_move_right_forward(button_state, robot):
 
 
 def handle_move_right_back(button_state, robot):
-    robot.right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
     if button_state:
         robot.right_motor.run_forever(speed_sp=-300)
     else:
@@ -36,6 +36,9 @@ import robot_controller as robo
 def main():
     robot = robo.Snatch3r()
     mqtt_client = com.MqttClient(robot)
+    # With heartbeats from the PC (com.HeartbeatOptions(interval=0.5) there) the robot can stop itself if the PC
+    # goes away:
+    # mqtt_client = com.MqttClient(robot, heartbeat=com.HeartbeatOptions(watchdog_timeout=1.5, watchdog_method="stop"))
     mqtt_client.connect_to_pc()
     # mqtt_client.connect_to_pc("35.194.247.175")  # Off campus IP address of a GCP broker
     robot.loop_forever()  # Calls a function that has a while True: loop within it to avoid letting the program end.
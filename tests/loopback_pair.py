@@ -0,0 +1,70 @@
+"""
+  Helpers for the MQTT tests: a delegate that records its calls, and a PC and an EV3 MqttClient connected to each
+  other through a LoopbackBroker (from the benchmarks folder).
+"""
+
+import json
+import threading
+import time
+
+import mqtt_remote_method_calls as com
+from loopback_broker import LoopbackBroker
+
+
+class RecordingDelegate(object):
+    """Remembers the calls it gets, in order."""
+
+    def __init__(self):
+        self.calls = []
+        self.called = threading.Event()
+
+    def drive(self, left_speed, right_speed):
+        self.calls.append(("drive", left_speed, right_speed))
+        self.called.set()
+
+    def stop(self):
+        self.calls.append(("stop",))
+        self.called.set()
+
+    def add(self, x, y):
+        return x + y
+
+    def wait_for_calls(self, count, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while len(self.calls) < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return len(self.calls) >= count
+
+
+def connect_pair(ev3_options=None, pc_options=None, delegate=None, pc_delegate=None):
+    """
+    Returns (broker, ev3_client, pc_client), connected to each other through a new LoopbackBroker (and done with
+    their hello messages, if either asked for the binary codec).
+    """
+    broker = LoopbackBroker()
+    ev3_client = com.MqttClient(delegate, **(ev3_options or {}))
+    ev3_client.client = broker.create_client()
+    ev3_client.connect_to_pc("localhost")
+    pc_client = com.MqttClient(pc_delegate, **(pc_options or {}))
+    pc_client.client = broker.create_client()
+    pc_client.connect_to_ev3("localhost")
+    clients = (ev3_client, pc_client)
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline and not all(
+            client.online and (client.preferred_codec == "json" or client.remote_methods is not None)
+            for client in clients):
+        time.sleep(0.005)
+    return broker, ev3_client, pc_client
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def send_raw(broker, client, message):
+    """Publishes a message (JSON encoded, unless it is bytes already) to the topic client subscribes to."""
+    broker.publish(client.subscription_topic_name, message if isinstance(message, bytes) else
+                   json.dumps(message).encode())
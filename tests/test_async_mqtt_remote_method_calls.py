@@ -0,0 +1,170 @@
+"""
+  Tests for the AsyncMqttClient in libs/async_mqtt_remote_method_calls.py, over the broker in libs/mqtt_broker.py.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+import async_mqtt_remote_method_calls as acom
+import mqtt_broker
+import mqtt_remote_method_calls as com
+
+
+class Delegate(object):
+
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+
+    def drive(self, left_speed, right_speed):
+        self.calls.append(("drive", left_speed, right_speed))
+        self.threads.add(threading.get_ident())
+
+    async def add(self, x, y):
+        await asyncio.sleep(0)
+        return x + y
+
+
+class PcDelegate(Delegate):
+
+    def add(self, x, y):
+        return x + y
+
+
+class AsyncMqttClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = mqtt_broker.MqttBroker(port=0)
+        self.broker.start()
+        self.addCleanup(self.broker.stop)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.delegate = Delegate()
+        self.client = acom.AsyncMqttClient(self.delegate)
+        self.pc_client = com.MqttClient(offline=com.OfflineOptions(reconnect_min_delay=0.05, reconnect_max_delay=0.05))
+        self.pc_client.connect_to_ev3("127.0.0.1", mqtt_broker_port=self.broker.port)
+        self.addCleanup(self.pc_client.close)
+
+    def run_async(self, coroutine, timeout=5):
+        return self.loop.run_until_complete(asyncio.wait_for(coroutine, timeout))
+
+    async def wait_for(self, condition, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return condition()
+
+    def test_calls_and_replies(self):
+        async def main():
+            await self.client.connect_to_pc("127.0.0.1", mqtt_broker_port=self.broker.port)
+            self.assertTrue(await self.wait_for(lambda: self.pc_client.online))
+            self.pc_client.send_message("drive", [600, -600])
+            self.assertTrue(await self.wait_for(lambda: self.delegate.calls))
+            future = self.pc_client.call("add", [2, 3])
+            self.assertEqual(await self.loop.run_in_executor(None, future.result, 3), 5)
+            await self.client.close()
+
+        self.run_async(main())
+        self.assertEqual(self.delegate.calls, [("drive", 600, -600)])
+        self.assertEqual(self.delegate.threads, {threading.get_ident()})
+
+    def test_reconnects_and_sends_what_was_queued(self):
+        # Slower than the PC end, so the PC has subscribed again by the time the queued message is sent.
+        self.client.reconnect_min_delay = self.client.reconnect_max_delay = 0.5
+
+        async def main():
+            await self.client.connect_to_pc("127.0.0.1", mqtt_broker_port=self.broker.port)
+            self.pc_client.delegate = Delegate()
+            received = self.pc_client.delegate.calls
+            await self.loop.run_in_executor(None, self.broker.stop)
+            self.assertTrue(await self.wait_for(lambda: not self.client.online))
+            self.client.send_message("drive", [1, 2])
+            with self.assertRaises(ConnectionError):
+                await self.client.publish("drive", [3, 4])
+            await self.loop.run_in_executor(None, self.broker.start)
+            self.assertTrue(await self.wait_for(lambda: received))
+            self.assertEqual(received, [("drive", 1, 2)])
+            self.assertGreaterEqual(self.client.outages, 1)
+            await self.client.close()
+
+        self.run_async(main(), timeout=15)
+
+    def test_connecting_does_not_block_the_loop(self):
+        reconnect = self.client.client.reconnect
+
+        def slow_reconnect():
+            time.sleep(0.3)  # Like a broker that takes its time to answer.
+            return reconnect()
+
+        self.client.client.reconnect = slow_reconnect
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            ticker = asyncio.ensure_future(tick())
+            await self.client.connect_to_pc("127.0.0.1", mqtt_broker_port=self.broker.port)
+            ticker.cancel()
+            self.client.send_message("drive", [1, 2])
+            self.pc_client.delegate = Delegate()
+            self.assertTrue(await self.wait_for(lambda: self.pc_client.delegate.calls))
+            await self.client.close()
+
+        self.run_async(main())
+        self.assertGreater(len(ticks), 10)
+
+    def test_submit_from_another_thread_runs_on_the_loop(self):
+        async def main():
+            await self.client.connect_to_pc("127.0.0.1", mqtt_broker_port=self.broker.port)
+            invocation = com.Invocation("drive", self.delegate.drive, [5, 6])
+            thread = threading.Thread(target=self.client.executor.submit, args=(invocation,))
+            thread.start()
+            thread.join()
+            self.assertTrue(await self.wait_for(lambda: self.delegate.calls))
+            await self.client.close()
+
+        self.run_async(main())
+        self.assertEqual(self.delegate.threads, {threading.get_ident()})
+
+    def test_remote_proxy(self):
+        self.pc_client.delegate = PcDelegate()
+
+        async def main():
+            await self.client.connect_to_pc("127.0.0.1", mqtt_broker_port=self.broker.port)
+            self.assertTrue(await self.wait_for(lambda: self.pc_client.online))
+            signatures = await self.client.describe_remote(timeout=3)
+            self.assertEqual(signatures["drive"], [2, 2])
+            robot = await self.client.remote_proxy()
+            robot.drive(1, 2)
+            with self.assertRaises(TypeError):
+                robot.drive(1)
+            self.assertEqual(await robot.call.add(2, 3), 5)
+            self.assertEqual(self.pc_client.delegate.calls, [("drive", 1, 2)])
+            await self.client.close()
+
+        self.run_async(main())
+
+    def test_sync_clock(self):
+        self.pc_client.clock = lambda: time.time() - 50
+
+        async def main():
+            await self.client.connect_to_pc("127.0.0.1", mqtt_broker_port=self.broker.port)
+            self.assertTrue(await self.wait_for(lambda: self.pc_client.online))
+            self.assertAlmostEqual(await self.client.sync_clock(samples=3), -50, delta=0.05)
+            self.client.start_clock_sync(interval=0.05, samples=1)
+            self.assertTrue(await self.wait_for(lambda: self.client.clock_stats()["sync"]["samples"] >= 5))
+            await self.client.close()
+
+        self.run_async(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+  Tests for libs/device_waits.py, against the pretend sysfs tree from the benchmarks.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+  (needs python-ev3dev installed on the PC, pip install python-ev3dev)
+"""
+
+import os
+import threading
+import time
+import unittest
+
+import device_waits
+import ev3dev.ev3 as ev3
+from fake_sysfs import FakeSysfs
+
+
+class WaitUntilTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = FakeSysfs()
+        self.sysfs.__enter__()
+        self.addCleanup(self.sysfs.__exit__, None, None, None)
+        self.motor = ev3.LargeMotor(ev3.OUTPUT_B)
+
+    def set_state(self, state):
+        with open(os.path.join(self.sysfs.root, "tacho-motor", "motor1", "state"), "w") as file:
+            file.write(state + "\n")
+
+    def test_motor_state(self):
+        self.set_state("running")
+        timer = threading.Timer(0.05, self.set_state, [""])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        # The pretend tree never notifies, so this is the check after the first slice of MAX_POLL_BLOCK.
+        self.assertTrue(device_waits.wait_until(lambda: not self.motor.is_running, timeout=2, motor=self.motor))
+
+    def test_motor_state_timeout(self):
+        self.set_state("running")
+        started = time.monotonic()
+        self.assertFalse(device_waits.wait_until(lambda: not self.motor.is_running, timeout=0.1, motor=self.motor))
+        self.assertLess(time.monotonic() - started, device_waits.MAX_POLL_BLOCK)
+
+    def test_shared_poller(self):
+        pressed = threading.Event()
+        timer = threading.Timer(0.05, pressed.set)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertTrue(device_waits.wait_until(pressed.is_set, timeout=2))
+        self.assertFalse(device_waits.wait_until(lambda: False, timeout=0.05))
+
+    def test_thread_cpu_time(self):
+        first = device_waits._thread_cpu_time()
+        sum(range(100000))
+        self.assertGreaterEqual(device_waits._thread_cpu_time(), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+  Tests for the small MQTT broker in libs/mqtt_broker.py.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+"""
+
+import socket
+import threading
+import unittest
+
+import mqtt_broker
+
+
+class MqttBrokerTest(unittest.TestCase):
+
+    def test_start_raises_when_the_port_is_taken(self):
+        broker = mqtt_broker.MqttBroker(port=0)
+        broker.start()
+        self.addCleanup(broker.stop)
+        second = mqtt_broker.MqttBroker(port=broker.port)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.start_error(second)), daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), "start hung")
+        self.assertIsInstance(result[0], OSError)
+        self.assertIsNone(second.loop)
+        second.stop()  # Does nothing, it never started.
+
+    @staticmethod
+    def start_error(broker):
+        try:
+            broker.start()
+        except OSError as error:
+            return error
+        return None
+
+    def test_restart_on_the_same_port(self):
+        broker = mqtt_broker.MqttBroker(port=0)
+        broker.start()
+        port = broker.port
+        broker.stop()
+        broker.start()
+        self.addCleanup(broker.stop)
+        self.assertEqual(broker.port, port)
+
+    def test_garbled_packets_close_only_their_connection(self):
+        broker = mqtt_broker.MqttBroker(port=0)
+        broker.start()
+        self.addCleanup(broker.stop)
+        errors = []
+        broker.loop.call_soon_threadsafe(broker.loop.set_exception_handler,
+                                         lambda loop, context: errors.append(context))
+        encode_packet, encode_string = mqtt_broker.encode_packet, mqtt_broker.encode_string
+        connect = encode_packet(mqtt_broker.CONNECT, 0, encode_string("MQTT") + b"\x04\x02\x00\x3c" +
+                                encode_string("garbled"))
+        for packets in (encode_packet(mqtt_broker.CONNECT, 0, encode_string("MQTT") + b"\x04"),  # No keep alive.
+                        encode_packet(mqtt_broker.CONNECT, 0, b"\x00\x02\xff\xfe"),  # Not UTF-8.
+                        connect + encode_packet(mqtt_broker.SUBSCRIBE, 2, b"\x00\x01" +
+                                                encode_string("lego07/msg4pc"))):  # No QoS.
+            with socket.create_connection(("127.0.0.1", broker.port), timeout=5) as sock:
+                sock.sendall(packets)
+                self.assertEqual(self.read_until_closed(sock)[4:], b"")  # Only the CONNACK, if any.
+        with socket.create_connection(("127.0.0.1", broker.port), timeout=5) as sock:
+            sock.sendall(connect)
+            self.assertEqual(sock.recv(4), encode_packet(mqtt_broker.CONNACK, 0, b"\x00\x00"))
+        self.assertEqual(errors, [])
+
+    @staticmethod
+    def read_until_closed(sock):
+        received = b""
+        while True:
+            data = sock.recv(1024)
+            if not data:
+                return received
+            received += data
+
+    def test_topic_matches(self):
+        self.assertTrue(mqtt_broker.topic_matches("lego07/msg4pc", "lego07/msg4pc"))
+        self.assertTrue(mqtt_broker.topic_matches("+/msg4pc", "lego07/msg4pc"))
+        self.assertTrue(mqtt_broker.topic_matches("lego07/#", "lego07/msg4pc/reply"))
+        self.assertFalse(mqtt_broker.topic_matches("+/msg4pc", "lego07/msg4ev3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
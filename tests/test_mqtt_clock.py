@@ -0,0 +1,111 @@
+"""
+  Tests for the clock synchronization in libs/mqtt_clock.py, and sync_clock / execute_at of the MqttClient.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+"""
+
+import threading
+import time
+import unittest
+
+import mqtt_clock
+import mqtt_remote_method_calls as com
+from loopback_pair import RecordingDelegate, connect_pair, send_raw
+
+
+class ClockSyncTest(unittest.TestCase):
+
+    def test_symmetric_delay_gives_the_exact_offset(self):
+        clock_sync = mqtt_clock.ClockSync()
+        # The other clock is 100 s ahead, each way takes 0.02 s and the answer takes 0.001 s.
+        clock_sync.add_sample(10.0, 110.02, 110.021, 10.041)
+        self.assertAlmostEqual(clock_sync.offset, 100.0)
+        self.assertAlmostEqual(clock_sync.stats()["delay"], 0.04)
+
+    def test_sample_with_the_smallest_delay_is_trusted(self):
+        clock_sync = mqtt_clock.ClockSync()
+        clock_sync.add_sample(0.0, -4.5, -4.5, 0.6)  # 0.5 s there and 0.1 s back: off by 0.2 s.
+        clock_sync.add_sample(1.0, -3.99, -3.99, 1.02)
+        clock_sync.add_sample(2.0, -2.85, -2.85, 2.2)
+        self.assertAlmostEqual(clock_sync.offset, -5.0)
+        stats = clock_sync.stats()
+        self.assertEqual(stats["samples"], 3)
+        self.assertAlmostEqual(stats["delay"], 0.02)
+        self.assertGreater(stats["jitter"], 0.0)
+
+    def test_no_samples(self):
+        clock_sync = mqtt_clock.ClockSync()
+        self.assertIsNone(clock_sync.offset)
+        self.assertEqual(clock_sync.stats(), {"offset": None, "delay": None, "jitter": None, "samples": 0})
+
+
+class ScheduledCallsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduled_calls = mqtt_clock.ScheduledCalls(time.time)
+        self.addCleanup(self.scheduled_calls.shutdown)
+
+    def test_runs_in_time_order(self):
+        ran = []
+        done = threading.Event()
+        now = time.time()
+        self.assertTrue(self.scheduled_calls.schedule(now + 0.1, lambda: (ran.append(2), done.set())))
+        self.assertTrue(self.scheduled_calls.schedule(now + 0.05, lambda: ran.append(1)))
+        self.assertTrue(done.wait(2))
+        self.assertEqual(ran, [1, 2])
+
+    def test_times_that_are_not_numbers_are_dropped(self):
+        for at in ("soon", None, [1], True, float("nan"), float("inf")):
+            self.assertFalse(self.scheduled_calls.schedule(at, lambda: None))
+        stats = self.scheduled_calls.stats()
+        self.assertEqual((stats["invalid"], stats["scheduled"], stats["waiting"]), (6, 0, 0))
+
+
+class SyncClockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = RecordingDelegate()
+        # The EV3's clock is 1000 s ahead of the PC's.
+        self.broker, self.ev3_client, self.pc_client = connect_pair({"clock": lambda: time.time() + 1000},
+                                                                    delegate=self.delegate)
+        self.addCleanup(self.ev3_client.close)
+        self.addCleanup(self.pc_client.close)
+
+    def test_offset_estimate(self):
+        offset = self.pc_client.sync_clock(samples=4)
+        self.assertAlmostEqual(offset, 1000, delta=0.05)
+        self.assertEqual(self.pc_client.clock_stats()["sync"]["samples"], 4)
+
+    def test_batching_and_rate_limits_do_not_skew_the_offset(self):
+        broker, ev3_client, pc_client = connect_pair(
+            {"clock": lambda: time.time() + 1000},
+            {"batching": com.BatchOptions(window=0.2), "rate_limits": com.RateLimitOptions(topic=com.RateLimit(2))})
+        self.addCleanup(ev3_client.close)
+        self.addCleanup(pc_client.close)
+        self.assertAlmostEqual(pc_client.sync_clock(samples=4), 1000, delta=0.05)
+
+    def test_offline(self):
+        client = com.MqttClient()
+        self.addCleanup(client.close)
+        with self.assertRaises(com.RemoteCallError):
+            client.sync_clock(samples=1)
+
+    def test_execute_at_runs_on_the_other_clock(self):
+        self.pc_client.sync_clock(samples=4)
+        self.pc_client.send_message("stop", execute_at=time.time() + 0.2)
+        self.assertFalse(self.delegate.wait_for_calls(1, timeout=0.1))
+        self.assertTrue(self.delegate.wait_for_calls(1))
+        self.assertLess(self.ev3_client.clock_stats()["scheduled"]["lateness"]["max"], 0.1)
+
+    def test_execution_time_that_is_not_a_number(self):
+        send_raw(self.broker, self.ev3_client, {"type": "stop", "at": "now"})
+        send_raw(self.broker, self.ev3_client, b'{"type": "stop", "at": NaN}')
+        self.pc_client.send_message("drive", [1, 2])
+        self.assertTrue(self.delegate.wait_for_calls(1))
+        time.sleep(0.05)
+        self.assertEqual(self.delegate.calls, [("drive", 1, 2)])
+        self.assertEqual(self.ev3_client.clock_stats()["scheduled"]["invalid"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+  Tests for the message codecs in libs/mqtt_codecs.py.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+"""
+
+import random
+import unittest
+
+import mqtt_codecs
+
+METHODS = ["arm_down", "arm_up", "drive", "drive_inches", "set_led"]
+
+MESSAGES = [
+    {"type": "drive_inches", "payload": [24, 500]},
+    {"type": "arm_up"},
+    {"type": "set_led", "payload": ["left", "green"]},
+    {"type": "not_in_the_list", "payload": [1.5, -3, None, True, False, "x" * 40, b"\x00\x01"]},
+    {"type": "drive", "payload": [600, -600], "id": "ab12:7", "pri": 3, "ts": 1234.5},
+    {"type": "drive", "payload": [[1, 2]] * 20 + [{"nested": {"deep": list(range(40))}}], "seq": 2 ** 40},
+    [{"type": "drive", "payload": [600, -600]}] * 20,
+]
+
+
+def binary_codec():
+    codec = mqtt_codecs.BinaryCodec()
+    codec.set_remote_methods(METHODS)
+    codec.set_local_methods(METHODS)
+    return codec
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def test_both_codecs_round_trip(self):
+        for codec in (mqtt_codecs.JsonCodec(), binary_codec()):
+            for message in MESSAGES:
+                if codec.name == "json" and message is MESSAGES[3]:
+                    continue  # JSON can't send bytes.
+                self.assertEqual(codec.decode(codec.encode(message)), message)
+
+    def test_encode_call_matches_encode(self):
+        for codec in (mqtt_codecs.JsonCodec(), binary_codec()):
+            for name in ("drive", "not_in_the_list"):
+                self.assertEqual(codec.encode_call(name, [600, -600]),
+                                 codec.encode({"type": name, "payload": [600, -600]}))
+
+    def test_frames_are_told_apart(self):
+        self.assertEqual(mqtt_codecs.codec_name_for_frame(binary_codec().encode(MESSAGES[0])), "binary")
+        self.assertEqual(mqtt_codecs.codec_name_for_frame(mqtt_codecs.JsonCodec().encode(MESSAGES[0])), "json")
+
+    def test_compressed_frames_round_trip(self):
+        frame = binary_codec().encode(MESSAGES[-1])
+        compressed = mqtt_codecs.compress_frame(frame)
+        self.assertTrue(mqtt_codecs.is_compressed(compressed))
+        self.assertEqual(mqtt_codecs.decompress_frame(compressed), frame)
+        with self.assertRaises(ValueError):
+            mqtt_codecs.decompress_frame(compressed[:-3])
+
+    def test_compressed_frame_that_is_too_large(self):
+        frame = b"[" + b" " * (mqtt_codecs.MAX_DECOMPRESSED_SIZE + 1) + b"]"
+        compressed = mqtt_codecs.compress_frame(frame, 9)
+        self.assertLess(len(compressed), 10000)
+        with self.assertRaisesRegex(ValueError, "larger than"):
+            mqtt_codecs.decompress_frame(compressed)
+        self.assertEqual(mqtt_codecs.decompress_frame(mqtt_codecs.compress_frame(frame[:100]), 100), frame[:100])
+        with self.assertRaises(ValueError):
+            mqtt_codecs.decompress_frame(mqtt_codecs.compress_frame(frame[:101]), 100)
+
+
+class CorruptBinaryFrameTest(unittest.TestCase):
+
+    def assert_decodes_or_value_error(self, codec, data):
+        try:
+            message = codec.decode(data)
+        except ValueError:
+            return
+        if isinstance(message, dict):
+            message = [message]
+        for message_dict in message:
+            self.assertIsInstance(message_dict, dict)
+            self.assertIsInstance(message_dict["type"], str)
+
+    def test_truncated_frames(self):
+        codec = binary_codec()
+        for message in MESSAGES:
+            frame = codec.encode(message)
+            for end in range(len(frame)):
+                with self.assertRaises(ValueError):
+                    codec.decode(frame[:end])
+
+    def test_random_corruption_only_raises_value_error(self):
+        codec = binary_codec()
+        rng = random.Random(5)
+        for message in MESSAGES:
+            frame = codec.encode(message)
+            for _ in range(300):
+                corrupt = bytearray(frame)
+                for _ in range(rng.randint(1, 4)):
+                    corrupt[rng.randrange(1, len(corrupt))] = rng.randrange(256)
+                self.assert_decodes_or_value_error(codec, bytes(corrupt))
+
+    def test_extra_keys_that_are_not_a_map(self):
+        # Method id 1, no payload, then the int 5 where the map of extra keys should be.
+        with self.assertRaises(ValueError):
+            binary_codec().decode(bytes([mqtt_codecs.BINARY_MAGIC, 0x00, 0x01, 0x02, 0xC0, 0x05]))
+
+    def test_method_name_that_is_not_a_str(self):
+        with self.assertRaises(ValueError):
+            binary_codec().decode(bytes([mqtt_codecs.BINARY_MAGIC, 0x00, 0x01, 0x00, 0x91, 0x01, 0xC0, 0x80]))
+
+    def test_list_used_as_a_map_key(self):
+        with self.assertRaises(ValueError):
+            binary_codec().decode(bytes([mqtt_codecs.BINARY_MAGIC, 0x00, 0x01, 0x02, 0xC0, 0x81, 0x90, 0x01]))
+
+    def test_single_message_frame_without_a_message(self):
+        with self.assertRaises(ValueError):
+            binary_codec().decode(bytes([mqtt_codecs.BINARY_MAGIC, 0x00, 0x00]))
+
+    def test_unknown_method_id(self):
+        codec = binary_codec()
+        frame = codec.encode({"type": "set_led"})
+        codec.set_local_methods(METHODS[:2])
+        with self.assertRaises(ValueError):
+            codec.decode(frame)
+
+    def test_lists_nested_too_deep(self):
+        with self.assertRaises(ValueError):
+            binary_codec().decode(bytes([mqtt_codecs.BINARY_MAGIC, 0x00, 0x01, 0x02]) + b"\x91" * 100000)
+        with self.assertRaises(ValueError):
+            mqtt_codecs.JsonCodec().decode(b"[" * 100000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,376 @@
+"""
+  Tests for the MqttClient in libs/mqtt_remote_method_calls.py, run over the loopback broker from the benchmarks.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+"""
+
+import concurrent.futures
+import threading
+import time
+import unittest
+
+import mqtt_codecs
+import mqtt_remote_method_calls as com
+from loopback_pair import RecordingDelegate, connect_pair, send_raw, wait_for
+
+
+class BatchingTest(unittest.TestCase):
+
+    def test_batch_size_alone_still_sends_a_lone_call(self):
+        delegate = RecordingDelegate()
+        broker, ev3_client, pc_client = connect_pair(pc_options={"batching": com.BatchOptions(size=20)},
+                                                     delegate=delegate)
+        self.addCleanup(ev3_client.close)
+        self.addCleanup(pc_client.close)
+        self.assertEqual(pc_client.batch_window, com.DEFAULT_BATCH_WINDOW)
+        pc_client.send_message("stop")
+        self.assertTrue(delegate.called.wait(10 * com.DEFAULT_BATCH_WINDOW))
+        self.assertEqual(delegate.calls, [("stop",)])
+
+    def test_full_batch_goes_out_as_one_publish(self):
+        delegate = RecordingDelegate()
+        broker, ev3_client, pc_client = connect_pair(pc_options={"batching": com.BatchOptions(10, 5)},
+                                                     delegate=delegate)
+        self.addCleanup(ev3_client.close)
+        self.addCleanup(pc_client.close)
+        publishes = broker.publish_count
+        for k in range(5):
+            pc_client.send_message("drive", [k, -k])
+        self.assertTrue(delegate.wait_for_calls(5))
+        self.assertEqual(delegate.calls, [("drive", k, -k) for k in range(5)])
+        self.assertEqual(broker.publish_count - publishes, 1)
+
+
+class CallingDelegate(RecordingDelegate):
+
+    def fail(self, reason):
+        raise ValueError(reason)
+
+    def make_lock(self):
+        return threading.Lock()  # Can't be sent back.
+
+
+class CallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = CallingDelegate()
+        self.broker, self.ev3_client, self.pc_client = connect_pair(delegate=self.delegate)
+        self.addCleanup(self.ev3_client.close)
+        self.addCleanup(self.pc_client.close)
+
+    def test_return_values(self):
+        futures = [self.pc_client.call("add", [k, 10]) for k in range(5)]
+        self.assertEqual([future.result(2) for future in futures], [10, 11, 12, 13, 14])
+        self.assertIsNone(self.pc_client.call("stop").result(2))
+        self.assertEqual(self.pc_client._pending_calls, {})
+
+    def test_remote_exceptions(self):
+        with self.assertRaisesRegex(com.RemoteCallError, "ValueError: no motor"):
+            self.pc_client.call("fail", ["no motor"]).result(2)
+        with self.assertRaises(com.RemoteCallError):
+            self.pc_client.call("add", [1]).result(2)  # Too few parameters.
+        with self.assertRaises(com.RemoteCallError):
+            self.pc_client.call("no_such_method").result(2)
+        with self.assertRaisesRegex(com.RemoteCallError, "could not be sent"):
+            self.pc_client.call("make_lock").result(2)
+        self.assertEqual(self.pc_client.call("add", [1, 2]).result(2), 3)  # Still answering.
+
+    def test_timeout(self):
+        self.ev3_client.close()
+        future = self.pc_client.call("add", [1, 2], timeout=0.05)
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            future.result(2)
+        self.assertEqual(self.pc_client._pending_calls, {})
+
+    def test_close_fails_the_waiting_calls(self):
+        self.ev3_client.close()
+        future = self.pc_client.call("add", [1, 2])
+        self.pc_client.close()
+        with self.assertRaises(com.RemoteCallError):
+            future.result(2)
+
+
+class HelloTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = RecordingDelegate()
+        self.broker, self.ev3_client, self.pc_client = connect_pair({"codec": "binary"}, {"codec": "binary"},
+                                                                    delegate=self.delegate)
+        self.addCleanup(self.ev3_client.close)
+        self.addCleanup(self.pc_client.close)
+
+    def test_both_ends_switch_to_binary(self):
+        self.assertEqual(self.pc_client.codec.name, "binary")
+        self.assertIn("drive", self.pc_client.codecs["binary"].remote_method_ids)
+        self.pc_client.send_message("drive", [600, -600])
+        self.assertTrue(self.delegate.wait_for_calls(1))
+        self.assertEqual(self.delegate.calls, [("drive", 600, -600)])
+
+    def test_malformed_hellos_are_dropped(self):
+        for payload in (None, [], ["binary", [], False], [["binary"], [1, 2], False], [["binary"], ["x"], 1],
+                        [["binary"], ["drive"], False, "extra"]):
+            send_raw(self.broker, self.ev3_client, {"type": com.HELLO_MESSAGE_TYPE, "payload": payload})
+        self.pc_client.send_message("stop")
+        self.assertTrue(self.delegate.wait_for_calls(1))
+        self.assertEqual(self.delegate.calls, [("stop",)])
+        self.assertEqual(self.ev3_client.codec.name, "binary")
+
+    def test_switching_back_to_json_forgets_the_method_ids(self):
+        send_raw(self.broker, self.pc_client, {"type": com.HELLO_MESSAGE_TYPE,
+                                               "payload": [["json"], ["drive", "stop"], False]})
+        self.assertTrue(wait_for(lambda: self.pc_client.codec.name == "json"))
+        self.assertEqual(self.pc_client.codecs["binary"].remote_method_ids, {})
+
+
+class RestartedDelegate(RecordingDelegate):
+    """Has one more method than before the restart, which moves the method ids of drive and stop."""
+
+    def beep(self):
+        self.calls.append(("beep",))
+
+
+class RestartTest(unittest.TestCase):
+
+    def test_binary_end_learns_the_method_ids_of_a_restarted_json_end(self):
+        broker, ev3_client, pc_client = connect_pair(pc_options={"codec": "binary"}, delegate=RecordingDelegate())
+        self.addCleanup(pc_client.close)
+        ev3_client.close()
+        delegate = RestartedDelegate()
+        ev3_client = com.MqttClient(delegate)
+        ev3_client.client = broker.create_client()
+        ev3_client.connect_to_pc("localhost")
+        self.addCleanup(ev3_client.close)
+        self.assertTrue(wait_for(lambda: "beep" in pc_client.remote_methods))
+        self.assertEqual(pc_client.codec.name, "binary")
+        pc_client.send_message("drive", [1, 2])
+        pc_client.send_message("beep")
+        self.assertTrue(delegate.wait_for_calls(2))
+        self.assertEqual(delegate.calls, [("drive", 1, 2), ("beep",)])
+
+    def test_reordering_end_keeps_the_messages_of_a_restarted_sender(self):
+        delegate = RecordingDelegate()
+        ev3_options = {"ordering": com.OrderingOptions(reorder_wait=0.05)}
+        for pc_options in ({"timing": True}, {"timing": True, "ordering": com.OrderingOptions(sequence_numbers=True)}):
+            del delegate.calls[:]
+            broker, ev3_client, pc_client = connect_pair(ev3_options, pc_options, delegate=delegate)
+            self.addCleanup(ev3_client.close)
+            for _ in range(2):
+                for k in range(5):
+                    pc_client.send_message("drive", [k, k])
+                pc_client.close()  # The PC program restarts.
+                pc_client = com.MqttClient(**pc_options)
+                pc_client.client = broker.create_client()
+                pc_client.connect_to_ev3("localhost")
+                self.addCleanup(pc_client.close)
+                self.assertTrue(wait_for(lambda: pc_client.online))
+            self.assertTrue(delegate.wait_for_calls(10))
+            self.assertEqual(delegate.calls, [("drive", k, k) for k in range(5)] * 2)
+
+
+class MalformedMessageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = RecordingDelegate()
+        self.broker, self.ev3_client, self.pc_client = connect_pair({"coalesce_methods": ["drive"]},
+                                                                    delegate=self.delegate)
+        self.addCleanup(self.ev3_client.close)
+        self.addCleanup(self.pc_client.close)
+
+    def assert_still_receiving(self):
+        count = len(self.delegate.calls)
+        self.pc_client.send_message("stop")
+        self.assertTrue(self.delegate.wait_for_calls(count + 1))
+        self.assertEqual(self.delegate.calls[-1], ("stop",))
+
+    def test_type_that_is_not_a_str(self):
+        for message_type in (["x"], {"a": 1}, 5, None):
+            send_raw(self.broker, self.ev3_client, {"type": message_type, "payload": []})
+        self.assert_still_receiving()
+
+    def test_bad_message_in_a_batch_does_not_stop_the_rest(self):
+        send_raw(self.broker, self.ev3_client, [{"type": "drive", "payload": [1, 2]}, {"type": ["x"]}, 7,
+                                                {"type": {"y": 1}, "id": "a:1"}, {"type": "stop"}])
+        self.assertTrue(self.delegate.wait_for_calls(2))
+        self.assertEqual(self.delegate.calls, [("drive", 1, 2), ("stop",)])
+
+    def test_priority_that_is_not_a_number(self):
+        self.ev3_client.preempt_priority = 5
+        for priority in ("high", [1], None, True, float("nan")):
+            send_raw(self.broker, self.ev3_client, {"type": "drive", "payload": [1, 2], "pri": priority}
+                     if not isinstance(priority, float) else
+                     b'{"type": "drive", "payload": [1, 2], "pri": NaN}')
+        self.assertTrue(self.delegate.wait_for_calls(5))
+        self.assertEqual(self.ev3_client.preemptions, 0)
+        self.assert_still_receiving()
+
+    def test_malformed_heartbeats_are_dropped(self):
+        for payload in (None, 5, [], [1.0], ["x", False], [True, False], [1.0, "no"], [1.0, False, 3]):
+            send_raw(self.broker, self.ev3_client, {"type": com.HEARTBEAT_MESSAGE_TYPE, "payload": payload})
+        send_raw(self.broker, self.pc_client, b'{"type": "__heartbeat__", "payload": [NaN, true]}')
+        self.assert_still_receiving()
+        self.assertEqual(self.pc_client.heartbeat_stats()["echoed"], 0)
+        self.pc_client.send_heartbeat()
+        self.assertTrue(wait_for(lambda: self.pc_client.heartbeat_stats()["echoed"] == 1))
+
+    def test_frames_that_are_not_messages(self):
+        bomb = mqtt_codecs.compress_frame(b"[" + b" " * mqtt_codecs.MAX_DECOMPRESSED_SIZE + b"]", 9)
+        for frame in (b"5", b"\"drive\"", b"[[1]]", b"{not json", bytes([0xB1, 0x00, 0x01, 0x00, 0x91, 0x01]),
+                      {"type": com.TIME_MESSAGE_TYPE, "id": "a:1", "payload": 5}, bomb):
+            send_raw(self.broker, self.ev3_client, frame)
+        self.assert_still_receiving()
+
+
+class OptionsTest(unittest.TestCase):
+
+    def test_defaults(self):
+        client = com.MqttClient()
+        self.addCleanup(client.close)
+        self.assertEqual((client.batch_window, client.batch_size), (None, None))
+        self.assertIsNone(client.compress_threshold)
+        self.assertEqual((client.rate_limits, client.method_priorities), ({}, {}))
+        self.assertEqual(client.reconnect_max_delay, 30.0)
+
+    def test_options_set_the_client_up(self):
+        limit = com.RateLimit(5)
+        client = com.MqttClient(batching=com.BatchOptions(size=5), compression=com.CompressionOptions(level=6),
+                                offline=com.OfflineOptions(ttl=2.0, reconnect_min_delay=0.1),
+                                rate_limits=com.RateLimitOptions({"drive": limit}),
+                                priorities=com.PriorityOptions({"stop": 10}, preempt_priority=10))
+        self.addCleanup(client.close)
+        self.assertEqual((client.batch_window, client.batch_size), (com.DEFAULT_BATCH_WINDOW, 5))
+        self.assertEqual((client.compress_threshold, client.compress_level), (512, 6))
+        self.assertEqual((client.offline_ttl, client.reconnect_min_delay), (2.0, 0.1))
+        self.assertIsNot(client.rate_limits["drive"], limit)  # Each client counts for itself.
+        self.assertEqual((client.method_priorities, client.preempt_priority), ({"stop": 10}, 10))
+
+
+class QueueExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = com.QueueExecutor("test")
+        self.addCleanup(self.executor.shutdown)
+        self.ran = []
+        self.release = threading.Event()
+
+    def invocation(self, method_name, args=(), coalesce=False, priority=0):
+        def method(*method_args):
+            if method_name == "block":
+                self.release.wait(2)
+            self.ran.append((method_name,) + tuple(method_args))
+        return com.Invocation(method_name, method, list(args), coalesce=coalesce, priority=priority)
+
+    def run_all(self, invocations):
+        self.executor.submit(self.invocation("block"))
+        self.assertTrue(wait_for(lambda: self.executor.running_invocations))
+        for invocation in invocations:
+            self.assertTrue(self.executor.submit(invocation))
+        self.release.set()
+        self.assertTrue(wait_for(lambda: self.executor.stats()["completed"] == self.executor.stats()["submitted"]))
+        return self.ran[1:]
+
+    def test_coalesced_call_goes_to_the_back(self):
+        ran = self.run_all([self.invocation("drive", [1], coalesce=True), self.invocation("stop"),
+                            self.invocation("drive", [2], coalesce=True)])
+        self.assertEqual(ran, [("stop",), ("drive", 2)])
+        self.assertEqual(self.executor.stats()["coalesced"], 1)
+
+    def test_higher_priority_runs_first(self):
+        ran = self.run_all([self.invocation("drive", [1]), self.invocation("drive", [2]),
+                            self.invocation("stop", priority=5)])
+        self.assertEqual(ran, [("stop",), ("drive", 1), ("drive", 2)])
+
+    def test_full_queue_rejects(self):
+        self.executor.max_queue = 1
+        self.executor.submit(self.invocation("block"))
+        self.assertTrue(wait_for(lambda: self.executor.running_invocations))
+        self.assertTrue(self.executor.submit(self.invocation("drive", [1], coalesce=True)))
+        self.assertTrue(self.executor.submit(self.invocation("drive", [2], coalesce=True)))
+        self.assertFalse(self.executor.submit(self.invocation("stop")))
+        self.release.set()
+        self.assertTrue(wait_for(lambda: len(self.ran) == 2))
+        self.assertEqual(self.ran, [("block",), ("drive", 2)])
+
+
+class ReorderBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.released = []
+        self.unblock = threading.Event()
+        self.buffer = com.ReorderBuffer(0.05, self.release)
+        self.addCleanup(self.unblock.set)
+
+    def release(self, message):
+        if message == "slow":
+            self.unblock.wait(2)
+        self.released.append(message)
+
+    def test_puts_messages_back_in_order(self):
+        for sequence in (10, 12, 11, 11, 13):
+            self.buffer.add(sequence, sequence)
+        self.assertEqual(self.released, [10, 11, 12, 13])
+        stats = self.buffer.stats()
+        self.assertEqual((stats["in_order"], stats["reordered"], stats["duplicates"]), (3, 1, 1))
+
+    def test_slow_release_on_the_timer_does_not_hold_up_add(self):
+        self.buffer.add(1, "first")
+        self.buffer.add(3, "slow")  # Released by the timer once it gives up on 2, and then blocks.
+        self.assertTrue(wait_for(lambda: self.buffer.draining and not self.buffer.ready))
+        started = time.monotonic()
+        self.buffer.add(4, "next")
+        self.buffer.add(2, "late")
+        self.assertEqual(self.buffer.stats()["late"], 1)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.unblock.set()
+        self.assertTrue(wait_for(lambda: len(self.released) == 3))
+        self.assertEqual(self.released, ["first", "slow", "next"])
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def connect(self, method_limits):
+        delegate = RecordingDelegate()
+        broker, ev3_client, pc_client = connect_pair(
+            pc_options={"rate_limits": com.RateLimitOptions(method_limits)}, delegate=delegate)
+        self.addCleanup(ev3_client.close)
+        self.addCleanup(pc_client.close)
+        return delegate, pc_client
+
+    def test_unlimited_stop_is_not_overtaken_by_a_held_drive(self):
+        delegate, pc_client = self.connect({"drive": com.RateLimit(2, policy="coalesce")})
+        pc_client.send_message("drive", [1, 1])
+        pc_client.send_message("drive", [2, 2])  # Held for a token.
+        pc_client.send_message("stop")
+        time.sleep(0.7)  # Long enough for the token the held drive was waiting for.
+        self.assertTrue(delegate.wait_for_calls(3))
+        self.assertEqual(delegate.calls, [("drive", 1, 1), ("drive", 2, 2), ("stop",)])
+        self.assertEqual(pc_client.rate_limit_stats()["methods"]["drive"]["waiting"], 0)
+
+    def test_held_messages_of_two_limits_keep_their_order(self):
+        delegate, pc_client = self.connect({"drive": com.RateLimit(2, policy="coalesce"),
+                                           "stop": com.RateLimit(50, policy="coalesce")})
+        pc_client.send_message("stop")
+        pc_client.send_message("drive", [1, 1])
+        pc_client.send_message("drive", [2, 2])  # Held for half a second.
+        pc_client.send_message("stop")  # Held for 20 ms, it must not go out before drive [2, 2].
+        self.assertTrue(delegate.wait_for_calls(4))
+        time.sleep(0.7)
+        self.assertEqual(delegate.calls, [("stop",), ("drive", 1, 1), ("drive", 2, 2), ("stop",)])
+
+    def test_coalesce_keeps_only_the_newest_held_value(self):
+        delegate, pc_client = self.connect({"drive": com.RateLimit(5, policy="coalesce")})
+        for k in range(5):
+            pc_client.send_message("drive", [k, k])
+        self.assertTrue(delegate.wait_for_calls(2))
+        time.sleep(0.4)
+        self.assertEqual(delegate.calls, [("drive", 0, 0), ("drive", 4, 4)])
+        self.assertEqual(pc_client.rate_limit_stats()["methods"]["drive"]["coalesced"], 3)
+
+    def test_drop_fails_the_call(self):
+        delegate, pc_client = self.connect({"add": com.RateLimit(1, policy="drop")})
+        self.assertEqual(pc_client.call("add", [1, 2]).result(2), 3)
+        with self.assertRaises(com.RateLimitError):
+            pc_client.call("add", [3, 4]).result(2)
+
+
+if __name__ == "__main__":
+    unittest.main()
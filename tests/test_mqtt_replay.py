@@ -0,0 +1,62 @@
+"""
+  Tests for recording and replaying MqttClient traffic (libs/mqtt_replay.py).
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mqtt_replay
+from loopback_pair import RecordingDelegate, connect_pair
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def record(self, codec):
+        """Records 10 drive calls from the PC to the EV3, at both ends, and returns the two recording paths."""
+        ev3_path = os.path.join(self.folder, "ev3.mqrl")
+        pc_path = os.path.join(self.folder, "pc.mqrl")
+        delegate = RecordingDelegate()
+        broker, ev3_client, pc_client = connect_pair({"codec": codec, "record_path": ev3_path},
+                                                     {"codec": codec, "record_path": pc_path}, delegate=delegate)
+        self.assertEqual(pc_client.codec.name, codec)
+        for k in range(10):
+            pc_client.send_message("drive", [k, -k])
+        self.assertTrue(delegate.wait_for_calls(10))
+        pc_client.close()
+        ev3_client.close()
+        return ev3_path, pc_path
+
+    def assert_replays(self, path, direction):
+        delegate = RecordingDelegate()
+        result = mqtt_replay.replay(path, delegate, speed=None, direction=direction)
+        self.assertEqual(delegate.calls, [("drive", k, -k) for k in range(10)])
+        self.assertEqual(result["methods"]["drive"]["execution"]["count"], 10)
+
+    def test_replay_json_recording(self):
+        ev3_path, pc_path = self.record("json")
+        self.assert_replays(ev3_path, "received")
+        self.assert_replays(pc_path, "sent")
+
+    def test_replay_binary_recording(self):
+        ev3_path, pc_path = self.record("binary")
+        self.assert_replays(ev3_path, "received")
+        self.assert_replays(pc_path, "sent")
+
+    def test_read_recording_skips_a_record_cut_short(self):
+        ev3_path, _ = self.record("json")
+        records = list(mqtt_replay.read_recording(ev3_path))
+        with open(ev3_path, "r+b") as file:
+            file.truncate(os.path.getsize(ev3_path) - 3)
+        self.assertEqual(list(mqtt_replay.read_recording(ev3_path)), records[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+"""
+  Tests for libs/robot_controller.py, against the pretend sysfs tree from the benchmarks.
+
+  Run with:  PYTHONPATH=libs:benchmarks python3 -m unittest discover tests
+  (needs python-ev3dev installed on the PC, pip install python-ev3dev)
+"""
+
+import threading
+import time
+import unittest
+
+import ev3dev.ev3 as ev3
+import mqtt_remote_method_calls as com
+import robot_controller as robo
+from fake_sysfs import FakeSysfs
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class DeviceRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = FakeSysfs()
+        self.sysfs.__enter__()
+        self.addCleanup(self.sysfs.__exit__, None, None, None)
+        self.devices = robo.DeviceRegistry()
+
+    def test_keeps_the_device(self):
+        motor = self.devices.get(ev3.LargeMotor, ev3.OUTPUT_B)
+        self.assertIs(self.devices.get(ev3.LargeMotor, ev3.OUTPUT_B), motor)
+        self.assertIsInstance(motor, ev3.LargeMotor)
+        self.assertEqual(motor.address, ev3.OUTPUT_B)
+        self.assertEqual(self.devices.scans, 1)
+        self.devices.rescan(ev3.OUTPUT_B)
+        self.assertIsNot(self.devices.get(ev3.LargeMotor, ev3.OUTPUT_B), motor)
+
+    def test_mqtt_client_does_not_look_for_the_devices(self):
+        robot = robo.Snatch3r(self.devices)
+        client = com.MqttClient(robot)
+        self.addCleanup(client.close)
+        self.assertIn("drive_inches", client.dispatch_table.methods)
+        self.assertNotIn("left_motor", client.dispatch_table.methods)
+        self.assertEqual((self.devices.devices, self.devices.scans), ({}, 0))
+
+    def test_threads_sharing_a_motor_read_whole_values(self):
+        motor = self.devices.get(ev3.LargeMotor, ev3.OUTPUT_B)
+        motor.position = 1234
+        errors = []
+        values = set()
+
+        def read_position():
+            try:
+                for _ in range(3000):
+                    values.add(motor.position)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=read_position) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(values, {1234})
+
+
+class PretendMotor(object):
+    """Stands in for an ev3.Motor: running until stop is called, and broken (reading it raises) if told to."""
+
+    def __init__(self):
+        self.running = True
+        self.broken = False
+        self.connected = True
+        self._position = 0
+
+    @property
+    def state(self):
+        if self.broken:
+            raise OSError("No such device")
+        return [ev3.Motor.STATE_RUNNING] if self.running else []
+
+    @property
+    def position(self):
+        if self.broken:
+            raise OSError("No such device")
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = position
+
+    def stop(self, stop_action=None):
+        self.running = False
+
+    def run_to_abs_pos(self, position_sp, speed_sp):
+        if self.broken:
+            raise OSError("No such device")
+        self.position = position_sp  # Gets there right away.
+
+
+class MotionMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = robo.MotionMonitor(interval=0.001)
+
+    def test_finishes_when_the_motors_stop(self):
+        motor = PretendMotor()
+        handle = self.monitor.watch(robo.MotionHandle("drive", [motor], self.monitor))
+        self.assertFalse(handle.wait(0.02))
+        motor.running = False
+        self.assertTrue(handle.wait(1))
+        self.assertEqual(handle.outcome, "done")
+
+    def test_motor_that_cannot_be_read_fails_only_its_motion(self):
+        broken_motor, motor = PretendMotor(), PretendMotor()
+        broken = self.monitor.watch(robo.MotionHandle("arm", [broken_motor], self.monitor))
+        handle = self.monitor.watch(robo.MotionHandle("drive", [motor], self.monitor))
+        broken_motor.broken = True
+        self.assertTrue(broken.wait(1))
+        self.assertEqual(broken.outcome, "failed")
+        self.assertIsInstance(broken.error, OSError)
+        motor.running = False
+        self.assertTrue(handle.wait(1))
+        self.assertEqual(handle.outcome, "done")
+
+
+class SlowMotor(PretendMotor):
+    """Never gets to the position it is sent to, so a segment keeps running until it is stopped."""
+
+    def run_to_abs_pos(self, position_sp, speed_sp):
+        self.running = True
+
+
+class PretendRobot(object):
+
+    stop = robo.Snatch3r.stop
+
+    def __init__(self, motor_class=PretendMotor):
+        self.left_motor = motor_class()
+        self.right_motor = motor_class()
+        self.motion_monitor = robo.MotionMonitor(interval=0.001)
+
+
+class MotionQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.robot = PretendRobot()
+        self.queue = robo.MotionQueue(self.robot)
+
+    def test_drives_the_segments(self):
+        self.robot.left_motor.running = self.robot.right_motor.running = False
+        handle = self.queue.extend([robo.straight(2), robo.turn(90)])
+        self.assertTrue(handle.wait(1))
+        self.assertEqual(handle.outcome, "done")
+        self.assertEqual(self.queue.stats()["segments"], 2)
+        self.assertEqual(self.robot.left_motor.position, 2 * robo.DEGREES_PER_INCH - 450)
+
+    def test_motor_that_cannot_be_driven_fails_the_run(self):
+        self.robot.right_motor.broken = True
+        handle = self.queue.extend([robo.straight(2), robo.straight(3)])
+        self.assertTrue(handle.wait(1))
+        self.assertEqual(handle.outcome, "failed")
+        self.assertIsInstance(handle.error, OSError)
+        self.assertFalse(self.robot.left_motor.running)  # Stopped.
+        self.assertTrue(self.queue.wait(1))
+        self.robot.right_motor.broken = False
+        self.robot.left_motor.running = self.robot.right_motor.running = False
+        self.assertEqual(self.queue.extend([robo.straight(1)]).wait(1), True)  # A new run starts.
+
+
+    def test_stopping_the_robot_drops_the_queued_segments(self):
+        robot = PretendRobot(SlowMotor)
+        queue = robo.MotionQueue(robot)
+        handle = queue.extend([robo.straight(2)] * 5)
+        self.assertTrue(wait_for(lambda: queue.stats()["segments"] == 1))
+        robot.stop()
+        self.assertTrue(handle.wait(1))
+        self.assertEqual(handle.outcome, "cancelled")
+        self.assertTrue(queue.wait(1))
+        self.assertTrue(wait_for(lambda: queue.thread is None))
+        self.assertEqual(len(queue.segments), 0)
+
+
+class OdometryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.robot = PretendRobot()
+        self.odometry = robo.Odometry(self.robot, rate=200)
+        self.addCleanup(self.odometry.stop)
+
+    def test_unreadable_encoders_are_skipped(self):
+        self.odometry.start()
+        self.robot.left_motor.broken = True
+        self.assertTrue(wait_for(lambda: self.odometry.errors >= 3))
+        self.assertIsInstance(self.odometry.last_error, OSError)
+        self.robot.left_motor.broken = False
+        self.robot.left_motor.position = self.robot.right_motor.position = 10 * robo.DEGREES_PER_INCH
+        self.assertTrue(wait_for(lambda: self.odometry.pose().x > 9.99))
+        self.assertAlmostEqual(self.odometry.pose().y, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()